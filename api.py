@@ -1,13 +1,74 @@
 #!/usr/bin/python3
 from . import operations
-from .minutes_parse_utils import get_members_and_keyholders, ATTENDEE_TYPES
+from . import snapshot
+from .minutes_parse_utils import get_members_mtime, ATTENDEE_TYPES
+from .identity import IdentityIndex, get_identity_index
+from .trends import compute_trends
+from .cohorts import compute_cohorts
+from .directory import AttendeeDirectory
+from .coattendance import compute_coattendance
+from .streaks import compute_streaks, compute_attendee_streaks
+from .organizations import get_organization
 import datetime
 import json
+from collections import namedtuple
 from enum import Enum
 import re
 import os
 import json
 
+# Internal record types.  Records are kept as these lightweight tuples/slotted objects
+# while computing, and are only converted to JSON-ready dictionaries when returned.
+
+# A meeting in an attendee's record, and whether they attended it
+Meeting = namedtuple("Meeting", ["date", "attended"])
+# A meeting in an attendee's record, labelled with the term it took place in
+TermMeeting = namedtuple("TermMeeting", ["date", "attended", "term"])
+
+class AttendeeSummary:
+	"""
+	Summary of a single attendee's attendance, used for roster-wide lists
+	"""
+	__slots__ = ("num_attended", "active", "percent", "attendee_type", "last_attended")
+
+	def __init__(self, num_attended=0, active=False, percent=0.0, attendee_type="guest", last_attended=None):
+		self.num_attended = num_attended
+		self.active = active
+		self.percent = percent
+		self.attendee_type = attendee_type
+		self.last_attended = last_attended
+
+	def to_json(self, attendee):
+		"""
+		Convert the summary to a JSON-ready dictionary
+
+		attendee: The name/kerberos of the attendee this summary is for
+		"""
+		return {
+			"attendee": attendee,
+			"num_attended": self.num_attended,
+			"active": self.active,
+			"percent": self.percent,
+			"attendee_type": self.attendee_type,
+			"last_attended": str(self.last_attended) if self.last_attended is not None else None
+		}
+
+def get_data_version():
+	"""
+	Get a string identifying the current version of the attendance data, which changes
+	whenever the attendance data is written (including when past meetings are rewritten) or
+	the members file is modified
+
+	returns: A string combining the version of the database (see operations.get_data_version)
+			 and the members file mtime, prefixed by the name of the organization being worked
+			 on, if any
+	"""
+	version = operations.get_data_version() + "@" + str(get_members_mtime())
+	organization = get_organization()
+	if organization is not None:
+		version = organization.name + ":" + version
+	return version
+
 def get_academic_year(meeting_date):
 	if meeting_date.month >= 6:
 		return (meeting_date.year, meeting_date.year+1)
@@ -19,14 +80,14 @@ def split_by_academic_year(attendance):
 	year = []
 	last_academic_year = None
 	
-	for meeting_date, attended in attendance:
-		this_academic_year = get_academic_year(meeting_date)
+	for record in attendance:
+		this_academic_year = get_academic_year(record.date)
 		if this_academic_year != last_academic_year:
 			if year:
 				years[last_academic_year] = year
-			year = [(meeting_date, attended)]
+			year = [record]
 		else:
-			year.append((meeting_date, attended))
+			year.append(record)
 
 		last_academic_year = this_academic_year
 
@@ -88,40 +149,33 @@ def add_semester_markers(records, year):
 	
 	return records
 
-def get_attendance_information(attendee, mems=None):
+def get_index(mems=None):
+	"""
+	Get the identity index, built from mems if it is given instead of the members file
+
+	mems: Optional (members, keyholders, aliases) tuple
+	"""
 	if mems is None:
-		members, keyholders, aliases = get_members_and_keyholders()
+		return get_identity_index()
 	else:
-		members, keyholders, aliases = mems
-	attendee_names = [attendee]
-	if attendee in aliases:
-		attendee_names.append(aliases[attendee])
-	elif attendee in aliases.values():
-		attendee_names.extend(alias for alias in aliases if aliases[alias] == attendee)
+		return IdentityIndex(*mems)
+
+def get_attendance_information(attendee, mems=None):
+	index = get_index(mems)
 	
 	options = {
-		"attendee": attendee_names
+		"attendee": index.get_names(attendee)
 	}
 
-	clauses = [
-		"ORDER BY meeting_date ASC"
-	]
-
-	meeting_dates = operations.get_meeting_dates()
-	attendance_records = operations.get_attendance_records(clauses=clauses, options=options)
+	meeting_dates = snapshot.get_meeting_dates()
+	attendance_records = operations.get_attendance_records(fields=["meeting_date"], options=options)
+	# An attendee may be recorded under several of their names at the same meeting
+	attended_dates = { record["meeting_date"] for record in attendance_records }
 
-	attendance = []
-
-	i = 0
-	for meeting_date in meeting_dates:
-		if i < len(attendance_records) and meeting_date == attendance_records[i]['meeting_date']:
-			attendance.append((meeting_date, True))
-			i += 1
-		else:
-			attendance.append((meeting_date, False))	
+	attendance = [Meeting(meeting_date, meeting_date in attended_dates) for meeting_date in meeting_dates]
 
 	try:
-		last_attended = next(md for md, attended in attendance[::-1] if attended)
+		last_attended = next(record.date for record in reversed(attendance) if record.attended)
 	except StopIteration:
 		last_attended = None
 	
@@ -129,7 +183,7 @@ def get_attendance_information(attendee, mems=None):
 	years = sorted(list(records_by_year.keys()))
 
 	for year in years:
-		if any(attended for _, attended in records_by_year[year]):
+		if any(record.attended for record in records_by_year[year]):
 			break
 		else:
 			del records_by_year[year]
@@ -141,46 +195,71 @@ def get_attendance_information(attendee, mems=None):
 		last_record_index = len(this_year) - next(i for i, rec in enumerate(this_year[::-1]) if not isinstance(rec, Marker)) - 1
 		first_record_index = last_record_index - next(i for i, rec in enumerate(this_year[:last_record_index][::-1]) if isinstance(rec, Marker)) + 1 - 1 
 		try:
-			first_attended = next(md for md, attended in this_year[first_record_index:last_record_index+1] if attended)
+			first_attended = next(rec.date for rec in this_year[first_record_index:last_record_index+1] if isinstance(rec, Meeting) and rec.attended)
 		except StopIteration:
 			first_attended = None
 	else:
 		first_attended = None
 
+	# Key records by academic year string, as they are returned
+	records = { str(year[0]) + "-" + str(year[1]): records_by_year[year] for year in records_by_year }
+
+	return {
+		"record": records_to_json(records),
+		"summary": attendance_summary(records),
+		"by_month": months_to_json(split_by_month(records)),
+		"active": is_active(records),
+		"total_attended": get_num_meetings_attended(records),
+		"attendee_type": index.get_attendee_type(attendee),
+		"last_attended": last_attended,
+		"first_attended": first_attended,
+		"streaks": compute_attendee_streaks(meeting_dates, attended_dates)
+	}
+
+term_names = ["SUMMER", "FALL", "IAP", "SPRING"]
 
+def records_to_json(records):
+	"""
+	Convert an attendee's record, a mapping of academic years to lists of meetings
+	and markers, to JSON-ready dictionaries
+	"""
 	json_records = {}
-	for year in records_by_year:
-		year_string = str(year[0]) + "-" + str(year[1])
-		json_records[year_string] = []
-		for record in records_by_year[year]:
+	for year in records:
+		json_records[year] = []
+		for record in records[year]:
 			if isinstance(record, Marker):
-				json_records[year_string].append({
+				json_records[year].append({
 					'type': 'marker',
 					'name': record.name
 				})
 			else:
-				json_records[year_string].append({
+				json_records[year].append({
 					'type': 'meeting',
-					'date': str(record[0]),
-					'attended': record[1]
+					'date': str(record.date),
+					'attended': record.attended
 				})
+	return json_records
 
+def months_to_json(records_by_month):
+	"""
+	Convert the result of split_by_month to JSON-ready dictionaries
+	"""
 	return {
-		"record": json_records,
-		"summary": attendance_summary(json_records),
-		"by_month": split_by_month(json_records),
-		"active": is_active(json_records),
-		"total_attended": get_num_meetings_attended(json_records),
-		"attendee_type": get_attendee_type(attendee, mems=mems),
-		"last_attended": last_attended,
-		"first_attended": first_attended
+		year: {
+			month: [{
+				'type': 'meeting',
+				'date': str(record.date),
+				'attended': record.attended,
+				'term': record.term
+			} for record in records_by_month[year][month]]
+			for month in records_by_month[year]
+		}
+		for year in records_by_month
 	}
 
-term_names = ["SUMMER", "FALL", "IAP", "SPRING"]
-
 def attendance_percent(attendance_list):
 	total_meetings = len(attendance_list)
-	attended = sum(record["attended"] for record in attendance_list)
+	attended = sum(record.attended for record in attendance_list)
 	if total_meetings != 0:
 		percent = str(round((attended*100)/total_meetings, 1)) + "%"
 	else:
@@ -203,12 +282,12 @@ def attendance_summary(attendance_information):
 	summary = {}
 	for year in attendance_information:
 		records = attendance_information[year]
-		whole_year = [record for record in records if record["type"] == "meeting"]
+		whole_year = [record for record in records if isinstance(record, Meeting)]
 		terms = { 'all': whole_year }
 		current_term = None
 		for record in records:
-			if record["type"] == "marker":
-				name = record["name"].split("_")
+			if isinstance(record, Marker):
+				name = record.name.split("_")
 				if current_term is None and name[1] == "START":
 					current_term = name[0]
 					terms[current_term] = []
@@ -227,50 +306,34 @@ def split_by_month(attendance_record):
 	for year in attendance_record:
 		months = {}
 		for record in attendance_record[year]:
-			if record["type"] == "marker":
-				sem, marker_type = record["name"].split("_")
+			if isinstance(record, Marker):
+				sem, marker_type = record.name.split("_")
 				if marker_type == "END":
 					term = "NONE"
 				else:
 					term = sem
 			else:
-				month = datetime.datetime.strptime(record["date"], "%Y-%m-%d").date().month
+				month = record.date.month
 				if month in months:
-					months[month].append({**record, "term": term})
+					months[month].append(TermMeeting(record.date, record.attended, term))
 				else:
-					months[month] = [{**record, "term": term}]
+					months[month] = [TermMeeting(record.date, record.attended, term)]
 		years[year] = months
 	return years
 
 
 def is_active(attendance_record):
-	all_attendance = [record for year in attendance_record for record in attendance_record[year] if record["type"] == "meeting"]
 	active_cutoff = datetime.date.today() - datetime.timedelta(days=30)
-	attendance_after_cutoff = [record for record in all_attendance if datetime.datetime.strptime(record["date"], "%Y-%m-%d").date() >= active_cutoff and record["attended"]]
-	if len(attendance_after_cutoff):
-		return True
-	else:
-		return False
+	return any(record.attended and record.date >= active_cutoff \
+				for year in attendance_record for record in attendance_record[year] \
+				if isinstance(record, Meeting))
 
 def get_num_meetings_attended(attendance_record):
-	all_attendance = [record for year in attendance_record for record in attendance_record[year] if record["type"] == "meeting" and record["attended"]]
-	return len(all_attendance)
+	return sum(1 for year in attendance_record for record in attendance_record[year] \
+				if isinstance(record, Meeting) and record.attended)
 
 def get_attendee_type(attendee, mems=None):
-	if mems is None:
-		members, keyholders, aliases = get_members_and_keyholders()
-	else:
-		members, keyholders, aliases = mems
-	if attendee in keyholders:
-		return "keyholder"
-	elif attendee in aliases:
-		if aliases[attendee] in keyholders:
-			return "keyholder"
-		elif aliases[attendee] in members:
-			return "member"
-	elif attendee in members:
-		return "member"
-	return "guest"
+	return get_index(mems).get_attendee_type(attendee)
 
 def get_relevant_semester_range():
 	today = datetime.date.today()
@@ -297,75 +360,80 @@ def reverse_dict(d, unique=False):
 			new_dict[d[key]] = [key]
 	return new_dict
 
-def get_attendance_records_list():
-	members, keyholders, aliases = get_members_and_keyholders()
-	r_alias = reverse_dict(aliases)
-	alias_groups = [tuple([key, *r_alias[key]]) for key in r_alias]
-	(date_start, date_end), label = get_relevant_semester_range()
-	
-	options = {
-		"start_date": date_start,
-		"end_date": date_end
-	}
+# Orders supported by get_attendance_records_list, mapped to the order of the roster query.  The
+# percent of meetings attended shares its denominator across the semester, so it sorts as the
+# number attended does.
+RECORDS_LIST_ORDERS = {
+	"num_attended": "num_attended",
+	"percent": "num_attended",
+	"last_attended": "last_attended",
+	"attendee_type": "attendee_type",
+	"attendee": "attendee"
+}
+
+# Fields of the attendee records in the roster list
+RECORDS_LIST_FIELDS = ["attendee", "num_attended", "active", "percent", "attendee_type", "last_attended"]
+
+def get_attendance_records_page(order="num_attended", limit=None, offset=0, fields=None):
+	"""
+	Get a page of the attendance of every attendee this semester.  The attendees are sorted and
+	the page is cut in the database, so the first page is as fast as the roster is long.
+
+	order: "num_attended" or "percent" to list the most frequent attendees first,
+		   "last_attended" to list the most recent attendees first, "attendee_type" to list
+		   guests, keyholders and then members, or "attendee" to list the attendees by name
+	limit: Number of attendees to return, or None for all
+	offset: Number of attendees to skip, in order
+	fields: List of the fields (from RECORDS_LIST_FIELDS) to include in each record, or None
+			for all
+
+	returns: A list of attendee records, the number of attendees on all pages, and the label
+			 of the semester
+	"""
+	if order not in RECORDS_LIST_ORDERS:
+		raise ValueError("Unknown order " + str(order))
+	if fields is not None and any(field not in RECORDS_LIST_FIELDS for field in fields):
+		raise ValueError("Unknown fields " + ", ".join(field for field in fields if field not in RECORDS_LIST_FIELDS))
+	if limit is not None and limit < 0 or offset < 0:
+		raise ValueError("Limit and offset cannot be negative")
 
-	attendance_records = operations.get_attendance_records(options=options)
-	meeting_dates = operations.get_meeting_dates(options=options)
-	num_meeting_dates = len(meeting_dates)
-	
+	(date_start, date_end), label = get_relevant_semester_range()
+	num_meeting_dates = len(snapshot.get_meeting_dates(date_start, date_end))
 	active_cutoff = datetime.date.today() - datetime.timedelta(days=30)
-	last_month_records = operations.get_attendance_records(options={"start_date": active_cutoff})
-
-	info = {}
-	for record in attendance_records:
-		if record["attendee"] in info:
-			info[record["attendee"]]["num_attended"] += 1
-		else:
-			info[record["attendee"]] = {"num_attended": 1}
-
-	for record in last_month_records:
-		if record["attendee"] in info:
-			info[record["attendee"]]["active"] = True
-		else:
-			info[record["attendee"]] = {"num_attended": 0, "active": True}
-	
-	for group in alias_groups:
-		record = {"num_attended": 0, "active": False}
-		for attendee in group:
-			if attendee in info:
-				record["num_attended"] += info[attendee]["num_attended"]
-				record["active"] = record["active"] or ("active" in info[attendee] and info[attendee]["active"])
 
+	# Attendees are classified and their names folded together by joining the mirror of the
+	# members file, which ingests (and the server, when the members file changes) keep current
+	rows = operations.get_roster_list(date_start, date_end, active_cutoff, RECORDS_LIST_ORDERS[order], limit, offset)
+	if limit is None and (rows or not offset):
+		# Every attendee from the offset on was fetched
+		total = offset + len(rows)
+	else:
+		total = operations.get_roster_size(date_start, date_end, active_cutoff)
 
-		for attendee in group:
-			info[attendee] = record
-	
-	for attendee in info:
+	records = []
+	for row in rows:
+		summary = AttendeeSummary(num_attended=row["num_attended"], attendee_type=row["attendee_type"], \
+									last_attended=row["last_attended"])
 		if num_meeting_dates:
-			info[attendee]["percent"] = round(info[attendee]["num_attended"]*100/num_meeting_dates,1) 
+			summary.percent = round(summary.num_attended*100/num_meeting_dates,1)
 		else:
-			info[attendee]["percent"] = "N/A"
-
-		if "active" not in info[attendee]:
-			info[attendee]["active"] = False
-		
-		if attendee in keyholders or attendee in aliases and aliases[attendee] in keyholders:
-			info[attendee]["attendee_type"] = "keyholder"
-		elif attendee in members or attendee in aliases and aliases[attendee] in members:
-			info[attendee]["attendee_type"] = "member"
-		else:
-			info[attendee]["attendee_type"] = "guest"
-
-	for member in members - keyholders:
-		if member not in info:
-			info[member] = {"active": False, "percent": 0.0, "attendee_type": "member", "num_attended": 0}
-	
-	for keyholder in keyholders:
-		if keyholder not in info:
-			info[keyholder] = {"active": False, "percent": 0.0, "attendee_type": "keyholder", "num_attended": 0}
-
-	records = [{'attendee': attendee, **info[attendee]} for attendee in info]
-	records.sort(key=lambda r: (r["attendee_type"], r["attendee"]))
-	records.sort(key=lambda r: r["num_attended"], reverse=True)
+			summary.percent = "N/A"
+		summary.active = summary.last_attended is not None and summary.last_attended >= active_cutoff
+		record = summary.to_json(row["attendee"])
+		if fields is not None:
+			record = { field: record[field] for field in fields }
+		records.append(record)
+	return records, total, label
+
+def get_attendance_records_list(order="num_attended"):
+	"""
+	Get the attendance of every attendee this semester
+
+	order: One of RECORDS_LIST_ORDERS, as for get_attendance_records_page
+
+	returns: A list of attendee records, and the label of the semester
+	"""
+	records, total, label = get_attendance_records_page(order)
 	return records, label
 
 def reverse_dict_of_dicts(d):
@@ -402,3 +470,199 @@ def get_attendance_stats():
 	stats_per_attendee_type = reverse_dict_of_dicts(stats_per_date)
 	
 	return stats_per_date, stats_per_attendee_type
+
+# Co-attendance counts computed for each (data version, start date, end date)
+coattendance_cache = {}
+
+def get_coattendance_matrix(start_date=None, end_date=None):
+	"""
+	Get the co-attendance counts between canonical attendees over a date range.  Results are
+	cached until the data changes.
+
+	start_date: The first meeting date to include, or None for no limit
+	end_date: The last meeting date to include, or None for no limit
+
+	returns: A coattendance.CoAttendance
+	"""
+	key = (get_data_version(), start_date, end_date)
+	if key not in coattendance_cache:
+		options = {}
+		if start_date is not None:
+			options["start_date"] = start_date
+		if end_date is not None:
+			options["end_date"] = end_date
+		rows = operations.get_attendance_records(fields=["attendee", "meeting_date"], options=options or None)
+		records = ((row["attendee"], row["meeting_date"]) for row in rows)
+
+		# Only keep counts for the current data version
+		if any(cached_key[0] != key[0] for cached_key in coattendance_cache):
+			coattendance_cache.clear()
+		coattendance_cache[key] = compute_coattendance(records, get_identity_index().get_canonical)
+	return coattendance_cache[key]
+
+def get_coattendance(attendee, k=10, start_date=None, end_date=None):
+	"""
+	Get who an attendee attends meetings with: the attendees they attended the most meetings
+	with, and the attendees whose attendance is most similar to theirs
+
+	attendee: The name/kerberos of the attendee
+	k: Number of attendees in each list
+	start_date: The first meeting date to include, or None for no limit
+	end_date: The last meeting date to include, or None for no limit
+
+	returns: A JSON-ready dictionary containing the canonical name, number of meetings attended,
+			 top co-attendees (with the number of meetings attended together) and most similar
+			 attendees (with the cosine similarity of their attendance)
+	"""
+	if k < 0:
+		raise ValueError("k cannot be negative")
+
+	canonical = get_identity_index().get_canonical(attendee)
+	matrix = get_coattendance_matrix(start_date, end_date)
+	return {
+		"attendee": canonical,
+		"num_attended": matrix.get_num_attended(canonical),
+		"coattendees": [{ "attendee": other, "count": count } for other, count in matrix.get_top_coattendees(canonical, k)],
+		"similar": [{ "attendee": other, "similarity": similarity } for other, similarity in matrix.get_most_similar(canonical, k)]
+	}
+
+def get_term(meeting_date):
+	"""
+	Get the term a meeting took place in
+
+	returns: A tuple (first year of the academic year, term name), where term name is one of
+			 SUMMER, FALL, IAP or SPRING, or None if the meeting was between terms
+	"""
+	year = get_academic_year(meeting_date)
+	semester_bounds = get_semester_bounds(year)
+	for term in term_names:
+		if semester_bounds[Marker[term + "_START"]] <= meeting_date <= semester_bounds[Marker[term + "_END"]]:
+			return (year[0], term)
+	return None
+
+# Trends computed for each (data version, meeting window, week window)
+trends_cache = {}
+
+def get_attendance_trends(meeting_window=4, week_window=4):
+	"""
+	Get attendance trends for each attendee type: rolling averages over the last meeting_window
+	meetings and the last week_window weeks, and the term-over-term and year-over-year changes
+	in the average attendance per meeting.  Results are cached until the data changes.
+
+	meeting_window: Number of meetings in the rolling meeting average
+	week_window: Number of weeks in the rolling week average
+
+	returns: A JSON-ready dictionary, as described in trends.compute_trends
+	"""
+	if meeting_window < 1 or week_window < 1:
+		raise ValueError("Windows must be at least 1")
+
+	key = (get_data_version(), meeting_window, week_window)
+	if key not in trends_cache:
+		stats_per_date, stats_per_attendee_type = get_attendance_stats()
+		dates = sorted(stats_per_date.keys())
+		counts_by_type = { attendee_type: [stats_per_date[date][attendee_type] for date in dates] \
+							for attendee_type in stats_per_attendee_type }
+
+		# Only keep trends for the current data version
+		trends_cache.clear()
+		trends_cache[key] = compute_trends(dates, counts_by_type, get_term, meeting_window, week_window)
+	return trends_cache[key]
+
+# Cohort retention computed for each data version
+cohorts_cache = {}
+
+def get_cohort_retention():
+	"""
+	Get retention curves for cohorts of attendees grouped by the term they first attended and
+	their attendee type, e.g. how many of the attendees who first attended in Fall 2018 still
+	attended a year later.  Results are cached until the data changes.
+
+	returns: A JSON-ready dictionary, as described in cohorts.compute_cohorts
+	"""
+	version = get_data_version()
+	if version not in cohorts_cache:
+		index = get_identity_index()
+		rows = operations.get_attendance_records(fields=["attendee", "meeting_date"], clauses=["ORDER BY meeting_date"])
+		records = ((row["attendee"], row["meeting_date"]) for row in rows)
+
+		# Only keep cohorts for the current data version
+		cohorts_cache.clear()
+		cohorts_cache[version] = compute_cohorts(records, index.get_canonical, index.get_attendee_type, get_term)
+	return cohorts_cache[version]
+
+# Streaks of every attendee computed for each data version
+streaks_cache = {}
+
+# Orders supported by get_attendance_streaks
+STREAK_ORDERS = ["longest_streak", "current_streak", "longest_absence"]
+
+def get_attendance_streaks(order="longest_streak", limit=None):
+	"""
+	Get the longest streak, current streak and longest absence of every attendee, e.g. to sort
+	the roster by streak.  Streaks are computed for everyone at once and cached until the data
+	changes.
+
+	order: "longest_streak", "current_streak" or "longest_absence", to list the attendees with
+		   the most meetings in that streak first
+	limit: Number of attendees to return, or None for all
+
+	returns: A list of JSON-ready dictionaries, one per canonical attendee, containing the
+			 attendee, their attendee type and their streaks, as described in
+			 streaks.StreakCounter.to_json
+	"""
+	if order not in STREAK_ORDERS:
+		raise ValueError("Unknown order " + str(order))
+	if limit is not None and limit < 0:
+		raise ValueError("Limit cannot be negative")
+
+	version = get_data_version()
+	if version not in streaks_cache:
+		index = get_identity_index()
+		rows = operations.get_attendance_records(fields=["attendee", "meeting_date"], clauses=["ORDER BY meeting_date"])
+		records = ((row["attendee"], row["meeting_date"]) for row in rows)
+		streaks = compute_streaks(snapshot.get_meeting_dates(), records, index.get_canonical)
+
+		# Only keep streaks for the current data version
+		streaks_cache.clear()
+		streaks_cache[version] = [dict(attendee=canonical, attendee_type=index.get_attendee_type(canonical), **streaks[canonical]) \
+									for canonical in sorted(streaks)]
+
+	ranked = sorted(streaks_cache[version], key=lambda streak: streak[order], reverse=True)
+	return ranked[:limit] if limit is not None else ranked
+
+# Attendee directory built for each data version
+directory_cache = {}
+
+def get_attendee_directory():
+	"""
+	Get the directory of attendee names, which is rebuilt when the attendance data is written or
+	the members file changes
+	"""
+	version = get_data_version()
+	if version not in directory_cache:
+		directory = AttendeeDirectory(get_identity_index(), snapshot.get_attendee_summaries())
+
+		# Only keep the directory for the current data version
+		directory_cache.clear()
+		directory_cache[version] = directory
+	return directory_cache[version]
+
+def search_attendees(query, limit=10, substring=False):
+	"""
+	Search for attendees by the start of (or, if substring is True, any part of) any of their
+	names, e.g. to autocomplete names
+
+	returns: A list of JSON-ready dictionaries, as described in directory.AttendeeDirectory.search
+	"""
+	if limit < 0:
+		raise ValueError("Limit cannot be negative")
+	return get_attendee_directory().search(query, limit, substring)
+
+def is_attendee(attendee):
+	"""
+	Check if a name has attendance records or is in the members file, and so has a profile
+	"""
+	index = get_identity_index()
+	return index.get_attendee_type(attendee) != "guest" or \
+		index.get_canonical(attendee) in snapshot.get_attendee_summaries()
@@ -0,0 +1,217 @@
+# This file benchmarks the api against synthetic attendance histories of increasing size, loaded
+# into SQLite stand-in databases, so that slow queries, N+1 query patterns and quadratic steps
+# show up as numbers before the real history grows that large.
+#
+# Usage: python3 -m <package>.benchmark [--scales 1 10 100] [--iterations N] [--concurrency N]
+#                                       [--output FILE] [--seed N]
+
+import os
+import json
+import time
+import random
+import argparse
+import datetime
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from . import api
+from . import operations
+from . import snapshot
+from . import migrations
+from . import minutes_parse_utils
+from .identity import get_identity_index
+from .roster_sync import sync_roster
+from .logging import log
+
+# Size of the 1x history: weekly meetings over five years, with this many people on the roster
+BASE_WEEKS = 5 * 52
+BASE_PEOPLE = 150
+
+# Percentiles of latency reported for each api function
+PERCENTILES = [50, 90, 99]
+
+def generate_history(scale, seed=0):
+	"""
+	Generate a synthetic attendance history, ending this week
+
+	scale: Multiple of the base history size; both the number of meetings and the number of
+		   people grow with it, as people come and go over the years
+	seed: Seed of the random generator, so that runs are comparable
+
+	returns: A tuple (roster lines, rows, attendees), where roster lines are the lines of a
+			 members file, rows are (meeting_date, attendee, attendee_type, inspection_required)
+			 tuples and attendees are the names which appear in rows
+	"""
+	generator = random.Random(seed)
+	weeks = BASE_WEEKS * scale
+	today = datetime.date.today()
+	last_meeting = today - datetime.timedelta(days=today.weekday())
+	dates = [last_meeting - datetime.timedelta(weeks=weeks - 1 - week) for week in range(weeks)]
+
+	roster = []
+	rows = []
+	attendees = set()
+	for person in range(BASE_PEOPLE * scale):
+		name = "user" + str(person)
+		kind = generator.choices(["keyholder", "member", "guest"], weights=[2, 3, 5])[0]
+		if kind == "keyholder":
+			roster.append(name + " member")
+		elif kind == "member":
+			roster.append(name + " prospective")
+
+		# Some people also appear under an alias
+		alias = None
+		if generator.random() < 0.1:
+			alias = "alias" + str(person)
+			roster.append(alias + " " + name)
+
+		# Each person attends for a while, some weeks more regularly than others
+		start = generator.randrange(weeks)
+		end = min(weeks, start + generator.randint(4, 4 * 52))
+		probability = generator.uniform(0.1, 0.9)
+		attendee_type = { "keyholder": "STUDENT_KEYHOLDER", "member": "MEMBER", "guest": "GUEST" }[kind]
+		for week in range(start, end):
+			if generator.random() < probability:
+				attendee = alias if alias is not None and generator.random() < 0.2 else name
+				rows.append((dates[week], attendee, attendee_type, "NONE"))
+				attendees.add(attendee)
+
+	return roster, rows, sorted(attendees)
+
+def load_history(directory, scale, seed=0):
+	"""
+	Create a SQLite stand-in database and members file containing a synthetic history, and
+	switch to them
+
+	directory: Directory to create the files in
+	scale: Multiple of the base history size, as in generate_history
+
+	returns: The names which appear in the attendance records
+	"""
+	roster, rows, attendees = generate_history(scale, seed)
+
+	members_path = os.path.join(directory, "members_" + str(scale))
+	with open(members_path, "w") as f:
+		f.write("\n".join(roster) + "\n")
+	minutes_parse_utils.members_path = members_path
+	snapshot.snapshot_path = os.path.join(directory, "snapshot_" + str(scale) + ".pickle")
+
+	operations.use_sqlite(os.path.join(directory, "attendance_" + str(scale) + ".db"))
+	migrations.migrate()
+	sync_roster()
+	for start in range(0, len(rows), minutes_parse_utils.WRITE_CHUNK_SIZE):
+		operations.add_attendance_records(rows[start:start + minutes_parse_utils.WRITE_CHUNK_SIZE])
+	minutes_parse_utils.update_attendee_summaries(attendees, get_identity_index())
+	snapshot.write_snapshot()
+
+	log("Loaded " + str(scale) + "x history: " + str(len(rows)) + " records of " + str(len(attendees)) + " attendees")
+	return attendees
+
+def get_benchmarks(attendees, generator):
+	"""
+	Get the api functions to benchmark, as a dictionary mapping names to functions of no
+	arguments.  Profiles are requested for a random attendee on each call.
+	"""
+	return {
+		"get_attendance_information": lambda: api.get_attendance_information(generator.choice(attendees)),
+		"get_attendance_records_list": lambda: api.get_attendance_records_list(),
+		"get_attendance_records_page": lambda: api.get_attendance_records_page(limit=50),
+		"get_attendance_stats": lambda: api.get_attendance_stats()
+	}
+
+def percentile(latencies, percent):
+	"""
+	Get a percentile of a list of latencies, by the nearest rank
+	"""
+	ranked = sorted(latencies)
+	return ranked[max(0, -(-len(ranked) * percent // 100) - 1)]
+
+def summarize(latencies, num_queries, elapsed):
+	"""
+	Summarize the latencies (in seconds) of calls to an api function
+
+	num_queries: Total number of queries the calls issued
+	elapsed: Wall clock time the calls took, in seconds
+	"""
+	summary = { "calls": len(latencies) }
+	for percent in PERCENTILES:
+		summary["p" + str(percent) + "_ms"] = round(percentile(latencies, percent) * 1000, 3)
+	summary["max_ms"] = round(max(latencies) * 1000, 3)
+	summary["queries_per_call"] = round(num_queries / len(latencies), 2)
+	summary["calls_per_second"] = round(len(latencies) / elapsed, 2) if elapsed else None
+	return summary
+
+def time_calls(function, iterations, concurrency=1):
+	"""
+	Call a function repeatedly, from a number of threads at once, and summarize the latencies
+
+	returns: A summary, as returned by summarize
+	"""
+	def timed_call(_):
+		start = time.perf_counter()
+		function()
+		return time.perf_counter() - start
+
+	operations.recorded_queries = []
+	try:
+		start = time.perf_counter()
+		if concurrency <= 1:
+			latencies = [timed_call(i) for i in range(iterations)]
+		else:
+			with ThreadPoolExecutor(max_workers=concurrency) as executor:
+				latencies = list(executor.map(timed_call, range(iterations)))
+		elapsed = time.perf_counter() - start
+		num_queries = len(operations.recorded_queries)
+	finally:
+		operations.recorded_queries = None
+	return summarize(latencies, num_queries, elapsed)
+
+def run_benchmarks(scales, iterations=20, concurrency=8, seed=0):
+	"""
+	Benchmark the api at each scale of history, with a single caller and with concurrent callers
+
+	returns: A JSON-ready dictionary mapping each scale (e.g. "10x") to the size of its history
+			 and the summaries of each api function
+	"""
+	results = {}
+	with tempfile.TemporaryDirectory() as directory:
+		for scale in scales:
+			attendees = load_history(directory, scale, seed)
+			generator = random.Random(seed)
+			benchmarks = get_benchmarks(attendees, generator)
+
+			size = operations.get_data("SELECT COUNT(*) AS num_records, COUNT(DISTINCT meeting_date) AS num_meetings "
+										"FROM attendance;", ())[0]
+			result = {
+				"records": size["num_records"],
+				"meetings": size["num_meetings"],
+				"attendees": len(attendees),
+				"functions": {}
+			}
+			for name, function in benchmarks.items():
+				# Warm up caches (the identity index, snapshot and connection) before timing
+				function()
+				result["functions"][name] = {
+					"single": time_calls(function, iterations),
+					"concurrent": time_calls(function, iterations * concurrency, concurrency),
+					"concurrency": concurrency
+				}
+				log(str(scale) + "x " + name + ": p50 " + str(result["functions"][name]["single"]["p50_ms"]) + "ms, " + \
+					str(result["functions"][name]["single"]["queries_per_call"]) + " queries per call")
+			results[str(scale) + "x"] = result
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Benchmark the api against synthetic histories")
+	parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="multiples of the base history size")
+	parser.add_argument("--iterations", type=int, default=20, help="calls per api function (per thread when concurrent)")
+	parser.add_argument("--concurrency", type=int, default=8, help="number of concurrent callers")
+	parser.add_argument("--output", default=None, help="file to write the JSON results to, instead of printing them")
+	parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic histories")
+	args = parser.parse_args()
+
+	results = run_benchmarks(args.scales, args.iterations, args.concurrency, args.seed)
+	if args.output is not None:
+		with open(args.output, "w") as f:
+			json.dump(results, f, indent=4)
+	else:
+		print(json.dumps(results, indent=4))
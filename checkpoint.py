@@ -0,0 +1,105 @@
+# This file records the progress of a rebuild in a local checkpoint file, so that a rebuild
+# which is interrupted (e.g. by the database connection dropping) can resume where it left
+# off instead of starting over.
+#
+# The first line of the checkpoint holds the options of the rebuild, and each further line
+# is the filename of a minutes file whose meeting has been committed to the database.
+
+import os
+import json
+from .organizations import get_organization
+from .logging import log
+
+# Path of the checkpoint file
+checkpoint_path = os.path.join(os.path.dirname(__file__), "rebuild.checkpoint")
+
+def get_checkpoint_path():
+	"""
+	Get the checkpoint file of the organization being worked on
+	"""
+	organization = get_organization()
+	if organization is not None:
+		return organization.get_state_file("rebuild.checkpoint")
+	return checkpoint_path
+
+class Checkpoint:
+	"""
+	Progress of a rebuild, recording minutes files as their meetings are committed
+	"""
+	def __init__(self, options, path=None):
+		"""
+		Open the checkpoint for a rebuild, resuming from an existing checkpoint if it was
+		written by a rebuild with the same options
+
+		options: JSON-serializable dictionary of the options of the rebuild
+		path: The checkpoint file, or None for the default
+		"""
+		self.path = path if path is not None else get_checkpoint_path()
+		self.options = options
+		self.committed = set()
+
+		header = json.dumps(options, sort_keys=True)
+		try:
+			with open(self.path) as f:
+				lines = f.read().splitlines()
+		except FileNotFoundError:
+			lines = []
+
+		if lines and lines[0] == header:
+			self.committed = set(line for line in lines[1:] if line)
+			log("Resuming rebuild: " + str(len(self.committed)) + " minutes files already committed")
+			self.file = open(self.path, "a")
+		else:
+			if lines:
+				log("Ignoring checkpoint of a rebuild with different options")
+			os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+			self.file = open(self.path, "w")
+			self.file.write(header + "\n")
+			self.sync()
+
+	def skip_committed(self, files):
+		"""
+		Remove the minutes files which have already been committed
+
+		files: mapping of directories to filenames in those directories
+
+		returns: The mapping without committed files
+		"""
+		return { direc: [file for file in files[direc] if file not in self.committed] for direc in files }
+
+	def record(self, filenames):
+		"""
+		Record minutes files whose meetings have been committed to the database
+		"""
+		for filename in filenames:
+			self.file.write(filename + "\n")
+			self.committed.add(filename)
+		self.sync()
+
+	def sync(self):
+		# The checkpoint must reach the disk before the next meeting is committed
+		self.file.flush()
+		os.fsync(self.file.fileno())
+
+	def close(self):
+		"""
+		Close the checkpoint, keeping it so that the rebuild can be resumed
+		"""
+		if not self.file.closed:
+			self.file.close()
+
+	def finish(self):
+		"""
+		Remove the checkpoint once the rebuild has completed
+		"""
+		self.close()
+		os.remove(self.path)
+
+def discard_checkpoint(path=None):
+	"""
+	Remove any existing checkpoint, so that the next rebuild starts over
+	"""
+	try:
+		os.remove(path if path is not None else get_checkpoint_path())
+	except FileNotFoundError:
+		pass
@@ -0,0 +1,227 @@
+# This file is the command line entry point for ingesting minutes and inspecting the database
+#
+# Usage: python3 -m <package> {rebuild,update,stats,pack} [--since DATE] [--until DATE] [--jobs N]
+#                                                         [--batch-size N] [--dry-run] [--restart]
+#                                                         [--parse-budget SECONDS] [--profile-top N]
+#                                                         [--org NAME ...] [--organizations FILE]
+#                                                         [--no-spool] [--compress]
+
+import os
+import time
+import argparse
+import datetime
+from . import operations
+from . import collect_all_attendance
+from . import recent_attendance
+from .minutes_parse_utils import get_format, parse_minutes_files, ingest, WRITE_CHUNK_SIZE, PARSE_TIME_BUDGET
+from .parse_profiler import ParseProfiler
+from .profile_cache import refresh_profiles
+from .checkpoint import Checkpoint, discard_checkpoint
+from .spool import Spool
+from .minutes_archive import pack_history
+from .organizations import load_organizations, for_each_organization
+from .logging import log
+
+def parse_date(string):
+	"""
+	Parse a YYYY-MM-DD date given on the command line
+	"""
+	try:
+		return datetime.date.fromisoformat(string)
+	except ValueError:
+		raise argparse.ArgumentTypeError("invalid date " + string + ", expected YYYY-MM-DD")
+
+def filter_files(files, since=None, until=None):
+	"""
+	Keep only minutes files for meetings within a date window
+
+	files: mapping of directories to filenames in those directories
+	since: The first meeting date to keep, or None for no limit
+	until: The last meeting date to keep, or None for no limit
+	"""
+	filtered = {}
+	for direc in files:
+		filtered[direc] = []
+		for file in files[direc]:
+			format = get_format(file)
+			if format is None:
+				continue
+			date = format.get_date(file)
+			if (since is None or date >= since) and (until is None or date <= until):
+				filtered[direc].append(file)
+	return filtered
+
+def count_files(files):
+	return sum(len(files[direc]) for direc in files)
+
+def dry_run(files, args):
+	"""
+	Parse minutes files without writing to the database, and report how long parsing took,
+	ranking the slowest files
+	"""
+	start = time.perf_counter()
+	num_files = 0
+	num_records = 0
+	profiler = ParseProfiler()
+
+	for path, date, attendees in parse_minutes_files(files, args.jobs, args.parse_budget, profiler.record):
+		num_files += 1
+		num_records += sum(len(attendees[attendee_type]) for attendee_type in attendees)
+
+	elapsed = time.perf_counter() - start
+	log("Dry run: parsed " + str(num_files) + " files (" + str(num_records) + " attendance records) in " + \
+		str(round(elapsed, 2)) + "s")
+	if num_files:
+		log("Dry run: " + str(round(elapsed * 1000 / num_files, 1)) + "ms per file")
+	profiler.report(args.profile_top)
+
+def run_ingest(files, args, replace, checkpoint=None):
+	"""
+	Ingest minutes files according to the command line options
+
+	checkpoint: Optional checkpoint.Checkpoint recording the progress of the ingestion
+	"""
+	log("Found " + str(count_files(files)) + " minutes files to ingest")
+	if args.dry_run:
+		dry_run(files, args)
+		return
+
+	start = time.perf_counter()
+	spool = None if args.no_spool else Spool()
+	try:
+		added_attendees = ingest(files, chunk_size=args.batch_size, jobs=args.jobs, replace=replace, checkpoint=checkpoint, \
+									time_budget=args.parse_budget, spool=spool)
+	finally:
+		if spool is not None:
+			spool.close()
+	refresh_profiles(added_attendees)
+	log("Finished ingesting attendance in " + str(round(time.perf_counter() - start, 2)) + "s")
+
+def rebuild(args):
+	"""
+	Re-ingest all minutes in the date window, replacing their existing records.  Each meeting
+	is committed separately, and an interrupted rebuild with the same options resumes after the
+	last meeting it committed.
+	"""
+	# Only search history directories which can contain meetings in the window
+	history_limit = args.since.year if args.since is not None else args.history_limit
+	minutes_path = args.minutes_path if args.minutes_path is not None else collect_all_attendance.get_minutes_path()
+	files = collect_all_attendance.get_minutes_files(minutes_path, history_limit)
+	files = filter_files(files, args.since, args.until)
+	if args.dry_run:
+		run_ingest(files, args, replace=True)
+		return
+
+	if args.restart:
+		discard_checkpoint()
+	checkpoint = Checkpoint({
+		"minutes_path": minutes_path,
+		"history_limit": history_limit,
+		"since": str(args.since),
+		"until": str(args.until)
+	})
+	try:
+		run_ingest(files, args, replace=True, checkpoint=checkpoint)
+	except BaseException:
+		checkpoint.close()
+		log("Rebuild interrupted; run it again with the same options to resume")
+		raise
+	checkpoint.finish()
+
+def update(args):
+	"""
+	Ingest minutes in the date window which have not yet been ingested
+	"""
+	minutes_path = args.minutes_path if args.minutes_path is not None else recent_attendance.get_minutes_path()
+	files = recent_attendance.get_minutes_files(minutes_path)
+	files = filter_files(files, args.since, args.until)
+	run_ingest(files, args, replace=False)
+
+def stats(args):
+	"""
+	Report what is in the database within the date window
+	"""
+	options = {}
+	if args.since is not None:
+		options["start_date"] = args.since
+	if args.until is not None:
+		options["end_date"] = args.until
+
+	meeting_dates = operations.get_meeting_dates(options)
+	totals = operations.get_attendance_records(fields=["COUNT(*) AS num_records", "COUNT(DISTINCT attendee) AS num_attendees"], \
+												options=options)[0]
+	by_type = operations.get_attendance_records(fields=["attendee_type", "COUNT(*) AS num_records"], \
+												clauses=["GROUP BY attendee_type"], options=options)
+	by_inspection = operations.get_attendance_records(fields=["inspection_required", "COUNT(*) AS num_records"], \
+												clauses=["GROUP BY inspection_required"], options=options)
+
+	log("Meetings: " + str(len(meeting_dates)) + \
+		(" (" + str(min(meeting_dates)) + " to " + str(max(meeting_dates)) + ")" if meeting_dates else ""))
+	log("Attendance records: " + str(totals["num_records"]))
+	log("Distinct attendees: " + str(totals["num_attendees"]))
+	for row in by_type:
+		log("    " + str(row["attendee_type"]) + ": " + str(row["num_records"]))
+	log("Inspection required:")
+	for row in by_inspection:
+		log("    " + str(row["inspection_required"]) + ": " + str(row["num_records"]))
+
+def pack(args):
+	"""
+	Pack the minutes of each closed year in the history directory, for rebuilds to read
+	"""
+	minutes_path = args.minutes_path if args.minutes_path is not None else collect_all_attendance.get_minutes_path()
+	before_year = args.until.year + 1 if args.until is not None else None
+	written = pack_history(os.path.join(minutes_path, "HISTORY"), args.compress, before_year)
+	log("Wrote " + str(len(written)) + " packs")
+
+COMMANDS = {
+	"rebuild": rebuild,
+	"update": update,
+	"stats": stats,
+	"pack": pack
+}
+
+def main(argv=None):
+	"""
+	Run the command line interface
+
+	argv: The command line arguments, or None to use sys.argv
+	"""
+	parser = argparse.ArgumentParser(prog="python3 -m " + __package__, description="Ingest SIPB minutes attendance")
+	parser.add_argument("command", choices=COMMANDS.keys(), help="rebuild: re-ingest all minutes in the window; " \
+						"update: ingest minutes not yet in the database; stats: summarize the database; " \
+						"pack: pack the minutes of closed years")
+	parser.add_argument("--since", type=parse_date, default=None, help="only meetings on or after this date (YYYY-MM-DD)")
+	parser.add_argument("--until", type=parse_date, default=None, help="only meetings on or before this date (YYYY-MM-DD)")
+	parser.add_argument("--jobs", type=int, default=1, help="number of processes to parse minutes in")
+	parser.add_argument("--batch-size", type=int, default=WRITE_CHUNK_SIZE, help="number of records to write at once")
+	parser.add_argument("--dry-run", action="store_true", help="parse and report timings without writing to the database")
+	parser.add_argument("--parse-budget", type=float, default=PARSE_TIME_BUDGET, \
+						help="seconds a minutes file may take to parse before it is skipped and reported")
+	parser.add_argument("--profile-top", type=int, default=10, help="number of slowest files to report in a dry run")
+	parser.add_argument("--minutes-path", default=None, help="minutes directory to read from, instead of the organization's")
+	parser.add_argument("--restart", action="store_true", help="rebuild from the start, ignoring any interrupted rebuild")
+	parser.add_argument("--no-spool", action="store_true", help="write parsed attendance straight to the database, " \
+						"instead of spooling it to disk first")
+	parser.add_argument("--compress", action="store_true", help="compress the minutes in packs")
+	parser.add_argument("--history-limit", type=int, default=collect_all_attendance.HISTORY_LIMIT, \
+						help="first year of history to rebuild when --since is not given")
+	parser.add_argument("--org", action="append", default=None, \
+						help="organization to run the command for, from the organizations file; may be given " \
+						"several times to run the command for several organizations at once")
+	parser.add_argument("--organizations", default=None, help="organizations file to read, instead of the default")
+	args = parser.parse_args(argv)
+
+	if args.dry_run:
+		# Nothing should be written, even by commands which would not normally write
+		operations.NO_WRITE_DB = True
+
+	if args.org is None:
+		COMMANDS[args.command](args)
+		return
+
+	organizations = load_organizations(args.organizations)
+	unknown = [name for name in args.org if name not in organizations]
+	if unknown:
+		parser.error("unknown organization " + ", ".join(unknown))
+	for_each_organization([organizations[name] for name in args.org], COMMANDS[args.command], args)
@@ -0,0 +1,127 @@
+# This file computes how often each pair of attendees attended the same meetings.  Attendance
+# is an attendee x meeting matrix A of ones, and the co-attendance counts are the sparse product
+# A A^T, summed meeting by meeting over the pairs of attendees at each meeting.
+
+import math
+from collections import Counter
+
+from .logging import log
+
+# Meetings larger than this (e.g. minutes which list the whole roster) are not paired, since the
+# pairs of a meeting grow with the square of its attendees
+MAX_MEETING_SIZE = 500
+
+class CoAttendance:
+	"""
+	Co-attendance counts between canonical attendees.  The count of an attendee with themselves
+	is the number of meetings they attended.
+	"""
+	def __init__(self, attendees, rows):
+		"""
+		attendees: List of canonical attendees, in matrix order
+		rows: Function mapping the position of an attendee to a dictionary mapping the positions
+			  of their co-attendees (including themselves) to co-attendance counts
+		"""
+		self.attendees = attendees
+		self.positions = { attendee: position for position, attendee in enumerate(attendees) }
+		self.rows = rows
+
+	def get_counts(self, canonical):
+		"""
+		Get the number of meetings an attendee attended with each of their co-attendees
+
+		returns: A dictionary mapping canonical co-attendees (excluding the attendee) to counts
+		"""
+		if canonical not in self.positions:
+			return {}
+		position = self.positions[canonical]
+		return { self.attendees[other]: count for other, count in self.rows(position).items() if other != position }
+
+	def get_num_attended(self, canonical):
+		"""
+		Get the number of meetings an attendee attended
+		"""
+		if canonical not in self.positions:
+			return 0
+		position = self.positions[canonical]
+		return self.rows(position).get(position, 0)
+
+	def get_top_coattendees(self, canonical, k=10):
+		"""
+		Get the attendees who attended the most meetings with an attendee
+
+		returns: A list of (co-attendee, count) tuples, most meetings first
+		"""
+		counts = self.get_counts(canonical)
+		return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+	def get_most_similar(self, canonical, k=10):
+		"""
+		Get the attendees whose attendance is most similar to an attendee's, by the cosine
+		similarity of their attendance vectors (meetings attended together, relative to the
+		meetings each attended)
+
+		returns: A list of (co-attendee, similarity) tuples, most similar first
+		"""
+		num_attended = self.get_num_attended(canonical)
+		if not num_attended:
+			return []
+		similarities = []
+		for other, count in self.get_counts(canonical).items():
+			similarity = count / math.sqrt(num_attended * self.get_num_attended(other))
+			similarities.append((other, round(similarity, 4)))
+		return sorted(similarities, key=lambda item: (-item[1], item[0]))[:k]
+
+def get_incidence(records, get_canonical):
+	"""
+	Get the meetings attended by each canonical attendee
+
+	records: Iterable of (attendee, meeting_date) tuples
+	get_canonical: Function mapping an attendee's name to their canonical name
+
+	returns: A list of canonical attendees, sorted, and a dictionary mapping each meeting date
+			 to the set of positions in that list of its attendees
+	"""
+	meetings = {}
+	for attendee, meeting_date in records:
+		# An attendee recorded under several names at a meeting is counted once
+		meetings.setdefault(meeting_date, set()).add(get_canonical(attendee))
+
+	attendees = sorted(set().union(*meetings.values()))
+	positions = { attendee: position for position, attendee in enumerate(attendees) }
+	return attendees, { meeting_date: { positions[attendee] for attendee in meeting_attendees } \
+						for meeting_date, meeting_attendees in meetings.items() }
+
+def count_pairs(attendees, meetings):
+	"""
+	Compute co-attendance counts as the sum over meetings of the outer product of each meeting's
+	column of A.  Each attendee's row is a Counter updated with the attendees of each meeting
+	they attended, so only pairs who actually met are visited, and the counting of each row is
+	done by Counter.update rather than in Python.  A meeting with more than MAX_MEETING_SIZE
+	attendees only adds to the meetings its attendees attended
+
+	returns: A list mapping the position of each attendee to a Counter mapping the positions of
+			 their co-attendees (including themselves) to co-attendance counts
+	"""
+	counts = [Counter() for _ in attendees]
+	for meeting_date, meeting_attendees in meetings.items():
+		if len(meeting_attendees) > MAX_MEETING_SIZE:
+			log("Not pairing the " + str(len(meeting_attendees)) + " attendees of " + str(meeting_date))
+			for position in meeting_attendees:
+				counts[position][position] += 1
+			continue
+		for position in meeting_attendees:
+			counts[position].update(meeting_attendees)
+	return counts
+
+def compute_coattendance(records, get_canonical):
+	"""
+	Compute co-attendance counts between canonical attendees
+
+	records: Iterable of (attendee, meeting_date) tuples
+	get_canonical: Function mapping an attendee's name to their canonical name
+
+	returns: A CoAttendance
+	"""
+	attendees, meetings = get_incidence(records, get_canonical)
+	return CoAttendance(attendees, count_pairs(attendees, meetings).__getitem__)
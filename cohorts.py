@@ -0,0 +1,83 @@
+# This file computes cohort retention: attendees are grouped by the term they first attended,
+# and each cohort is followed through later terms.  Everything is computed in one ordered
+# pass over the attendance records, instead of one query per attendee.
+
+def term_label(term):
+	"""
+	Get the label of a (first year of academic year, term name) tuple, e.g. "2018-2019 FALL"
+	"""
+	return str(term[0]) + "-" + str(term[0] + 1) + " " + term[1]
+
+def compute_cohorts(records, get_canonical, get_attendee_type, get_term):
+	"""
+	Compute retention curves for cohorts of attendees grouped by the term they first attended
+
+	records: Iterable of (attendee, meeting_date) tuples, ordered by meeting_date
+	get_canonical: Function mapping an attendee's name to their canonical name
+	get_attendee_type: Function mapping a canonical name to an attendee type
+	get_term: Function mapping a date to a (first year of academic year, term name) tuple,
+			  or None if the date is outside any term
+
+	returns: A JSON-ready dictionary containing:
+		- terms: labels of the terms with meetings, in order
+		- cohorts: a list of cohorts, one per first term and attendee type (including "all"
+		  types), each with its size and, for each later term, the number and percent of the
+		  cohort which attended that term
+	"""
+	# Terms with meetings, in order, and the position of each
+	terms = []
+	term_positions = {}
+	# Term of each meeting date, so each date is only looked up once
+	date_terms = {}
+	# Positions of the terms each canonical attendee attended, in order
+	attended_terms = {}
+
+	for attendee, meeting_date in records:
+		if meeting_date not in date_terms:
+			date_terms[meeting_date] = get_term(meeting_date)
+		term = date_terms[meeting_date]
+		if term is None:
+			continue
+
+		if term not in term_positions:
+			term_positions[term] = len(terms)
+			terms.append(term)
+		position = term_positions[term]
+
+		canonical = get_canonical(attendee)
+		if canonical not in attended_terms:
+			attended_terms[canonical] = [position]
+		elif attended_terms[canonical][-1] != position:
+			attended_terms[canonical].append(position)
+
+	# Number of each cohort (keyed by first term and attendee type) attending each term
+	retained = {}
+	sizes = {}
+	for canonical, positions in attended_terms.items():
+		for attendee_type in (get_attendee_type(canonical), "all"):
+			cohort = (positions[0], attendee_type)
+			sizes[cohort] = sizes.get(cohort, 0) + 1
+			if cohort not in retained:
+				retained[cohort] = [0] * (len(terms) - positions[0])
+			for position in positions:
+				retained[cohort][position - positions[0]] += 1
+
+	cohorts = []
+	for first_term, attendee_type in sorted(sizes.keys()):
+		cohort = (first_term, attendee_type)
+		cohorts.append({
+			"term": term_label(terms[first_term]),
+			"attendee_type": attendee_type,
+			"size": sizes[cohort],
+			"retention": [{
+				"term": term_label(terms[first_term + offset]),
+				"offset": offset,
+				"retained": count,
+				"percent": round(count * 100 / sizes[cohort], 1)
+			} for offset, count in enumerate(retained[cohort])]
+		})
+
+	return {
+		"terms": [term_label(term) for term in terms],
+		"cohorts": cohorts
+	}
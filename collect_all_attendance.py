@@ -1,8 +1,10 @@
 import os
 import re
 import datetime
-from .minutes_parse_utils import FORMATS, get_members_and_keyholders, get_attendance, add_to_db
+from .minutes_parse_utils import FORMATS, get_members_and_keyholders
 from .operations import add_attendance_record
+from .organizations import get_organization
+from .minutes_archive import list_minutes_directory, PACK_SUFFIX
 
 # Path to minutes
 minutes_path = '/afs/sipb.mit.edu/admin/minutes'
@@ -11,14 +13,15 @@ history_path = os.path.join(minutes_path, 'HISTORY')
 # Only get attendance history back to 2010 for initial population of database
 HISTORY_LIMIT = 2010
 
-def dir_in_range(direc):
+def dir_in_range(direc, history_limit=HISTORY_LIMIT):
 	"""
-	Checks if a directory name is for minutes in 2010 or after
+	Checks if a directory name is for minutes in 2010 (or the history limit) or after
 	
 	direc: directory name
+	history_limit: The first year to get attendance history for
 	
 	returns: matches, year
-		- matches: True if the directory is for 2010 or after
+		- matches: True if the directory is for the history limit or after
 		- year: The year the directory represents, or None if it is not a valid minutes
 				history directory
 	"""
@@ -29,7 +32,7 @@ def dir_in_range(direc):
 	if dir_match:
 		# Extract year from directory
 		year = int(dir_match.groupdict()['year'])
-		if year >= HISTORY_LIMIT:
+		if year >= history_limit:
 			return True, year
 		else:
 			return False, year
@@ -37,28 +40,48 @@ def dir_in_range(direc):
 		# Invalid minutes history directory name
 		return False, None
 
-def get_minutes_files():
+def get_minutes_path():
+	"""
+	Get the minutes directory of the organization being worked on
+	"""
+	organization = get_organization()
+	if organization is not None:
+		return organization.minutes_path
+	return minutes_path
+
+def get_minutes_files(minutes_path=None, history_limit=HISTORY_LIMIT):
 	"""
 	Get all minutes files back to the history limit
 
-	returns: A dictionary mapping from minutes directories to lists of minutes files within those
-			 directories
+	minutes_path: The minutes directory, which contains a HISTORY directory, or None for the
+				  organization's
+	history_limit: The first year to get attendance history for
+
+	returns: A dictionary mapping from minutes directories (or packs of a year's minutes, see
+			 minutes_archive) to lists of minutes files within those directories
 	"""
+	if minutes_path is None:
+		minutes_path = get_minutes_path()
+	history_path = os.path.join(minutes_path, 'HISTORY')
 	files = {}
 	# Get files under main minutes directory
-	files[minutes_path] = [file for file in os.listdir(minutes_path) if os.path.isfile(os.path.join(minutes_path, file))]
-	# Get all minutes history directories
-	history_dirs = [direc for direc in os.listdir(history_path) if os.path.isdir(os.path.join(history_path, direc))]
+	files[minutes_path] = list_minutes_directory(minutes_path)
+	# Get all minutes history directories, and packs of them
+	history_entries = os.listdir(history_path)
+	history_dirs = [direc for direc in history_entries if os.path.isdir(os.path.join(history_path, direc))]
+	history_packs = [pack for pack in history_entries if pack.endswith(PACK_SUFFIX) and os.path.isfile(os.path.join(history_path, pack))]
+	# A year which has been packed is read from its pack
+	history_dirs = [direc for direc in history_dirs if direc + PACK_SUFFIX not in history_packs] + history_packs
 	for history_dir in history_dirs:
-		in_range, year = dir_in_range(history_dir)
+		in_range, year = dir_in_range(history_dir, history_limit)
 		# Only consider history directories back to the history limit
 		if in_range:
 			# Get all files in this history directory, if it's past the history limit
-			files[os.path.join(history_path, history_dir)] = [file for file in os.listdir(os.path.join(history_path, history_dir)) if os.path.isfile(os.path.join(history_path, history_dir, file))]
+			files[os.path.join(history_path, history_dir)] = list_minutes_directory(os.path.join(history_path, history_dir))
 
 	return files;
 
 if __name__ == "__main__":
-	files = get_minutes_files()
-	attendance = get_attendance(files)
-	add_to_db(attendance)
+	# Equivalent to python3 -m <package> rebuild
+	from .cli import main
+	main(["rebuild"])
@@ -0,0 +1,97 @@
+# This file indexes the names of every attendee (canonical names and aliases) for prefix and
+# substring search, e.g. to autocomplete names.  Prefixes are found by bisecting a sorted list
+# of names, and substrings by intersecting the names containing each trigram of the query.
+
+import bisect
+
+class AttendeeDirectory:
+	"""
+	Searchable index of attendee names, each resolving to a canonical attendee
+	"""
+	def __init__(self, index, summaries):
+		"""
+		Build the directory from the roster and the attendees with attendance records
+
+		index: The identity.IdentityIndex of the members file
+		summaries: Dictionary mapping canonical names to rows containing last_attended and
+				   total_attended, as returned by operations.get_attendee_summaries
+		"""
+		self.index = index
+		self.summaries = summaries
+
+		names = index.members | index.keyholders | set(index.canonical) | set(summaries)
+		# Sorted (lowercase name, name) tuples, for prefix search
+		self.sorted_names = sorted((name.lower(), name) for name in names)
+		# Maps each trigram to the positions in sorted_names of the names containing it
+		self.trigrams = {}
+		for position, (lower, name) in enumerate(self.sorted_names):
+			for i in range(len(lower) - 2):
+				self.trigrams.setdefault(lower[i:i + 3], set()).add(position)
+
+	def find_prefix(self, prefix):
+		"""
+		Get the positions in sorted_names of the names starting with a prefix
+		"""
+		start = bisect.bisect_left(self.sorted_names, (prefix,))
+		end = bisect.bisect_left(self.sorted_names, (prefix + "\uffff",))
+		return range(start, end)
+
+	def find_substring(self, substring):
+		"""
+		Get the positions in sorted_names of the names containing a substring
+		"""
+		if len(substring) < 3:
+			# Too short to have a trigram, so check every name
+			return [position for position, (lower, name) in enumerate(self.sorted_names) if substring in lower]
+
+		candidates = None
+		for i in range(len(substring) - 2):
+			positions = self.trigrams.get(substring[i:i + 3], set())
+			candidates = positions if candidates is None else candidates & positions
+			if not candidates:
+				return []
+		# Names containing every trigram may still not contain the whole substring
+		return sorted(position for position in candidates if substring in self.sorted_names[position][0])
+
+	def search(self, query, limit=10, substring=False):
+		"""
+		Search for attendees by name
+
+		query: The start of a name (or any part of it, if substring is True), case insensitive
+		limit: Maximum number of attendees to return
+		substring: If True, match the query anywhere in a name instead of only at the start
+
+		returns: A list of JSON-ready dictionaries, one per canonical attendee, containing the
+				 name matched, the canonical name, attendee type, last attended date and total
+				 meetings attended.  Exact matches come first, then the most recently seen.
+		"""
+		query = query.strip().lower()
+		if not query:
+			return []
+
+		positions = self.find_substring(query) if substring else self.find_prefix(query)
+
+		# The best matching name of each canonical attendee
+		matches = {}
+		for position in positions:
+			lower, name = self.sorted_names[position]
+			canonical = self.index.get_canonical(name)
+			if canonical not in matches or (lower == query and matches[canonical][0] != query):
+				matches[canonical] = (lower, name)
+
+		results = []
+		for canonical, (lower, name) in matches.items():
+			summary = self.summaries.get(canonical)
+			results.append({
+				"name": name,
+				"canonical": canonical,
+				"attendee_type": self.index.get_attendee_type(canonical),
+				"last_attended": str(summary["last_attended"]) if summary is not None else None,
+				"total_attended": summary["total_attended"] if summary is not None else 0
+			})
+
+		# Exact matches first, then the most recently seen (never seen last), then by name
+		results.sort(key=lambda result: result["name"])
+		results.sort(key=lambda result: result["last_attended"] or "", reverse=True)
+		results.sort(key=lambda result: result["name"].lower() != query)
+		return results[:limit]
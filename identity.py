@@ -0,0 +1,126 @@
+# This file resolves the different names an attendee appears under (their kerberos and any
+# aliases) to a single canonical name
+
+from .minutes_parse_utils import get_members_and_keyholders, get_members_mtime, get_members_path
+from .snapshot import load_snapshot
+
+class IdentityIndex:
+	"""
+	Groups names that refer to the same attendee.  Aliases are merged with union-find, so
+	chained aliases (an alias of an alias) resolve to the same canonical name.
+	"""
+	def __init__(self, members, keyholders, aliases):
+		"""
+		Build the index from the contents of the members file
+
+		members: Set of members (prospectives)
+		keyholders: Set of keyholders
+		aliases: Mapping of aliases to kerberoses
+		"""
+		self.members = members
+		self.keyholders = keyholders
+		self.aliases = aliases
+
+		# Union-find forest over every name mentioned in an alias
+		parent = {}
+
+		def find(name):
+			root = name
+			while parent[root] != root:
+				root = parent[root]
+			# Compress the path to the root
+			while parent[name] != root:
+				parent[name], name = root, parent[name]
+			return root
+
+		for alias, target in aliases.items():
+			parent.setdefault(alias, alias)
+			parent.setdefault(target, target)
+			alias_root, target_root = find(alias), find(target)
+			if alias_root != target_root:
+				parent[alias_root] = target_root
+
+		groups = {}
+		for name in parent:
+			groups.setdefault(find(name), []).append(name)
+
+		# Maps every aliased name to its canonical name
+		self.canonical = {}
+		# Maps canonical names to all names in their group, canonical name first
+		self.names = {}
+		for group in groups.values():
+			canonical = min(group, key=self.canonical_priority)
+			self.names[canonical] = [canonical] + sorted(name for name in group if name != canonical)
+			for name in group:
+				self.canonical[name] = canonical
+
+		# Maps canonical names to attendee types ("keyholder", "member" or "guest")
+		self.attendee_types = {}
+		for canonical, names in self.names.items():
+			self.attendee_types[canonical] = self.group_type(names)
+		for name in members | keyholders:
+			if name not in self.canonical:
+				self.attendee_types[name] = self.group_type([name])
+
+	def canonical_priority(self, name):
+		"""
+		Sort key choosing the canonical name of a group: keyholders first, then members, then
+		names which are not themselves aliases, then alphabetically
+		"""
+		return (name not in self.keyholders, name not in self.members, name in self.aliases, name)
+
+	def group_type(self, names):
+		"""
+		Get the attendee type of a group of names, which is the most senior type of any name
+		"""
+		if any(name in self.keyholders for name in names):
+			return "keyholder"
+		elif any(name in self.members for name in names):
+			return "member"
+		return "guest"
+
+	def get_canonical(self, name):
+		"""
+		Get the canonical name of an attendee
+		"""
+		return self.canonical.get(name, name)
+
+	def get_names(self, name):
+		"""
+		Get all names of an attendee, canonical name first
+		"""
+		canonical = self.get_canonical(name)
+		return self.names.get(canonical, [canonical])
+
+	def get_groups(self):
+		"""
+		Get all groups of names with more than one name, as lists with the canonical name first
+		"""
+		return self.names.values()
+
+	def get_attendee_type(self, name):
+		"""
+		Get the attendee type ("keyholder", "member" or "guest") of an attendee
+		"""
+		return self.attendee_types.get(self.get_canonical(name), "guest")
+
+# Maps the path of each members file to the mtime of the file and the index built from it
+_indexes = {}
+
+def get_identity_index():
+	"""
+	Get the identity index for the current members file, which is only rebuilt when the
+	members file changes.  The index is taken from the snapshot if it is current, so the
+	members file does not need to be parsed.
+	"""
+	path = get_members_path()
+	version = get_members_mtime()
+	index_version, index = _indexes.get(path, (None, None))
+	if index is None or version != index_version:
+		snapshot = load_snapshot()
+		if snapshot is not None:
+			index = snapshot["index"]
+		else:
+			index = IdentityIndex(*get_members_and_keyholders())
+		_indexes[path] = (version, index)
+	return index
@@ -1,4 +1,5 @@
 import datetime
+from .organizations import get_organization
 LOG = True
 PRINTTIME = True
 
@@ -9,6 +10,10 @@ def log(string=None, addto=None, addval=None, clear=None, logsum=None):
 		prefix = ""
 		if PRINTTIME:
 			prefix = str(datetime.datetime.now())
+		# Tell apart the logs of organizations being worked on at once
+		organization = get_organization()
+		if organization is not None:
+			prefix += " [" + organization.name + "]"
 
 		if addto is not None and addval is not None:
 			if addto in data:
@@ -0,0 +1,332 @@
+# This file defines the database schema as a list of versioned migrations, and checks the
+# queries issued by the api against the schema's indexes
+
+import sys
+import argparse
+from . import operations
+from .logging import log
+
+# Table recording which migrations have been applied
+MIGRATIONS_TABLE = ("CREATE TABLE IF NOT EXISTS schema_migrations ("
+			"version INT NOT NULL PRIMARY KEY, "
+			"description VARCHAR(255) NOT NULL, "
+			"applied_at DATETIME NOT NULL"
+			") CHARACTER SET utf8")
+
+# Migrations, in order.  Each is a tuple (version, description, statements), where each
+# statement is a query.  Applied migrations must never be edited; add a new migration to change
+# the schema.
+MIGRATIONS = [
+	(1, "Create attendance table", [
+		("CREATE TABLE IF NOT EXISTS attendance ("
+			"id INT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY, "
+			"meeting_date DATE NOT NULL, "
+			"attendee VARCHAR(64) NOT NULL, "
+			"attendee_type ENUM('STUDENT_KEYHOLDER', 'ASSOCIATE_KEYHOLDER', 'MEMBER', 'GUEST') NOT NULL, "
+			"inspection_required ENUM('NONE', 'WRONG_TYPE', 'NOT_FOUND') NOT NULL DEFAULT 'NONE'"
+			") CHARACTER SET utf8")
+	]),
+	(2, "Add unique key on (meeting_date, attendee), dropping duplicate records", [
+		# Rebuild the table, since the key cannot be added while duplicates exist
+		"DROP TABLE IF EXISTS attendance_new",
+		"CREATE TABLE attendance_new LIKE attendance",
+		"ALTER TABLE attendance_new ADD UNIQUE KEY attendance_date_attendee (meeting_date, attendee)",
+		"INSERT IGNORE INTO attendance_new SELECT * FROM attendance",
+		"RENAME TABLE attendance TO attendance_old, attendance_new TO attendance",
+		"DROP TABLE attendance_old"
+	]),
+	(3, "Add indexes for per-attendee and per-type queries", [
+		# Profiles: attendee IN (...) ordered/filtered by meeting_date
+		"CREATE INDEX attendance_attendee_date ON attendance (attendee, meeting_date)",
+		# Stats: GROUP BY meeting_date, attendee_type; includes attendee so COUNT(attendee)
+		# is answered from the index alone
+		"CREATE INDEX attendance_date_type ON attendance (meeting_date, attendee_type, attendee)"
+	]),
+	(4, "Add per-attendee summary table", [
+		("CREATE TABLE IF NOT EXISTS attendee_summary ("
+			"canonical VARCHAR(64) NOT NULL PRIMARY KEY, "
+			"first_attended DATE NOT NULL, "
+			"last_attended DATE NOT NULL, "
+			"total_attended INT UNSIGNED NOT NULL, "
+			"INDEX attendee_summary_last_attended (last_attended)"
+			") CHARACTER SET utf8"),
+		# Summarized by name; the first sync of the members file (see roster_sync) folds aliases
+		("INSERT IGNORE INTO attendee_summary (canonical, first_attended, last_attended, total_attended) "
+			"SELECT attendee, MIN(meeting_date), MAX(meeting_date), COUNT(*) FROM attendance GROUP BY attendee")
+	]),
+	(5, "Add table of ingested minutes files", [
+		("CREATE TABLE IF NOT EXISTS ingested_files ("
+			"filename VARCHAR(64) NOT NULL PRIMARY KEY, "
+			"path VARCHAR(255) NOT NULL, "
+			"meeting_date DATE NOT NULL, "
+			"exceptions_fingerprint CHAR(40) NOT NULL, "
+			"ingested_at DATETIME NOT NULL"
+			") CHARACTER SET utf8")
+	]),
+	(6, "Add table of name corrections and the CORRECTED inspection type", [
+		("ALTER TABLE attendance MODIFY inspection_required "
+			"ENUM('NONE', 'WRONG_TYPE', 'NOT_FOUND', 'CORRECTED') NOT NULL DEFAULT 'NONE'"),
+		("CREATE TABLE IF NOT EXISTS name_corrections ("
+			"meeting_date DATE NOT NULL, "
+			"original VARCHAR(64) NOT NULL, "
+			"corrected VARCHAR(64) NOT NULL, "
+			"distance TINYINT UNSIGNED NOT NULL, "
+			"confidence FLOAT NOT NULL, "
+			"PRIMARY KEY (meeting_date, original)"
+			") CHARACTER SET utf8")
+	]),
+	(7, "Add tables mirroring the members file", [
+		("CREATE TABLE IF NOT EXISTS roster_entries ("
+			"name VARCHAR(64) NOT NULL, "
+			"entry_type ENUM('keyholder', 'member', 'alias') NOT NULL, "
+			"alias_of VARCHAR(64) NOT NULL DEFAULT '', "
+			"PRIMARY KEY (name, entry_type, alias_of)"
+			") CHARACTER SET utf8"),
+		# Identity of each name in the members file, for joining against attendance
+		("CREATE TABLE IF NOT EXISTS attendee_identities ("
+			"name VARCHAR(64) NOT NULL PRIMARY KEY, "
+			"canonical VARCHAR(64) NOT NULL, "
+			"attendee_type ENUM('keyholder', 'member', 'guest') NOT NULL, "
+			"INDEX attendee_identities_canonical (canonical)"
+			") CHARACTER SET utf8"),
+		("CREATE TABLE IF NOT EXISTS roster_sync ("
+			"path VARCHAR(255) NOT NULL PRIMARY KEY, "
+			"members_mtime BIGINT NOT NULL, "
+			"synced_at DATETIME NOT NULL"
+			") CHARACTER SET utf8")
+		# The mirror is filled by the first sync, when attendance is next ingested or served
+	]),
+	(8, "Add a counter of writes to the attendance data", [
+		# The token identifies the database, so versions of a recreated database do not match
+		# versions cached (e.g. in the profile cache) from the one it replaced
+		("CREATE TABLE IF NOT EXISTS data_version ("
+			"id TINYINT UNSIGNED NOT NULL PRIMARY KEY, "
+			"token CHAR(36) NOT NULL, "
+			"version BIGINT UNSIGNED NOT NULL"
+			") CHARACTER SET utf8"),
+		"INSERT IGNORE INTO data_version (id, token, version) VALUES (1, UUID(), 0)"
+	]),
+	(9, "Add table of the names of past attendees found in the roster", [
+		("CREATE TABLE IF NOT EXISTS known_names ("
+			"name VARCHAR(64) NOT NULL PRIMARY KEY"
+			") CHARACTER SET utf8"),
+		("INSERT IGNORE INTO known_names (name) SELECT DISTINCT attendee FROM attendance "
+			"WHERE inspection_required = 'NONE' AND attendee_type <> 'GUEST'")
+	])
+]
+
+# Schema of the SQLite stand-in database (see operations.use_sqlite), equivalent to the schema
+# after all migrations.  It is created in one step, so it must be updated with each migration.
+SQLITE_SCHEMA_VERSION = 9
+SQLITE_MIGRATIONS_TABLE = ("CREATE TABLE IF NOT EXISTS schema_migrations ("
+			"version INTEGER NOT NULL PRIMARY KEY, "
+			"description TEXT NOT NULL, "
+			"applied_at DATETIME NOT NULL)")
+SQLITE_SCHEMA = [
+	("CREATE TABLE attendance ("
+		"id INTEGER PRIMARY KEY AUTOINCREMENT, "
+		"meeting_date DATE NOT NULL, "
+		"attendee TEXT NOT NULL, "
+		"attendee_type TEXT NOT NULL, "
+		"inspection_required TEXT NOT NULL DEFAULT 'NONE', "
+		"UNIQUE (meeting_date, attendee))"),
+	"CREATE INDEX attendance_attendee_date ON attendance (attendee, meeting_date)",
+	"CREATE INDEX attendance_date_type ON attendance (meeting_date, attendee_type, attendee)",
+	("CREATE TABLE attendee_summary ("
+		"canonical TEXT NOT NULL PRIMARY KEY, "
+		"first_attended DATE NOT NULL, "
+		"last_attended DATE NOT NULL, "
+		"total_attended INTEGER NOT NULL)"),
+	"CREATE INDEX attendee_summary_last_attended ON attendee_summary (last_attended)",
+	("CREATE TABLE ingested_files ("
+		"filename TEXT NOT NULL PRIMARY KEY, "
+		"path TEXT NOT NULL, "
+		"meeting_date DATE NOT NULL, "
+		"exceptions_fingerprint TEXT NOT NULL, "
+		"ingested_at DATETIME NOT NULL)"),
+	("CREATE TABLE name_corrections ("
+		"meeting_date DATE NOT NULL, "
+		"original TEXT NOT NULL, "
+		"corrected TEXT NOT NULL, "
+		"distance INTEGER NOT NULL, "
+		"confidence REAL NOT NULL, "
+		"PRIMARY KEY (meeting_date, original))"),
+	("CREATE TABLE roster_entries ("
+		"name TEXT NOT NULL, "
+		"entry_type TEXT NOT NULL, "
+		"alias_of TEXT NOT NULL DEFAULT '', "
+		"PRIMARY KEY (name, entry_type, alias_of))"),
+	("CREATE TABLE attendee_identities ("
+		"name TEXT NOT NULL PRIMARY KEY, "
+		"canonical TEXT NOT NULL, "
+		"attendee_type TEXT NOT NULL)"),
+	"CREATE INDEX attendee_identities_canonical ON attendee_identities (canonical)",
+	("CREATE TABLE roster_sync ("
+		"path TEXT NOT NULL PRIMARY KEY, "
+		"members_mtime INTEGER NOT NULL, "
+		"synced_at DATETIME NOT NULL)"),
+	("CREATE TABLE data_version ("
+		"id INTEGER NOT NULL PRIMARY KEY, "
+		"token TEXT NOT NULL, "
+		"version INTEGER NOT NULL)"),
+	"INSERT INTO data_version (id, token, version) VALUES (1, lower(hex(randomblob(16))), 0)",
+	"CREATE TABLE known_names (name TEXT NOT NULL PRIMARY KEY)"
+]
+
+def get_schema_version():
+	"""
+	Get the version of the latest migration applied to the database, or 0 if none are
+	"""
+	if operations.get_backend() == "sqlite":
+		operations.set_data(SQLITE_MIGRATIONS_TABLE, ())
+	else:
+		operations.set_data(MIGRATIONS_TABLE, ())
+	rows = operations.get_data("SELECT MAX(version) AS version FROM schema_migrations;", ())
+	if rows and rows[0]["version"] is not None:
+		return rows[0]["version"]
+	return 0
+
+def migrate(target=None):
+	"""
+	Apply all migrations which have not yet been applied
+
+	target: The version to migrate to, or None for the latest version
+
+	returns: The schema version after migrating
+	"""
+	version = get_schema_version()
+	if operations.get_backend() == "sqlite":
+		return migrate_sqlite(version, target)
+
+	for migration_version, description, statements in MIGRATIONS:
+		if migration_version <= version or target is not None and migration_version > target:
+			continue
+
+		log("Applying migration " + str(migration_version) + ": " + description)
+		for statement in statements:
+			operations.set_data(statement, ())
+		operations.set_data("INSERT INTO schema_migrations (version, description, applied_at) "
+							"VALUES (%s, %s, NOW())", (migration_version, description))
+		version = migration_version
+
+	log("Schema is at version " + str(version))
+	return version
+
+def migrate_sqlite(version, target=None):
+	"""
+	Create the schema of a SQLite stand-in database, which cannot be upgraded in place
+
+	version: The current schema version of the database
+	target: The version to migrate to, or None for the latest version.  A database can only be
+			created at the latest version.
+
+	returns: The schema version after migrating
+	"""
+	if version == 0 and target is not None and target < SQLITE_SCHEMA_VERSION:
+		raise RuntimeError("SQLite databases can only be created at schema version " + str(SQLITE_SCHEMA_VERSION) + \
+							", not version " + str(target))
+	elif version == 0:
+		log("Creating SQLite schema version " + str(SQLITE_SCHEMA_VERSION))
+		for statement in SQLITE_SCHEMA:
+			operations.set_data(statement, ())
+		operations.set_data("INSERT INTO schema_migrations (version, description, applied_at) "
+							"VALUES (%s, %s, NOW())", (SQLITE_SCHEMA_VERSION, "Create SQLite schema"))
+	elif version != SQLITE_SCHEMA_VERSION:
+		raise RuntimeError("SQLite database is at schema version " + str(version) + ", but version " + \
+							str(SQLITE_SCHEMA_VERSION) + " is required; delete it to recreate it")
+	return SQLITE_SCHEMA_VERSION
+
+def record_api_queries(attendee=None):
+	"""
+	Run the api functions and record the queries they issue
+
+	attendee: The attendee to request a profile for, or None for the most recent attendee
+
+	returns: A list of distinct (query, data) tuples
+	"""
+	# Imported here so that creating the schema does not require the members file
+	from . import api
+
+	if attendee is None:
+		rows = operations.get_attendance_records(fields=["attendee"], clauses=["ORDER BY meeting_date DESC", "LIMIT 1"])
+		attendee = rows[0]["attendee"] if rows else ""
+
+	operations.recorded_queries = []
+	try:
+		api.get_attendance_information(attendee)
+		api.get_attendance_records_list()
+		api.get_attendance_records_page(limit=50)
+		api.get_attendance_stats()
+		queries = operations.recorded_queries
+	finally:
+		operations.recorded_queries = None
+
+	distinct = []
+	for query, data in queries:
+		if (query, data) not in distinct:
+			distinct.append((query, data))
+	return distinct
+
+# Queries issued by the api which read a whole table or index on purpose, by their exact text:
+# the dates and stats of every meeting, the attendee summaries, and the roster, which lists
+# every name in the members file and reads the tables of names and counts it derives from them
+EXPECTED_FULL_SCAN_QUERIES = [
+	"SELECT meeting_date FROM attendance  GROUP BY meeting_date",
+	"SELECT meeting_date, attendee_type, COUNT(attendee) as attendee_count FROM attendance  GROUP BY meeting_date, attendee_type;",
+	"SELECT * FROM attendee_summary;",
+	operations.ROSTER_COUNT_QUERY,
+	operations.ROSTER_LIST_QUERY
+] + [operations.ROSTER_LIST_QUERY + " " + order + page for order in operations.ROSTER_ORDERS.values() \
+		for page in ["", " LIMIT %(limit)s OFFSET %(offset)s"]]
+
+def explain_api_queries(attendee=None):
+	"""
+	Run EXPLAIN on each query issued by the api, and flag any that scan a whole table or index,
+	other than the queries expected to
+
+	attendee: The attendee to request a profile for, or None for the most recent attendee
+
+	returns: A list of (query, plan rows, full scan) tuples
+	"""
+	results = []
+	for query, data in record_api_queries(attendee):
+		if operations.get_backend() == "sqlite":
+			plan = operations.get_data("EXPLAIN QUERY PLAN " + query, data)
+			# SQLite reports full table scans as "SCAN <table>", and full index scans as
+			# "SCAN <table> USING [COVERING] INDEX <index>"; index lookups are SEARCHes
+			full_scan = any(row["detail"].startswith("SCAN ") for row in plan)
+		else:
+			plan = operations.get_data("EXPLAIN " + query, data)
+			# MySQL reports full table scans as type ALL, and full index scans as type index
+			full_scan = any(row["type"] in ("ALL", "index") for row in plan)
+		full_scan = full_scan and query not in EXPECTED_FULL_SCAN_QUERIES
+		results.append((query, plan, full_scan))
+
+		log(("FULL SCAN: " if full_scan else "OK: ") + query)
+		for row in plan:
+			if operations.get_backend() == "sqlite":
+				log("    " + row["detail"])
+			else:
+				log("    table=" + str(row["table"]) + " type=" + str(row["type"]) + \
+					" key=" + str(row["key"]) + " rows=" + str(row["rows"]) + " extra=" + str(row["Extra"]))
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Manage the attendance database schema")
+	subparsers = parser.add_subparsers(dest="command", required=True)
+	migrate_parser = subparsers.add_parser("migrate", help="create or upgrade the schema")
+	migrate_parser.add_argument("--target", type=int, default=None, help="version to migrate to")
+	explain_parser = subparsers.add_parser("explain", help="flag api queries which scan a whole table or index")
+	explain_parser.add_argument("attendee", nargs="?", default=None, help="attendee to request a profile for")
+	parser.add_argument("--sqlite", default=None, help="use this SQLite stand-in database instead of MySQL")
+	args = parser.parse_args()
+
+	if args.sqlite is not None:
+		operations.use_sqlite(args.sqlite)
+
+	if args.command == "migrate":
+		migrate(args.target)
+	else:
+		results = explain_api_queries(args.attendee)
+		# Exit with an error if any query scans a whole table
+		sys.exit(1 if any(full_scan for _, _, full_scan in results) else 0)
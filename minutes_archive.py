@@ -0,0 +1,212 @@
+# This file reads minutes from packs and gzipped files as well as plain files.  A pack bundles
+# the minutes of a closed year (HISTORY/<year>_minutes) into a single file, so a rebuild reads
+# each year sequentially in one go instead of opening every weekly file over AFS.
+#
+# A pack is laid out as:
+#	PACK_MAGIC | minutes files, each optionally zlib-compressed | index | index offset | PACK_MAGIC
+# where the index is JSON mapping each filename to the offset and length of its data and whether
+# it is compressed, and the index offset is an unsigned 8-byte big-endian integer.
+#
+# The minutes in a pack are named <pack path>/<filename>, e.g.
+# HISTORY/2015_minutes.pack/minutes.2015-01-05, and a file minutes.2015-01-05.gz is listed (and
+# read) as minutes.2015-01-05.
+
+import os
+import zlib
+import gzip
+import json
+import struct
+import datetime
+import threading
+import collections
+from .logging import log
+
+# Suffixes of packs and gzipped minutes files
+PACK_SUFFIX = ".pack"
+GZIP_SUFFIX = ".gz"
+
+PACK_MAGIC = b"MINSPACK"
+PACK_FORMAT = 1
+# Layout of the index offset
+OFFSET_STRUCT = struct.Struct(">Q")
+
+# Number of packs kept in memory; a rebuild reads the years one after another
+PACK_CACHE_SIZE = 4
+
+# Packs in memory, least recently used first, mapping paths to (mtime, MinutesPack)
+_packs = collections.OrderedDict()
+_packs_lock = threading.Lock()
+
+class MinutesPack:
+	"""
+	A pack of minutes files, read into memory in one go
+	"""
+	def __init__(self, path):
+		"""
+		path: The path of the pack
+		"""
+		self.path = path
+		with open(path, "rb") as f:
+			self.data = f.read()
+
+		trailer_size = OFFSET_STRUCT.size + len(PACK_MAGIC)
+		if len(self.data) < len(PACK_MAGIC) + trailer_size or not self.data.startswith(PACK_MAGIC) \
+				or not self.data.endswith(PACK_MAGIC):
+			raise ValueError("not a minutes pack: " + path)
+		index_offset = OFFSET_STRUCT.unpack_from(self.data, len(self.data) - trailer_size)[0]
+		index = json.loads(self.data[index_offset:len(self.data) - trailer_size].decode("utf-8"))
+		if index["format"] != PACK_FORMAT:
+			raise ValueError("unsupported minutes pack format " + str(index["format"]) + ": " + path)
+		# Maps filenames to (offset, length, compressed) tuples
+		self.entries = { filename: tuple(entry) for filename, entry in index["entries"].items() }
+
+	def get_filenames(self):
+		return sorted(self.entries)
+
+	def read(self, filename):
+		"""
+		Get the contents of a minutes file in the pack, as bytes
+		"""
+		offset, length, compressed = self.entries[filename]
+		data = self.data[offset:offset + length]
+		return zlib.decompress(data) if compressed else data
+
+def write_pack(path, files, compress=False):
+	"""
+	Write a pack of minutes files, replacing any existing pack atomically
+
+	path: The path of the pack
+	files: Dictionary mapping filenames to their contents, as bytes
+	compress: If True, compress each file which is smaller compressed
+	"""
+	entries = {}
+	tmp_path = path + ".tmp"
+	with open(tmp_path, "wb") as f:
+		f.write(PACK_MAGIC)
+		offset = len(PACK_MAGIC)
+		for filename in sorted(files):
+			data = files[filename]
+			compressed = False
+			if compress:
+				compressed_data = zlib.compress(data, 9)
+				if len(compressed_data) < len(data):
+					data = compressed_data
+					compressed = True
+			f.write(data)
+			entries[filename] = (offset, len(data), compressed)
+			offset += len(data)
+
+		f.write(json.dumps({ "format": PACK_FORMAT, "entries": entries }, sort_keys=True).encode("utf-8"))
+		f.write(OFFSET_STRUCT.pack(offset))
+		f.write(PACK_MAGIC)
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(tmp_path, path)
+
+def get_pack(path):
+	"""
+	Get a pack, reading it if it is not in memory (or has been rewritten since it was read)
+	"""
+	mtime = os.stat(path).st_mtime_ns
+	with _packs_lock:
+		if path in _packs and _packs[path][0] == mtime:
+			_packs.move_to_end(path)
+			return _packs[path][1]
+
+	pack = MinutesPack(path)
+	with _packs_lock:
+		_packs[path] = (mtime, pack)
+		_packs.move_to_end(path)
+		while len(_packs) > PACK_CACHE_SIZE:
+			_packs.popitem(last=False)
+	return pack
+
+def is_pack(path):
+	return path.endswith(PACK_SUFFIX) and os.path.isfile(path)
+
+def list_minutes_directory(direc):
+	"""
+	Get the filenames of the minutes in a directory or pack, listing gzipped files without
+	their suffix
+	"""
+	if is_pack(direc):
+		return get_pack(direc).get_filenames()
+
+	filenames = set()
+	for file in os.listdir(direc):
+		if os.path.isfile(os.path.join(direc, file)):
+			filenames.add(file[:-len(GZIP_SUFFIX)] if file.endswith(GZIP_SUFFIX) else file)
+	return sorted(filenames)
+
+def read_minutes(path):
+	"""
+	Read a minutes file from a pack, a gzipped file or a plain file
+
+	path: The path of the minutes file, as <directory or pack>/<filename>
+
+	returns: The contents of the file, as text with universal newlines
+	"""
+	direc, filename = os.path.split(path)
+	if is_pack(direc):
+		data = get_pack(direc).read(filename)
+	else:
+		data = read_minutes_bytes(path)
+	# As when reading the file in text mode
+	return data.decode("latin-1").replace("\r\n", "\n").replace("\r", "\n")
+
+def read_minutes_bytes(path):
+	"""
+	Read a plain or gzipped minutes file (given without its .gz suffix) as bytes
+	"""
+	if not os.path.exists(path) and os.path.exists(path + GZIP_SUFFIX):
+		with gzip.open(path + GZIP_SUFFIX, "rb") as f:
+			return f.read()
+	with open(path, "rb") as f:
+		return f.read()
+
+def pack_directory(direc, compress=False):
+	"""
+	Pack the minutes in a directory into <directory>.pack, unless the pack is already newer than
+	every file in the directory
+
+	returns: True if the pack was written
+	"""
+	path = direc.rstrip(os.sep) + PACK_SUFFIX
+	filenames = list_minutes_directory(direc)
+	if os.path.exists(path):
+		pack_mtime = os.stat(path).st_mtime_ns
+		newest = max((os.stat(os.path.join(direc, file)).st_mtime_ns for file in os.listdir(direc) \
+						if os.path.isfile(os.path.join(direc, file))), default=0)
+		if newest <= pack_mtime and get_pack(path).get_filenames() == filenames:
+			return False
+
+	files = { filename: read_minutes_bytes(os.path.join(direc, filename)) for filename in filenames }
+	write_pack(path, files, compress)
+	log("Packed " + str(len(files)) + " minutes files into " + path)
+	return True
+
+def pack_history(history_path, compress=False, before_year=None):
+	"""
+	Pack the minutes of each closed year in the history directory
+
+	history_path: The HISTORY directory, containing <year>_minutes directories
+	compress: If True, compress the minutes in the packs
+	before_year: Only pack years before this one, or None for years before the current year
+
+	returns: The paths of the packs written
+	"""
+	# Imported here since collect_all_attendance imports this module
+	from .collect_all_attendance import dir_in_range
+
+	if before_year is None:
+		before_year = datetime.date.today().year
+	written = []
+	for direc in sorted(os.listdir(history_path)):
+		if not os.path.isdir(os.path.join(history_path, direc)):
+			continue
+		in_range, year = dir_in_range(direc, 0)
+		if year is None or year >= before_year:
+			continue
+		if pack_directory(os.path.join(history_path, direc), compress):
+			written.append(os.path.join(history_path, direc) + PACK_SUFFIX)
+	return written
@@ -4,8 +4,24 @@ import re
 import os
 import json
 import datetime
-from .preprocessing_exceptions import process_exception
-from .operations import add_attendance_record
+import time
+import queue
+import signal
+import threading
+import atexit
+import contextlib
+import contextvars
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from .preprocessing_exceptions import process_exception, get_exceptions_fingerprint
+from .operations import add_attendance_records, get_attendance_records, set_attendee_summaries, delete_attendee_summaries, \
+	add_ingested_files, add_name_corrections, replace_meeting_records, get_attendees, get_attendee_summaries
+from .snapshot import invalidate_snapshot, write_snapshot
+from .spool import SpoolFlusher
+from .minutes_archive import read_minutes
+from .name_correction import is_applied
+from .organizations import get_organization, run_in_organization
 from .logging import log
 
 # File that lists members (keyholders) and prospectives (members)
@@ -38,6 +54,17 @@ START_MEETING_STRING = "|".join(START_MEETING_TITLES)
 # Seniority order of member types, used to determine which to mark an attendee as if they appear multiple times
 SENIORITY_ORDER = ["associate_keyholders", "keyholders", "members", "guests"]
 
+# Number of attendance records written to the database at once
+WRITE_CHUNK_SIZE = 500
+# Number of parsed meetings which may be waiting to be written before parsing pauses
+PARSE_QUEUE_SIZE = 8
+
+# Pool of processes minutes are parsed in, started when it is first needed.  It is usually
+# first needed in a thread (prefetching minutes, or ingesting one of several organizations), so
+# its processes are spawned rather than forked from a process with other threads running.
+parse_pool = None
+parse_pool_lock = threading.Lock()
+
 
 def split_list_by(lst, sepfunc, includesep):
 	"""
@@ -65,12 +92,104 @@ def split_list_by(lst, sepfunc, includesep):
 # The end of an attendee block is marked by either:
 # 	1) One of the known "meeting start" strings, OR
 #	2) A double newline (which must not be followed by a token)
-STOP_TOKEN = '\n\s*(' + START_MEETING_STRING + ')|(\n\n\s*\w+)'
+# Matches are only tried at the start of a run of whitespace: a match starting later in the run
+# would also match from its start, since both end with the first word after the run.  Trying
+# every newline in the run would rescan the rest of the run from each one, which takes time
+# quadratic in its length (e.g. thousands of lines holding only spaces).  The token starts at
+# the first newline (or double newline) of the run, captured as the newline (or blank_line)
+# group; see token_start.
+STOP_TOKEN = '(?<!\s)[^\S\n]*(?P<newline>\n)\s*(' + START_MEETING_STRING + ')|' + \
+				'((?<!\s)(?:[^\S\n]|\n(?!\n))*(?P<blank_line>\n\n)\s*\w+)'
 # The start of an attendee block is marked by a line containing
 # "Minutes of the [SIPB/SIPB Special/etc] Meeting"
-START_TOKEN = '(^|\n)\s*Minutes of the [\w ]+ Meeting'
+START_TOKEN = '(^|(?<!\s)[^\S\n]*(?P<newline>\n))\s*Minutes of the [\w ]+ Meeting'
+
+def token_start(match):
+	"""
+	Get the position a start or stop token starts at: its first newline (or double newline),
+	rather than the whitespace before it which the regex also matches
+	"""
+	for group in ("newline", "blank_line"):
+		if group in match.re.groupindex and match.start(group) != -1:
+			return match.start(group)
+	return match.start(0)
+
+# Seconds a single minutes file may take to parse before it is skipped and reported
+PARSE_TIME_BUDGET = 10
 
-def token_generator(tokens, minutes):
+class ParseTimeout(Exception):
+	"""
+	Raised when parsing a minutes file takes longer than its time budget
+	"""
+	pass
+
+class ParseStats:
+	"""
+	Measurements of parsing a single minutes file
+	"""
+	__slots__ = ("path", "bytes", "seconds", "calls", "searches", "matches", "timed_out", "start", "deadline")
+
+	def __init__(self, path, time_budget=None):
+		"""
+		path: The path of the minutes file
+		time_budget: Seconds parsing may take before ParseTimeout is raised, or None for no limit
+		"""
+		self.path = path
+		self.bytes = 0
+		self.seconds = 0.0
+		# Number of token_generator calls, regex searches they made, and searches that matched
+		self.calls = 0
+		self.searches = 0
+		self.matches = 0
+		self.timed_out = False
+		self.start = time.perf_counter()
+		self.deadline = self.start + time_budget if time_budget is not None else None
+
+	def search(self, pattern, string):
+		"""
+		Search for a regex, counting the search and checking the time budget
+		"""
+		match = re.search(pattern, string)
+		self.searches += 1
+		if match:
+			self.matches += 1
+		if self.deadline is not None and time.perf_counter() > self.deadline:
+			raise ParseTimeout(self.path)
+		return match
+
+	def finish(self):
+		self.seconds = time.perf_counter() - self.start
+
+@contextlib.contextmanager
+def time_limit(seconds):
+	"""
+	Raise ParseTimeout if the body takes longer than a number of seconds, even within a single
+	regex search.  Only the main thread of a process can be interrupted, so files with a time
+	budget are parsed in worker processes (see parse_minutes_files).
+	"""
+	if seconds is None:
+		yield
+		return
+	if threading.current_thread() is not threading.main_thread():
+		raise RuntimeError("a parse time budget can only be enforced in the main thread; parse in a worker process")
+	if not hasattr(signal, "setitimer"):
+		# Searches are still checked against the budget, but a single search cannot be interrupted
+		log("Parse time budgets cannot interrupt a regex search on this platform")
+		yield
+		return
+
+	def interrupt(signum, frame):
+		raise ParseTimeout()
+
+	previous = signal.signal(signal.SIGALRM, interrupt)
+	signal.setitimer(signal.ITIMER_REAL, seconds)
+	try:
+		yield
+	finally:
+		signal.setitimer(signal.ITIMER_REAL, 0)
+		signal.signal(signal.SIGALRM, previous)
+
+def token_generator(tokens, minutes, stats=None):
 	"""
 	Generates blocks of attendee tokens.  Most minutes will only have one block, but there are 
 	exceptions with multiple attendee blocks, such as a meeting within a meeting.
@@ -78,6 +197,7 @@ def token_generator(tokens, minutes):
 	tokens: A mapping of token types (keyholders, associate_keyholders, members, guests) to
 			regexes which define where a list of that type of attendees starts.
 	minutes: A string containing the meeting minutes to parse
+	stats: Optional ParseStats to count the regex searches in, and check the time budget of
 
 	return: A list of tuples (token_type, start, end) where token_type is the type of attendee
 			token, and start and end are the start and end positions of that token.  Each
@@ -85,6 +205,13 @@ def token_generator(tokens, minutes):
 			stop that indicates where the block ends.  Tokens are indicators of where attendee
 			lists are, defined by the regex and the start/stop tokens above.
 	"""
+	if stats is None:
+		search = re.search
+	else:
+		search = stats.search
+		stats.calls += 1
+		stats.bytes += len(minutes)
+
 	# Cursor in the minutes, current position to search from
 	current_index = 0
 	# Stores the regex match to the start of the next block of attendee tokens,
@@ -93,7 +220,7 @@ def token_generator(tokens, minutes):
 
 	# Start the cursor after the first start token (which may be the start of the minutes,
 	# if no such token is found
-	first_block = re.search(START_TOKEN, minutes[current_index:])
+	first_block = search(START_TOKEN, minutes[current_index:])
 	
 	if first_block:
 		current_index = first_block.end(0)
@@ -101,13 +228,13 @@ def token_generator(tokens, minutes):
 	# Continue yielding blocks while there are blocks found
 	while next_block:
 		# Find the next batch of tokens starting at the cursor
-		matches = [ (token_type, re.search(tokens[token_type], minutes[current_index:])) for token_type in tokens]
+		matches = [ (token_type, search(tokens[token_type], minutes[current_index:])) for token_type in tokens]
 
 		# Find the beginning of the next block
-		next_block = re.search(START_TOKEN, minutes[current_index:])
+		next_block = search(START_TOKEN, minutes[current_index:])
 		
 		if next_block:
-			next_block_index = next_block.start(0)
+			next_block_index = token_start(next_block)
 		else:
 			next_block_index = len(minutes[current_index:])
 
@@ -130,12 +257,12 @@ def token_generator(tokens, minutes):
 			# Look for a stop codon after the last attendee token and before the start of the
 			# next block
 			last_token_index = tokens_in_block[-1][2]
-			stop_match = re.search(STOP_TOKEN, minutes[last_token_index:next_block_index+current_index])
+			stop_match = search(STOP_TOKEN, minutes[last_token_index:next_block_index+current_index])
 			
 			if stop_match:
 				# Append the stop token and return it
 				tokens_in_block.append(('stop', \
-										last_token_index + stop_match.start(0), \
+										last_token_index + token_start(stop_match), \
 										last_token_index + stop_match.end(0)))
 				yield tokens_in_block
 				
@@ -165,16 +292,17 @@ class AttendeeExtractor:
 			'guests': guests
 		}
 
-	def get_attendees(self, minutes, f):
+	def get_attendees(self, minutes, f, stats=None):
 		"""
 		Parse a minutes file to extract the attendees based on the attendee regexes
 
 		minutes: A minutes string to parse
 		f: the name of the minutes file, for logging purposes
+		stats: Optional ParseStats to record the parse in
 		"""
 
 		# Get the blocks of attendee tokens
-		block_generator = token_generator(self.attendee_types, minutes)
+		block_generator = token_generator(self.attendee_types, minutes, stats)
 		blocks = [block for block in block_generator]
 
 		# Initialize the attendees
@@ -264,14 +392,13 @@ class Format:
 		else:
 			return False
 
-	def get_attendees(self, file):
-		with open(file, 'r', encoding="latin-1") as f:
-			# Read minutes
-			minutes = f.read()
-			# Process any exceptions first
-			minutes = process_exception(os.path.basename(file), minutes)
-			# Extract attendees
-			return self.attendees.get_attendees(minutes, file)
+	def get_attendees(self, file, stats=None):
+		# Read minutes, from a pack or gzipped file if the minutes have been archived
+		minutes = read_minutes(file)
+		# Process any exceptions first
+		minutes = process_exception(os.path.basename(file), minutes)
+		# Extract attendees
+		return self.attendees.get_attendees(minutes, file, stats)
 
 # Two formats in use since 2010
 FORMATS = [
@@ -291,13 +418,37 @@ FORMATS = [
 								'Guests:'))
 ]
 
+def get_members_path():
+	"""
+	Get the members file of the organization being worked on
+	"""
+	organization = get_organization()
+	if organization is not None:
+		return organization.members_path
+	return members_path
+
+def get_formats():
+	"""
+	Get the minutes formats of the organization being worked on
+	"""
+	organization = get_organization()
+	if organization is not None and organization.formats is not None:
+		return organization.formats
+	return FORMATS
+
+def get_members_mtime():
+	"""
+	Get the modification time of the members_and_prospectives file
+	"""
+	return os.stat(get_members_path()).st_mtime_ns
+
 def get_members_and_keyholders():
 	"""
 	Read the members_and_prospectives file to extract members and keyholders
 	"""
 
 	# Read members and prospectives file
-	with open(members_path) as f:
+	with open(get_members_path()) as f:
 		lines = f.readlines()
 
 	# Get non-commented lines
@@ -321,36 +472,217 @@ def get_members_and_keyholders():
 	return members, keyholders, aliases
 
 
+def get_format(file):
+	"""
+	Get the format a minutes file falls under, or None if it is not a minutes file
+
+	file: The filename of the minutes file
+	"""
+	for format in get_formats():
+		if format.is_in_range(file):
+			return format
+	return None
+
+def parse_minutes_file(path):
+	"""
+	Parse a single minutes file
+
+	path: The path of the minutes file
+
+	returns: A tuple (path, date, attendees), where attendees is a dictionary mapping attendee
+			 types to sets of attendees for the meeting on that date
+	"""
+	format = get_format(os.path.basename(path))
+	return path, format.get_date(os.path.basename(path)), format.get_attendees(path)
+
+def profile_minutes_file(path, time_budget=PARSE_TIME_BUDGET):
+	"""
+	Parse a single minutes file, measuring the parse and giving up after a time budget
+
+	path: The path of the minutes file
+	time_budget: Seconds the file may take to parse, or None for no limit
+
+	returns: A tuple (path, date, attendees, stats), as for parse_minutes_file, where stats is a
+			 ParseStats and attendees is None if the file took longer than its budget
+	"""
+	format = get_format(os.path.basename(path))
+	stats = ParseStats(path, time_budget)
+	try:
+		with time_limit(time_budget):
+			attendees = format.get_attendees(path, stats)
+	except ParseTimeout:
+		attendees = None
+		stats.timed_out = True
+	stats.finish()
+	return path, format.get_date(os.path.basename(path)), attendees, stats
+
+def get_parse_pool(jobs):
+	"""
+	Get the pool of processes minutes are parsed in, which is shared by every ingest in this
+	process (e.g. of several organizations at once), starting it if this has not been done yet
+
+	jobs: Number of processes to start the pool with; a pool which was already started keeps
+		  its size, so ingests running at once share its processes
+	"""
+	global parse_pool
+	with parse_pool_lock:
+		if parse_pool is None:
+			parse_pool = ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"))
+		return parse_pool
+
+def shutdown_parse_pool():
+	"""
+	Stop the pool of processes minutes are parsed in, if it was started
+	"""
+	global parse_pool
+	with parse_pool_lock:
+		if parse_pool is not None:
+			parse_pool.shutdown()
+			parse_pool = None
+
+atexit.register(shutdown_parse_pool)
+
+def parse_minutes_files(files, jobs=1, time_budget=PARSE_TIME_BUDGET, on_parsed=None):
+	"""
+	Parse a list of minutes files a few at a time, as the results are consumed.  Files which
+	take longer than the time budget to parse are skipped and reported.
+
+	files: mapping of directories to filenames in those directories which contain minutes to
+	get the attendance from
+	jobs: Number of processes to parse files in; files are parsed in this process if 1 and
+		  there is no time budget
+	time_budget: Seconds each file may take to parse, or None for no limit.  Only the main
+				 thread of a process can be interrupted, and this generator is usually consumed
+				 in a background thread (see prefetch), so files with a budget are always
+				 parsed in worker processes.
+	on_parsed: Optional function called with the ParseStats of each file, including skipped files
+
+	returns: A generator of (path, date, attendees) tuples, in the order of files, where
+			 attendees is a dictionary mapping attendee types to sets of attendees for the
+			 meeting on that date
+	"""
+
+	def get_paths():
+		# Dates which have already been found
+		seen_dates = set()
+
+		# Loop over all files
+		for direc in files:
+			for file in files[direc]:
+				# Find the format the file falls under
+				format = get_format(file)
+				if format is None:
+					continue
+
+				date = format.get_date(file)
+				if date in seen_dates:
+					log("Skipping duplicate minutes file " + os.path.join(direc, file))
+				else:
+					seen_dates.add(date)
+					yield os.path.join(direc, file)
+
+	def get_results():
+		if jobs <= 1 and time_budget is None:
+			for path in get_paths():
+				yield profile_minutes_file(path, time_budget)
+			return
+
+		executor = get_parse_pool(max(jobs, 1))
+		# Parse processes do not share the context of this thread, so are told the organization
+		organization = get_organization()
+		# Only keep a few files per process in flight, so results are not buffered without bound
+		pending = collections.deque()
+		try:
+			for path in get_paths():
+				pending.append(executor.submit(run_in_organization, organization, profile_minutes_file, path, time_budget))
+				if len(pending) >= 2 * max(jobs, 1):
+					yield pending.popleft().result()
+			while pending:
+				yield pending.popleft().result()
+		finally:
+			for future in pending:
+				future.cancel()
+
+	for path, date, attendees, stats in get_results():
+		if on_parsed is not None:
+			on_parsed(stats)
+		if attendees is None:
+			log("Skipping " + path + ": parsing took longer than " + str(time_budget) + "s, inspect it for " \
+				"whitespace or formatting which the attendee regexes backtrack on")
+			continue
+		yield path, date, attendees
+
 def get_attendance(files):
 	"""
-	Get attendance from a list of files
+	Get attendance from a list of files.  Files are parsed one at a time as the results
+	are consumed, so the whole history is never held in memory at once.
 
 	files: mapping of directories to filenames in those directories which contain minutes to
 	get the attendance from
+
+	returns: A generator of (date, attendees) tuples, where attendees is a dictionary mapping
+			 attendee types to sets of attendees for the meeting on that date
 	"""
+	for path, date, attendees in parse_minutes_files(files):
+		yield date, attendees
 
-	# Mapping of dates to attendance dictionaries, which map attendee types to sets of attendees
-	attendance = {}
+def get_ingested_file(path, date):
+	"""
+	Get the record of a minutes file having been ingested, as passed to add_ingested_files
 
-	# Loop over all files
-	for direc in files:
-		for file in files[direc]:
-			# Loop over all formats to see which one the file falls under
-			for format in FORMATS:
-				if format.is_in_range(file):
-					# Get attendees for this file
-					attendees = format.get_attendees(os.path.join(direc, file))
-					date = format.get_date(file)
-					attendance[date] = attendees
-					# Don't check other formats
-					break
+	path: The path of the minutes file
+	date: The date of the meeting
+	"""
+	filename = os.path.basename(path)
+	return (filename, path, date, get_exceptions_fingerprint(filename))
 
-	# Uncomment to send attendance results to attendance.json file
-	# j = { str(date) : { mem_type: list(attendance[date][mem_type]) for mem_type in attendance[date]} for date in attendance }
-	# with open('attendance.json', 'w') as f:
-	# 	json.dump(j, f, indent=4)
+def prefetch(iterable, queue_size=PARSE_QUEUE_SIZE):
+	"""
+	Consume an iterable in a background thread, so that producing items (e.g. parsing minutes)
+	overlaps with whatever the caller does with them (e.g. writing to the database)
+
+	iterable: The iterable to consume
+	queue_size: The maximum number of items produced ahead of the caller; the background
+				thread blocks once this many are waiting
 
-	return attendance
+	returns: A generator of the items of the iterable, in order
+	"""
+	items = queue.Queue(maxsize=queue_size)
+	stopped = threading.Event()
+	# Marks the end of the iterable
+	done = object()
+
+	def produce():
+		try:
+			for item in iterable:
+				# Give up if the caller has stopped consuming
+				while not stopped.is_set():
+					try:
+						items.put((item, None), timeout=1)
+						break
+					except queue.Full:
+						pass
+				if stopped.is_set():
+					return
+			items.put((done, None))
+		except Exception as e:
+			# Pass the error on to the caller
+			items.put((done, e))
+
+	# The thread works on the same organization as the caller
+	producer = threading.Thread(target=contextvars.copy_context().run, args=(produce,), daemon=True)
+	producer.start()
+
+	try:
+		while True:
+			item, error = items.get()
+			if error is not None:
+				raise error
+			if item is done:
+				break
+			yield item
+	finally:
+		stopped.set()
 
 # Mapping of attendee types so their database values
 ATTENDEE_TYPES = {
@@ -360,47 +692,307 @@ ATTENDEE_TYPES = {
         "guests": "GUEST"
 }
 
-def add_to_db(attendance):
+def get_attendance_rows(date, attendees, index, corrector=None):
+	"""
+	Get the database rows recording the attendance of a meeting, flagging attendees which
+	require manual inspection
+
+	date: The date of the meeting
+	attendees: Dictionary mapping attendee types to sets of attendees
+	index: The identity index to look attendees up in
+	corrector: Optional name_correction.NameCorrector, to correct misspelled names of attendees
+			   listed as members or keyholders which are not in the members file
+
+	returns: A list of (meeting_date, attendee, attendee_type, inspection_required) tuples, and
+			 a list of (meeting_date, original, corrected, distance, confidence) tuples for the
+			 names which were corrected, or which were left for inspection with a suggested
+			 correction (see name_correction.is_applied)
+	"""
+	rows = []
+	corrections = []
+	# Names listed at the meeting, which a misspelled name must not be corrected to
+	listed = set().union(*attendees.values())
+	for member_type in attendees:
+		for member in sorted(attendees[member_type]):
+			# By default, no manual inspection is required
+			inspection_required = "NONE"
+			
+			# Type of the attendee (or the kerberos they are an alias of) in the members file
+			attendee_type = index.get_attendee_type(member)
+
+			if member_type == "associate_keyholders" or member_type == "keyholders":
+				if attendee_type != "keyholder":
+					if attendee_type == "member":
+						# Attendee is a member, but was listed as a keyholder
+						inspection_required = "WRONG_TYPE"
+					else:
+						# Attendee not found in file, but was listed as a keyholder
+						inspection_required = "NOT_FOUND"
+			
+			elif member_type == "members":
+				# Inspection not required if listed as member but are actually a keyholder, since
+				# minutes could be from prior to keyholdership
+				if attendee_type == "guest":
+					# Attendee not found in file, but was listed as a member
+					inspection_required = "NOT_FOUND"
+
+			attendee = member
+			if inspection_required == "NOT_FOUND" and corrector is not None:
+				correction = corrector.correct(member)
+				if correction is not None and correction[0] not in listed:
+					corrected, distance, confidence = correction
+					if is_applied(member, distance):
+						listed.add(corrected)
+						attendee = corrected
+						inspection_required = "CORRECTED"
+					corrections.append((date, member, corrected, distance, confidence))
+
+			rows.append((date, attendee, ATTENDEE_TYPES[member_type], inspection_required))
+	return rows, corrections
+
+def log_corrections(corrections):
+	"""
+	Log the name corrections made in a meeting's records, as returned by get_attendance_rows
+	"""
+	for date, original, corrected, distance, confidence in corrections:
+		if is_applied(original, distance):
+			log("Corrected " + original + " to " + corrected + " (confidence " + str(confidence) + ")")
+		else:
+			log("Left " + original + " for inspection, which may be " + corrected + " (confidence " + str(confidence) + ")")
+
+def add_to_db(attendance, chunk_size=WRITE_CHUNK_SIZE, replace=False, on_commit=None, attendees_to_update=None):
 	"""
 	Add attendance information to the database
 	
-	attendance: Dictionary of dates mapping to attendance information for the meeting on that date,
-				which are dictionaries mapping attendee types to sets of attendees
+	attendance: Iterable of (date, attendees) tuples, as generated by get_attendance, where
+				attendees is a dictionary mapping attendee types to sets of attendees for the
+				meeting on that date.  A dictionary mapping dates to attendees is also accepted.
+	chunk_size: Number of attendance records to write to the database at once
+	replace: If True, replace any existing records of each meeting in one transaction per
+			 meeting, instead of adding records in chunks
+	on_commit: Optional function called with the list of dates of the meetings whose records
+			   have just been committed
+	attendees_to_update: Optional set of further attendees whose summaries should be
+						 recomputed, e.g. the attendees of meetings written by an earlier run
+
+	returns: The set of attendees which had attendance records added (or removed, if replacing)
 	"""
-
-	# Get list of members and keyholderes
-	members, keyholders, aliases = get_members_and_keyholders()
+	if isinstance(attendance, dict):
+		attendance = attendance.items()
+
+	# The identity module imports this one, so it cannot be imported at the top
+	from .identity import get_identity_index
+	from .name_correction import get_name_corrector
+	from .roster_sync import sync_roster
+	index = get_identity_index()
+	# Records are classified against the members file, so its mirror should match
+	sync_roster()
+	# Corrects misspelled names, remembering each name looked up during this run
+	corrector = get_name_corrector(index)
+	# The snapshot would be stale as soon as records are written
+	invalidate_snapshot()
+	# Attendees whose records were added (and any others whose summaries should be updated)
+	added_attendees = set(attendees_to_update or ())
+	# Records (and name corrections, and meeting dates) waiting to be written
+	chunk = []
+	chunk_corrections = []
+	chunk_dates = []
 	
 	# Go through each attendee
-	for date in attendance:
+	for date, attendees in attendance:
 		log("Adding attendance for " + str(date))
-		for member_type in attendance[date]:
-			log("Adding attendance for " + str(len(attendance[date][member_type])) + " " + member_type)
-			for member in attendance[date][member_type]:
-				# By default, no manual inspection is required
-				inspection_required = "NONE"
-				
-				# True if the attendee is an alias to a kerberos listed as a keyholder
-				aliased_keyholder = member in aliases and aliases[member] in keyholders
-
-				if member_type == "associate_keyholders" or member_type == "keyholders":
-					if member not in keyholders and not aliased_keyholder:
-						if member in members:
-							# Attendee is a member, but was listed as a keyholder
-							inspection_required = "WRONG_TYPE"
-						else:
-							# Attendee not found in file, but was listed as a keyholder
-							inspection_required = "NOT_FOUND"
-                
-				elif member_type == "members":
-					# Inspection not required if listed as member but are actually a keyholder, since
-					# minutes could be from prior to keyholdership
-					if member not in members and member not in keyholders and not aliased_keyholder:
-						# Attendee not found in file, but was listed as a member
-						inspection_required = "NOT_FOUND"
-                
-				# Add to the database
-				add_attendance_record(date, member, ATTENDEE_TYPES[member_type], inspection_required)
-				log(addto="attendance records added", addval=1)
+		for member_type in attendees:
+			log("Adding attendance for " + str(len(attendees[member_type])) + " " + member_type)
+			added_attendees |= attendees[member_type]
+
+		rows, corrections = get_attendance_rows(date, attendees, index, corrector)
+		log_corrections(corrections)
+		added_attendees |= { row[1] for row in rows if row[3] == "CORRECTED" }
+
+		if replace:
+			# Attendees of the existing records may be removed
+			added_attendees |= { record["attendee"] for record in get_attendance_records(fields=["attendee"], options={"start_date": date, "end_date": date}) }
+			replace_meeting_records(date, rows, corrections=corrections)
+			log(addto="attendance records added", addval=len(rows))
+			if on_commit is not None:
+				on_commit([date])
+			continue
+
+		# Queue the records to be added to the database
+		chunk.extend(rows)
+		chunk_corrections.extend(corrections)
+		chunk_dates.append(date)
+
+		if len(chunk) >= chunk_size:
+			# Add the records to the database
+			add_attendance_records(chunk)
+			add_name_corrections(chunk_corrections)
+			log(addto="attendance records added", addval=len(chunk))
+			if on_commit is not None:
+				on_commit(chunk_dates)
+			chunk = []
+			chunk_corrections = []
+			chunk_dates = []
+
+	if chunk_dates:
+		add_attendance_records(chunk)
+		add_name_corrections(chunk_corrections)
+		log(addto="attendance records added", addval=len(chunk))
+		if on_commit is not None:
+			on_commit(chunk_dates)
 	
 	log(logsum="attendance records added")
+
+	update_attendee_summaries(added_attendees, index)
+	write_snapshot()
+	return added_attendees
+
+def add_to_spool(attendance, spool, chunk_size=WRITE_CHUNK_SIZE, replace=False, on_commit=None, attendees_to_update=None):
+	"""
+	Add attendance to the database through a spool.  The records of each meeting are saved to
+	the spool as soon as they are parsed, and written to the database in the background, so
+	parsing does not wait on the database.  If the database cannot be written to, the records
+	stay in the spool and are written by the next ingest.
+
+	attendance: An iterable of (date, attendees, ingested_files) tuples, where attendees is a
+				dictionary mapping attendee types to sets of attendees and ingested_files are
+				the files the meeting was parsed from, as returned by get_ingested_file
+	spool: The spool.Spool to save records to
+	chunk_size: Number of attendance records to write to the database at once
+	replace: If True, replace any existing records of each meeting, as in add_to_db
+	on_commit: Optional function called with the list of spool entries whose records have just
+			   been committed
+	attendees_to_update: Optional set of further attendees whose summaries should be recomputed
+
+	returns: The set of attendees which had attendance records added (or removed, if replacing)
+	"""
+	from .identity import get_identity_index
+	from .name_correction import get_name_corrector
+	from .roster_sync import sync_roster
+	index = get_identity_index()
+	# Records are classified against the members file, so its mirror should match
+	sync_roster()
+	corrector = get_name_corrector(index)
+	invalidate_snapshot()
+
+	# Write any records left in the spool by an earlier run first, then each meeting as it is saved
+	flusher = SpoolFlusher(spool, chunk_size, on_commit)
+	flusher.start()
+	try:
+		for date, attendees, ingested_files in attendance:
+			log("Adding attendance for " + str(date))
+			for member_type in attendees:
+				log("Adding attendance for " + str(len(attendees[member_type])) + " " + member_type)
+
+			rows, corrections = get_attendance_rows(date, attendees, index, corrector)
+			log_corrections(corrections)
+			spool.append(date, rows, corrections, ingested_files, replace)
+	finally:
+		flushed = flusher.finish()
+
+	if not flushed:
+		log("Could not write to the database; the attendance parsed is kept in " + spool.path + \
+			" and will be written by the next ingest")
+		raise flusher.error
+	log(logsum="attendance records added")
+
+	added_attendees = flusher.affected | set(attendees_to_update or ())
+	update_attendee_summaries(added_attendees, index)
+	write_snapshot()
+	# Every record is in the database and summarized
+	spool.clear()
+	return added_attendees
+
+def update_attendee_summaries(attendees, index):
+	"""
+	Recompute the first attended, last attended and total attended summaries of the canonical
+	attendees of a set of attendees, from their records in the database
+
+	attendees: An iterable of names/kerberoses
+	index: The identity index to group names by
+	"""
+	canonicals = { index.get_canonical(attendee) for attendee in attendees }
+	summaries = []
+
+	# Attendees with only one name can be summarized in a single query
+	single_names = [canonical for canonical in canonicals if len(index.get_names(canonical)) == 1]
+	if single_names:
+		fields = ["attendee", "MIN(meeting_date) AS first_attended", "MAX(meeting_date) AS last_attended", "COUNT(*) AS total_attended"]
+		rows = get_attendance_records(fields=fields, clauses=["GROUP BY attendee"], options={"attendee": single_names})
+		summaries.extend((row["attendee"], row["first_attended"], row["last_attended"], row["total_attended"]) for row in rows)
+
+	# Attendees with several names may appear under more than one at a meeting, so count
+	# distinct meeting dates
+	fields = ["MIN(meeting_date) AS first_attended", "MAX(meeting_date) AS last_attended", "COUNT(DISTINCT meeting_date) AS total_attended"]
+	for canonical in canonicals:
+		names = index.get_names(canonical)
+		if len(names) > 1:
+			row = get_attendance_records(fields=fields, options={"attendee": names})[0]
+			if row["total_attended"]:
+				summaries.append((canonical, row["first_attended"], row["last_attended"], row["total_attended"]))
+
+	set_attendee_summaries(summaries)
+	# Remove summaries of attendees which no longer have any records, and summaries stored
+	# under names which are now aliases
+	summarized = { summary[0] for summary in summaries }
+	removed = [canonical for canonical in canonicals if canonical not in summarized]
+	removed.extend(name for canonical in canonicals for name in index.get_names(canonical)[1:])
+	delete_attendee_summaries(removed)
+	log("Updated " + str(len(summaries)) + " attendee summaries")
+
+def ingest(files, chunk_size=WRITE_CHUNK_SIZE, queue_size=PARSE_QUEUE_SIZE, jobs=1, replace=False, checkpoint=None, \
+			time_budget=PARSE_TIME_BUDGET, spool=None):
+	"""
+	Parse minutes files and add their attendance to the database.  Files are parsed in a
+	background thread while earlier meetings are written, and at most queue_size parsed
+	meetings are held in memory.
+
+	files: mapping of directories to filenames in those directories which contain minutes
+	chunk_size: Number of attendance records to write to the database at once
+	queue_size: Number of parsed meetings which may be waiting to be written
+	jobs: Number of processes to parse files in
+	replace: If True, replace any existing records of the meetings parsed, as in add_to_db
+	checkpoint: Optional checkpoint.Checkpoint to record files in once their meetings are
+				committed.  Files already committed are not parsed again.
+	time_budget: Seconds each file may take to parse before it is skipped and reported
+	spool: Optional spool.Spool to save parsed meetings to before they are written, as in
+		   add_to_spool.  Files whose meetings are still in the spool are not parsed again.
+
+	returns: The set of attendees which had attendance records added
+	"""
+	attendees_to_update = None
+	if spool is not None:
+		files = spool.skip_spooled(files)
+	if checkpoint is not None:
+		files = checkpoint.skip_committed(files)
+		if checkpoint.committed:
+			# The interrupted run did not get as far as updating summaries, so the summaries of
+			# everyone it may have added or removed are recomputed
+			attendees_to_update = set(get_attendees()) | set(get_attendee_summaries())
+
+	# Files which were parsed, by meeting date, until their attendance has been written
+	parsed_files = {}
+
+	def record_files(parsed):
+		for path, date, attendees in parsed:
+			parsed_files.setdefault(date, []).append(get_ingested_file(path, date))
+			yield date, attendees
+
+	def commit_files(dates):
+		ingested_files = [ingested_file for date in dates for ingested_file in parsed_files.pop(date, [])]
+		add_ingested_files(ingested_files)
+		if checkpoint is not None:
+			checkpoint.record(ingested_file[0] for ingested_file in ingested_files)
+
+	parsed = prefetch(parse_minutes_files(files, jobs, time_budget), queue_size)
+	if spool is not None:
+		def commit_entries(entries):
+			if checkpoint is not None:
+				checkpoint.record(ingested_file[0] for entry in entries for ingested_file in entry["ingested_files"])
+
+		spooled = ((date, attendees, [get_ingested_file(path, date)]) for path, date, attendees in parsed)
+		return add_to_spool(spooled, spool, chunk_size=chunk_size, replace=replace, on_commit=commit_entries, \
+							attendees_to_update=attendees_to_update)
+
+	return add_to_db(record_files(parsed), chunk_size=chunk_size, replace=replace, on_commit=commit_files, \
+					attendees_to_update=attendees_to_update)
@@ -0,0 +1,159 @@
+# This file corrects misspelled attendee names (e.g. "mwtheng" for "mtheng") by matching them
+# against the roster and the names of past attendees.  Names are looked up in an index of
+# deletion variants, so only a few known names are compared against each name.  Preprocessing
+# exceptions take precedence over corrections: a name written by an exception is never corrected.
+# A short name one edit from a known name is as likely someone new (e.g. a member listed before
+# the members file is updated), so such corrections are only suggested and left for inspection.
+
+from . import operations
+from .preprocessing_exceptions import get_replaced_names
+
+# Names this short are too ambiguous to correct
+MIN_CORRECTION_LENGTH = 4
+
+# Largest edit distance a name may be corrected over
+MAX_DISTANCE = 2
+
+# Corrections with a lower confidence are not applied, and the name is left for inspection
+MIN_CONFIDENCE = 0.7
+
+# Corrections by a single edit of names this long or shorter are recorded, but not applied
+MAX_SUGGESTED_LENGTH = 6
+
+def get_max_distance(name):
+	"""
+	Get the largest edit distance a name may be corrected over, which grows with its length
+	"""
+	if len(name) < MIN_CORRECTION_LENGTH:
+		return 0
+	elif len(name) <= 6:
+		return 1
+	else:
+		return MAX_DISTANCE
+
+def is_applied(name, distance):
+	"""
+	Check whether the correction of a name over an edit distance is applied to its records,
+	rather than only recorded with the records left for inspection
+	"""
+	return distance > 1 or len(name) > MAX_SUGGESTED_LENGTH
+
+def edit_distance(a, b, limit=None):
+	"""
+	Get the Levenshtein distance between two strings
+
+	limit: If given, stop as soon as the distance is known to exceed limit, and return limit + 1
+	"""
+	if limit is not None and abs(len(a) - len(b)) > limit:
+		return limit + 1
+
+	previous = list(range(len(b) + 1))
+	for i, a_char in enumerate(a, 1):
+		current = [i]
+		for j, b_char in enumerate(b, 1):
+			current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a_char != b_char)))
+		if limit is not None and min(current) > limit:
+			return limit + 1
+		previous = current
+	return previous[-1]
+
+def get_deletions(name, max_deletions):
+	"""
+	Get every string formed by deleting up to a number of characters from a name, including
+	the name itself
+	"""
+	deletions = {name}
+	frontier = {name}
+	for _ in range(max_deletions):
+		frontier = { variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant)) }
+		deletions |= frontier
+	return deletions
+
+class DeletionIndex:
+	"""
+	Index of names by the strings formed by deleting characters from them.  Two names within
+	an edit distance share such a string with at most that many deletions from each, so only
+	names sharing one need to be compared.
+	"""
+	def __init__(self, names=(), max_distance=MAX_DISTANCE):
+		self.max_distance = max_distance
+		# Maps each deletion variant to the names it was formed from
+		self.variants = {}
+		for name in names:
+			self.add(name)
+
+	def add(self, name):
+		"""
+		Add a name to the index
+		"""
+		for variant in get_deletions(name, self.max_distance):
+			self.variants.setdefault(variant, []).append(name)
+
+	def search(self, name, max_distance):
+		"""
+		Find the names within an edit distance (at most the index's max_distance) of a name
+
+		returns: A list of (distance, name) tuples, closest first
+		"""
+		candidates = set()
+		for variant in get_deletions(name, max_distance):
+			candidates.update(self.variants.get(variant, ()))
+
+		matches = []
+		for candidate in candidates:
+			distance = edit_distance(name, candidate, max_distance)
+			if distance <= max_distance:
+				matches.append((distance, candidate))
+		return sorted(matches)
+
+class NameCorrector:
+	"""
+	Corrects names which are not in the roster to the closest known name, remembering each
+	name it has looked up
+	"""
+	def __init__(self, names, excepted=()):
+		"""
+		names: Iterable of known names
+		excepted: Iterable of names written by preprocessing exceptions, which are not corrected
+		"""
+		self.names = set(names)
+		self.excepted = set(excepted)
+		self.index = DeletionIndex(self.names)
+		# Lookups made so far, mapping names to their corrections
+		self.memo = {}
+
+	def correct(self, name):
+		"""
+		Find the correction of a name
+
+		returns: A (corrected name, edit distance, confidence) tuple, or None if the name is
+				 known or was written by an exception, or has no single close enough match
+		"""
+		if name in self.memo:
+			return self.memo[name]
+
+		correction = None
+		if name not in self.names and name not in self.excepted:
+			max_distance = get_max_distance(name)
+			matches = self.index.search(name, max_distance) if max_distance else []
+			# A name equally close to several known names is ambiguous
+			if matches and (len(matches) == 1 or matches[1][0] > matches[0][0]):
+				distance, corrected = matches[0]
+				confidence = round(1 - distance / max(len(name), len(corrected)), 3)
+				if confidence >= MIN_CONFIDENCE:
+					correction = (corrected, distance, confidence)
+
+		self.memo[name] = correction
+		return correction
+
+def get_name_corrector(index):
+	"""
+	Build a name corrector for an ingestion run, from the roster and the names of past attendees
+	which were found in the roster when they were ingested
+
+	index: The identity index of the members file
+	"""
+	names = index.members | index.keyholders | set(index.canonical)
+	# Recorded as attendance is written, so the attendance table is not scanned
+	names |= operations.get_known_names()
+	return NameCorrector(names, get_replaced_names())
@@ -1,29 +1,275 @@
 import os
+import re
 import json
-import mysql.connector
+import hashlib
+import datetime
+import threading
+import contextlib
+import collections
 from .logging import log
+from .organizations import get_organization
 
 # Flag to disable writing to database (for debugging purposes)
 NO_WRITE_DB = False
 
+# Database backend: "mysql", or "sqlite" for a local stand-in database (see use_sqlite)
+BACKEND = "mysql"
+
 # Load in database authentication
 # Contains values:
 #	- user
 #	- password
 db_auth_file = "db_auth.json"
 db_auth_file = os.path.join(os.path.dirname(__file__), db_auth_file)
-with open(db_auth_file, "r") as f:
-	db_auth = json.load(f)
 
-# Connect to database
-connection = mysql.connector.connect(
-		host="sql.mit.edu",
+# If not None, a list to which the (query, data) of every query run by get_data is appended
+recorded_queries = None
+
+# Attendee lists longer than this are filtered by joining a temporary table instead of with one
+# placeholder per name, so queries stay the same size however long the list is
+LARGE_FILTER_SIZE = 50
+# Number of temporary filter tables kept on the connection for reuse
+FILTER_TABLE_LIMIT = 32
+
+def connect_mysql(host="sql.mit.edu", database="gshay+sipb_attendance", auth_file=None):
+	"""
+	Connect to a MySQL database
+
+	auth_file: File containing the user and password, or None for db_auth_file
+	"""
+	import mysql.connector
+
+	with open(auth_file if auth_file is not None else db_auth_file, "r") as f:
+		db_auth = json.load(f)
+
+	return mysql.connector.connect(
+		host=host,
 		user=db_auth["user"],
 		password=db_auth["password"],
 		charset="utf8",
-		database="gshay+sipb_attendance")
+		database=database)
+
+def connect_sqlite(path):
+	"""
+	Connect to a SQLite database
+	"""
+	import sqlite3
+
+	sqlite3.register_adapter(datetime.date, str)
+	return sqlite3.connect(path, check_same_thread=False)
+
+# Opens a connection to the default database
+connect_default = connect_mysql
+
+# Number of connections each MySQL database keeps open, i.e. how many threads may use it at once.
+# A SQLite database has a single connection, since each connection to ":memory:" is a separate
+# database and SQLite serializes writes anyway.
+CONNECTION_POOL_SIZE = 4
+
+class Database:
+	"""
+	The database of an organization, with a pool of connections (each opened when it is first
+	needed, with the temporary filter tables on it).  A thread holds one connection of the pool
+	while it runs queries, so threads do not wait on each other unless the pool is exhausted.
+	"""
+	def __init__(self, connect, backend="mysql", pool_size=None):
+		"""
+		connect: Function of no arguments which opens a connection to the database
+		backend: "mysql" or "sqlite"
+		pool_size: Number of connections, or None for CONNECTION_POOL_SIZE (1 for SQLite)
+		"""
+		if pool_size is None:
+			pool_size = 1 if backend == "sqlite" else CONNECTION_POOL_SIZE
+		self.connect = connect
+		self.backend = backend
+		# Limits the connections held at once to the size of the pool
+		self.available = threading.BoundedSemaphore(pool_size)
+		self.idle_lock = threading.Lock()
+		# Connections not held by any thread, as (connection, filter tables) tuples
+		self.idle = []
+		# The connection held by each thread, with its filter tables and how deeply it is held
+		self.local = threading.local()
+
+	@contextlib.contextmanager
+	def hold(self):
+		"""
+		Hold a connection of the pool for the duration of a with block.  Holding it again within
+		the block (in the same thread) holds the same connection.
+		"""
+		if getattr(self.local, "depth", 0):
+			self.local.depth += 1
+			try:
+				yield
+			finally:
+				self.local.depth -= 1
+			return
+
+		self.available.acquire()
+		with self.idle_lock:
+			# A connection which has not been opened yet is opened when it is first used
+			self.local.connection, self.local.filter_tables = self.idle.pop() if self.idle else (None, collections.OrderedDict())
+		self.local.depth = 1
+		try:
+			yield
+		finally:
+			self.local.depth = 0
+			with self.idle_lock:
+				if self.local.connection is not None:
+					self.idle.append((self.local.connection, self.local.filter_tables))
+			self.local.connection = None
+			self.available.release()
+
+def mysql_database(host="sql.mit.edu", database="gshay+sipb_attendance", auth_file=None):
+	"""
+	Get a MySQL Database, for an organizations.Organization
+	"""
+	return Database(lambda: connect_mysql(host, database, auth_file), "mysql")
+
+def sqlite_database(path):
+	"""
+	Get a SQLite stand-in Database, for an organizations.Organization.  Use migrations.migrate
+	within the organization to create the schema.
+	"""
+	return Database(lambda: connect_sqlite(path), "sqlite")
+
+# Database used when no organization is being worked on, created when it is first needed
+default_database = None
+default_database_lock = threading.Lock()
+
+def get_database():
+	"""
+	Get the Database of the organization being worked on, or the default database
+	"""
+	global default_database
+	organization = get_organization()
+	if organization is not None:
+		if organization.database is None:
+			# e.g. in a parse process, which is not sent the database
+			raise RuntimeError("Organization " + organization.name + " has no database here")
+		return organization.database
+
+	with default_database_lock:
+		if default_database is None:
+			default_database = Database(lambda: connect_default(), BACKEND)
+		return default_database
+
+def get_lock():
+	"""
+	Get a context manager holding a connection to the database in use.  Queries are run on the
+	connection held by the thread, so it must be held until their results have been read.
+	"""
+	return get_database().hold()
+
+def get_backend():
+	"""
+	Get the backend of the database in use, "mysql" or "sqlite"
+	"""
+	return get_database().backend
+
+def get_connection():
+	"""
+	Get the connection held by this thread (see get_lock), connecting if this has not been done yet
+	"""
+	database = get_database()
+	if not getattr(database.local, "depth", 0):
+		raise RuntimeError("get_connection must be called while holding a connection with get_lock")
+	if database.local.connection is None:
+		database.local.connection = database.connect()
+		organization = get_organization()
+		log("Connected to database" + (" of " + organization.name if organization is not None else ""))
+	return database.local.connection
+
+def get_filter_tables():
+	"""
+	Get the temporary filter tables on the connection held by this thread, oldest first
+	"""
+	return get_database().local.filter_tables
+
+def reset_connection():
+	"""
+	Close the connection to the database in use held by this thread, e.g. after it failed, so
+	that the next query opens a new one
+	"""
+	database = get_database()
+	with get_lock():
+		if database.local.connection is not None:
+			try:
+				database.local.connection.close()
+			except Exception:
+				# The connection may already be broken
+				pass
+		database.local.connection = None
+		# Temporary tables went with the connection
+		database.local.filter_tables = collections.OrderedDict()
+
+def get_database_errors():
+	"""
+	Get the exception types raised when the database fails (e.g. the connection drops), which
+	are worth retrying
+	"""
+	import sqlite3
+
+	errors = [OSError, sqlite3.Error]
+	try:
+		import mysql.connector
+		errors.append(mysql.connector.Error)
+	except ImportError:
+		pass
+	return tuple(errors)
+
+def use_sqlite(path):
+	"""
+	Use a local SQLite database as a stand-in for the default MySQL database, e.g. for testing.
+	Queries are translated from MySQL syntax as they are run.  Use migrations.migrate to create
+	the schema.
+
+	path: Path of the SQLite database file, or ":memory:"
+	"""
+	global default_database, connect_default, BACKEND
+	with default_database_lock:
+		connect_default = lambda: connect_sqlite(path)
+		BACKEND = "sqlite"
+		default_database = Database(connect_default, BACKEND)
+	log("Using SQLite database " + path)
+
+# Dates are stored as text in SQLite, and are converted back when read
+SQLITE_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
 
-log("Connected to database")
+def translate_query(query):
+	"""
+	Translate a MySQL query to the database backend in use
+	"""
+	if get_backend() != "sqlite":
+		return query
+
+	query = re.sub(r"%\((\w+)\)s", r":\1", query)
+	query = query.replace("%s", "?")
+	query = query.replace("INSERT IGNORE", "INSERT OR IGNORE")
+	query = query.replace("ON DUPLICATE KEY UPDATE", "ON CONFLICT DO UPDATE SET")
+	query = re.sub(r"VALUES\((\w+)\)", r"excluded.\1", query)
+	query = query.replace("NOW()", "CURRENT_TIMESTAMP")
+	return query
+
+def get_cursor(dictionary=False):
+	"""
+	Get a cursor on the database connection
+
+	dictionary: True if rows should be returned as dictionaries
+	"""
+	if get_backend() == "sqlite":
+		return get_connection().cursor()
+	return get_connection().cursor(dictionary=dictionary)
+
+def fetch_rows(cur):
+	"""
+	Fetch all rows from a cursor created with get_cursor(dictionary=True), as dictionaries
+	"""
+	rows = cur.fetchall()
+	if get_backend() == "sqlite":
+		names = [column[0] for column in cur.description]
+		rows = [{ name: datetime.date.fromisoformat(value) if isinstance(value, str) and SQLITE_DATE.fullmatch(value) else value \
+					for name, value in zip(names, row) } for row in rows]
+	return rows
 
 def get_data(query, data):
 	"""
@@ -34,27 +280,82 @@ def get_data(query, data):
 
 	returns: rows matching the query, which are dictionaries containing the requested data fields
 	"""
-	# Execute query
-	cur = connection.cursor(dictionary=True)
-	cur.execute(query, data)
-	# Get rows
-	rows = cur.fetchall()
-	# Close cursor
-	cur.close()
+	if recorded_queries is not None:
+		recorded_queries.append((query, data))
+
+	with get_lock():
+		# Execute query
+		cur = get_cursor(dictionary=True)
+		cur.execute(translate_query(query), data)
+		# Get rows
+		rows = fetch_rows(cur)
+		# Close cursor
+		cur.close()
 	return rows
 
-def set_data(query, data):
+# Counts the writes to the attendance data, so that results computed from it (and cached) can be
+# recognized as stale, including when past meetings are rewritten
+BUMP_DATA_VERSION_QUERY = "UPDATE data_version SET version = version + 1 WHERE id = 1"
+
+def get_data_version():
+	"""
+	Get the version of the attendance data: the token identifying the database and the number
+	of writes made to it, which every write increases in the same transaction
+	"""
+	rows = get_data("SELECT token, version FROM data_version WHERE id = 1;", ())
+	return rows[0]["token"] + "." + str(rows[0]["version"])
+
+def set_data(query, data, bump_version=False):
 	"""
 	Insert data into the database
+
+	bump_version: True if the query changes the attendance data, so the data version is increased
 	"""
 	if not NO_WRITE_DB:
 		# Only if writing to the database is not disabled
-		cur = connection.cursor()
-		cur.execute(query, data)
-		# Commit the executed query
-		connection.commit()
-		# Close the cursor
-		cur.close()
+		with get_lock():
+			cur = get_cursor()
+			cur.execute(translate_query(query), data)
+			if bump_version:
+				cur.execute(BUMP_DATA_VERSION_QUERY)
+			# Commit the executed query
+			get_connection().commit()
+			# Close the cursor
+			cur.close()
+
+# Adds an attendance record, replacing any existing record for the attendee at that meeting
+ADD_ATTENDANCE_QUERY = ("INSERT INTO attendance "
+			"(meeting_date, attendee, attendee_type, inspection_required) "
+			"VALUES (%s, %s, %s, %s) "
+			"ON DUPLICATE KEY UPDATE attendee_type = VALUES(attendee_type), "
+			"inspection_required = VALUES(inspection_required)")
+
+# Records the name of an attendee found in the roster when their attendance was ingested, which
+# the name corrector treats as correctly spelled
+ADD_KNOWN_NAME_QUERY = "INSERT IGNORE INTO known_names (name) VALUES (%s)"
+
+def get_known_name_rows(records):
+	"""
+	Get the rows of known_names to add with attendance records: the names of the attendees
+	found in the roster, who are not guests
+
+	records: A list of (meeting_date, attendee, attendee_type, inspection_required) tuples
+	"""
+	return sorted({ (record[1],) for record in records if record[3] == "NONE" and record[2] != "GUEST" })
+
+# Records the minutes file a meeting's attendance was ingested from
+ADD_INGESTED_FILE_QUERY = ("INSERT INTO ingested_files "
+			"(filename, path, meeting_date, exceptions_fingerprint, ingested_at) "
+			"VALUES (%s, %s, %s, %s, NOW()) "
+			"ON DUPLICATE KEY UPDATE path = VALUES(path), meeting_date = VALUES(meeting_date), "
+			"exceptions_fingerprint = VALUES(exceptions_fingerprint), ingested_at = VALUES(ingested_at)")
+
+# Records the correction of a misspelled attendee name at a meeting
+ADD_NAME_CORRECTION_QUERY = ("INSERT INTO name_corrections "
+			"(meeting_date, original, corrected, distance, confidence) "
+			"VALUES (%s, %s, %s, %s, %s) "
+			"ON DUPLICATE KEY UPDATE corrected = VALUES(corrected), distance = VALUES(distance), "
+			"confidence = VALUES(confidence)")
 
 def add_attendance_record(meeting_date, attendee, attendee_type, inspection_required):
 	"""
@@ -67,20 +368,232 @@ def add_attendance_record(meeting_date, attendee, attendee_type, inspection_requ
 						is required for this entry
 	"""
 
-	data = (meeting_date, attendee, attendee_type, inspection_required)
-	query = ("INSERT INTO attendance "
-			"(meeting_date, attendee, attendee_type, inspection_required) "
-			"VALUES (%s, %s, %s, %s)")
+	add_attendance_records([(meeting_date, attendee, attendee_type, inspection_required)])
+
+def set_many_data(query, rows, bump_version=False):
+	"""
+	Insert many rows of data into the database with a single commit
+
+	query: A string query, containing %s for each parameter
+	rows: A list of tuples of parameters, one per row
+	bump_version: True if the query changes the attendance data, as for set_data
+	"""
+	if not NO_WRITE_DB and rows:
+		# Only if writing to the database is not disabled
+		with get_lock():
+			cur = get_cursor()
+			cur.executemany(translate_query(query), rows)
+			if bump_version:
+				cur.execute(BUMP_DATA_VERSION_QUERY)
+			# Commit all rows at once
+			get_connection().commit()
+			# Close the cursor
+			cur.close()
+
+def add_attendance_records(records):
+	"""
+	Add many attendance records to the database at once
+
+	records: A list of (meeting_date, attendee, attendee_type, inspection_required) tuples,
+			 as passed to add_attendance_record
+	"""
+	if records:
+		add_attendance_batch(records, [], [])
+
+def replace_meeting_records(meeting_date, records, ingested_file=None, corrections=None):
+	"""
+	Replace all attendance records (and name corrections) of a meeting in a single transaction,
+	so the meeting is never left partially updated
+
+	meeting_date: The date of the meeting
+	records: A list of (meeting_date, attendee, attendee_type, inspection_required) tuples
+	ingested_file: Optional (filename, path, meeting_date, exceptions_fingerprint) tuple to
+				   record the file the records were parsed from, as in add_ingested_files
+	corrections: Optional list of name corrections made in the records, as in add_name_corrections
+	"""
+	if NO_WRITE_DB:
+		return
+
+	with get_lock():
+		cur = get_cursor()
+		try:
+			cur.execute(translate_query("DELETE FROM attendance WHERE meeting_date = %s"), (str(meeting_date),))
+			cur.execute(translate_query("DELETE FROM name_corrections WHERE meeting_date = %s"), (str(meeting_date),))
+			if records:
+				cur.executemany(translate_query(ADD_ATTENDANCE_QUERY), records)
+				cur.executemany(translate_query(ADD_KNOWN_NAME_QUERY), get_known_name_rows(records))
+			if corrections:
+				cur.executemany(translate_query(ADD_NAME_CORRECTION_QUERY), corrections)
+			if ingested_file is not None:
+				cur.execute(translate_query(ADD_INGESTED_FILE_QUERY), ingested_file)
+			cur.execute(BUMP_DATA_VERSION_QUERY)
+			get_connection().commit()
+		except Exception:
+			# Leave the meeting as it was
+			get_connection().rollback()
+			raise
+		finally:
+			cur.close()
+
+def add_attendance_batch(records, corrections, ingested_files):
+	"""
+	Add attendance records, with the name corrections made in them and the minutes files they
+	were parsed from, in a single transaction
+
+	records: A list of (meeting_date, attendee, attendee_type, inspection_required) tuples
+	corrections: A list of name corrections, as in add_name_corrections
+	ingested_files: A list of ingested files, as in add_ingested_files
+	"""
+	if NO_WRITE_DB:
+		return
 
-	set_data(query, data)
+	with get_lock():
+		cur = get_cursor()
+		try:
+			if records:
+				cur.executemany(translate_query(ADD_ATTENDANCE_QUERY), records)
+				cur.executemany(translate_query(ADD_KNOWN_NAME_QUERY), get_known_name_rows(records))
+			if corrections:
+				cur.executemany(translate_query(ADD_NAME_CORRECTION_QUERY), corrections)
+			if ingested_files:
+				cur.executemany(translate_query(ADD_INGESTED_FILE_QUERY), ingested_files)
+			cur.execute(BUMP_DATA_VERSION_QUERY)
+			get_connection().commit()
+		except Exception:
+			# Write all or nothing, so the batch can be retried
+			get_connection().rollback()
+			raise
+		finally:
+			cur.close()
+
+def get_known_names():
+	"""
+	Get the names of past attendees which were found in the roster when they were ingested
+	"""
+	return { row["name"] for row in get_data("SELECT name FROM known_names;", ()) }
+
+def add_name_corrections(corrections):
+	"""
+	Record corrections of misspelled attendee names
+
+	corrections: A list of (meeting_date, original, corrected, distance, confidence) tuples,
+				 where distance is the edit distance between the names and confidence is
+				 between 0 and 1
+	"""
+	set_many_data(ADD_NAME_CORRECTION_QUERY, corrections, bump_version=True)
+
+def get_name_corrections(options=None):
+	"""
+	Get the recorded corrections of misspelled attendee names, least confident first
+
+	options: Optional dictionary with start_date and/or end_date to limit the meetings
+	"""
+	date_options = { key: options[key] for key in ("start_date", "end_date") if key in options } if options else None
+	with get_lock():
+		where_clause, values = construct_where_clause(date_options)
+		return get_data("SELECT * FROM name_corrections " + where_clause + " ORDER BY confidence, meeting_date;", values)
+
+# Meetings with name corrections of names which are now in the members file, with the minutes
+# files they were ingested from (if recorded)
+STALE_CORRECTIONS_QUERY = ("SELECT DISTINCT name_corrections.meeting_date AS meeting_date, ingested_files.path AS path "
+			"FROM name_corrections "
+			"JOIN attendee_identities ON attendee_identities.name = name_corrections.original "
+			"LEFT JOIN ingested_files ON ingested_files.meeting_date = name_corrections.meeting_date "
+			"ORDER BY name_corrections.meeting_date")
+
+def get_stale_corrections():
+	"""
+	Get the meetings in which a name was corrected (or left with a suggested correction) which
+	has since been added to the members file, so the correction no longer holds
+
+	returns: A list of rows containing meeting_date, and path, the minutes file the meeting was
+			 ingested from, or None if it was not recorded
+	"""
+	return get_data(STALE_CORRECTIONS_QUERY, ())
+
+def add_ingested_files(ingested_files):
+	"""
+	Record the minutes files attendance was ingested from
+
+	ingested_files: A list of (filename, path, meeting_date, exceptions_fingerprint) tuples, where
+					exceptions_fingerprint identifies the preprocessing exceptions applied
+	"""
+	set_many_data(ADD_INGESTED_FILE_QUERY, ingested_files)
+
+def get_ingested_files():
+	"""
+	Get the minutes files attendance was ingested from
+
+	returns: A dictionary mapping filenames to rows containing path, meeting_date and
+			 exceptions_fingerprint
+	"""
+	rows = get_data("SELECT * FROM ingested_files;", ())
+	return { row["filename"]: row for row in rows }
+
+def get_filter_table(names):
+	"""
+	Get a temporary table containing a list of attendees, creating it on the connection if it
+	does not exist yet.  Tables are named by a digest of the names they contain, so filtering on
+	the same list again reuses the table.  The connection held by get_lock must be held until the
+	query using the table has run, so that the table is not dropped in between.
+
+	names: The list of attendees
+
+	returns: The name of the table, which has a single attendee column
+	"""
+	with get_lock():
+		# Temporary tables only exist on the connection they were created on
+		tables = get_filter_tables()
+
+		names = sorted(set(names))
+		table = "attendee_filter_" + hashlib.sha1("\n".join(names).encode("utf-8")).hexdigest()[:16]
+		if table in tables:
+			tables.move_to_end(table)
+			return table
+
+		cur = get_cursor()
+		try:
+			cur.execute(translate_query("CREATE TEMPORARY TABLE IF NOT EXISTS " + table + \
+										" (attendee VARCHAR(64) NOT NULL PRIMARY KEY)"))
+			cur.executemany(translate_query("INSERT IGNORE INTO " + table + " (attendee) VALUES (%s)"), \
+							[(name,) for name in names])
+			tables[table] = True
+
+			if len(tables) > FILTER_TABLE_LIMIT:
+				oldest, _ = tables.popitem(last=False)
+				if get_backend() == "sqlite":
+					cur.execute("DROP TABLE IF EXISTS temp." + oldest)
+				else:
+					cur.execute("DROP TEMPORARY TABLE IF EXISTS " + oldest)
+			get_connection().commit()
+		finally:
+			cur.close()
+		return table
+
+def attendee_in_clause(names, prefix, values):
+	"""
+	Get a selector matching attendees in a list, adding any parameters it needs to values
+
+	names: The list of attendees
+	prefix: Prefix of the names of the parameters
+	values: Dictionary of parameters of the query
+	"""
+	if len(names) > LARGE_FILTER_SIZE:
+		return "attendee IN (SELECT attendee FROM " + get_filter_table(names) + ")"
+
+	for i, name in enumerate(names):
+		values[prefix + "_" + str(i)] = name
+	return "attendee IN (" + ", ".join(["%(" + prefix + "_" + str(n) + ")s" for n in range(len(names))]) + ")"
 
 def construct_where_clause(options):
 	"""
 	Constructs a where clause for the attendance table based on a dictionary
-	of options
+	of options.  Long lists of attendees are filtered with a temporary table, so the
+	connection held by get_lock must be held until the query using the clause has run.
 
 	Supported options:
 	- attendee: query for only this attendee (or a list of attendees)
+	- canonical: query for all names of the attendee with this canonical name
 	- start_date: query for meetings on this date or after
 	- end_date: query for meetings on this date or before
 	- attendee_type: query for only this type of attendee
@@ -93,11 +606,14 @@ def construct_where_clause(options):
 	values = {}
 
 	# Construct where clause and values list from options
+	if "canonical" in options:
+		# Imported here since the identity index depends on this module
+		from .identity import get_identity_index
+		names = get_identity_index().get_names(options["canonical"])
+		selectors.append(attendee_in_clause(names, "canonical", values))
 	if "attendee" in options:
 		if isinstance(options["attendee"], list):
-			selectors.append("attendee IN (" + ", ".join(["%(attendee_" + str(n) + ")s" for n in range(len(options["attendee"]))]) + ")")
-			for i, attendee in enumerate(options["attendee"]):
-				values["attendee_" + str(i)] = attendee
+			selectors.append(attendee_in_clause(options["attendee"], "attendee", values))
 		elif isinstance(options["attendee"], str):
 			selectors.append("attendee = %(attendee)s")
 			values["attendee"] = options["attendee"]
@@ -114,11 +630,10 @@ def construct_where_clause(options):
 		selectors.append("inspection_required = %(inspection_required)s")
 		values["inspection_required"] = options["inspection_required"]
 
-	# AND together the where clauses
-	query_where = "(" +  " AND ".join(["(" + selector + ")" for selector in selectors]) + ")"
-
 	# Add where clause if it exists
-	if query_where:
+	if selectors:
+		# AND together the where clauses
+		query_where = "(" +  " AND ".join(["(" + selector + ")" for selector in selectors]) + ")"
 		return "WHERE " + query_where, values
 	else:
 		return "", values
@@ -138,15 +653,17 @@ def get_attendance_records(fields=None, clauses=None, options=None):
 
 	query = "SELECT " + field_string + " FROM attendance "
 	
-	where_clause, values = construct_where_clause(options)
-	query += where_clause
+	# The where clause may filter with a temporary table, which must remain until the query has run
+	with get_lock():
+		where_clause, values = construct_where_clause(options)
+		query += where_clause
 
-	if clauses is not None:
-		query += " " + " ".join(clauses)
+		if clauses is not None:
+			query += " " + " ".join(clauses)
 
-	query += ";"
-	# Get data from database
-	return get_data(query, values)
+		query += ";"
+		# Get data from database
+		return get_data(query, values)
 
 
 def get_meeting_dates(options=None):
@@ -155,24 +672,249 @@ def get_meeting_dates(options=None):
 	"""
 	# Select meeting date from database
 	query = "SELECT meeting_date FROM attendance "
-	where_clause, values = construct_where_clause(options)
-	query += where_clause
-	query += " GROUP BY meeting_date"
-	
-	rows = get_data(query, values)
+	with get_lock():
+		where_clause, values = construct_where_clause(options)
+		query += where_clause
+		query += " GROUP BY meeting_date"
+		
+		rows = get_data(query, values)
 	
 	# Meeting date is first value in tuple returned from database
 	return [row["meeting_date"] for row in rows]
 
+def get_latest_meeting_date():
+	"""
+	Get the date of the most recent meeting with attendance records, or None if there are none
+	"""
+	rows = get_data("SELECT MAX(meeting_date) AS latest_meeting_date FROM attendance;", ())
+	return rows[0]["latest_meeting_date"] if rows else None
+
+def get_attendee_summaries():
+	"""
+	Get the per-attendee summaries maintained by add_to_db
+
+	returns: A dictionary mapping canonical attendee names to rows containing first_attended,
+			 last_attended and total_attended
+	"""
+	rows = get_data("SELECT * FROM attendee_summary;", ())
+	return { row["canonical"]: row for row in rows }
+
+def set_attendee_summaries(summaries):
+	"""
+	Insert or replace per-attendee summaries
+
+	summaries: A list of (canonical, first_attended, last_attended, total_attended) tuples
+	"""
+	query = ("INSERT INTO attendee_summary "
+			"(canonical, first_attended, last_attended, total_attended) "
+			"VALUES (%s, %s, %s, %s) "
+			"ON DUPLICATE KEY UPDATE first_attended = VALUES(first_attended), "
+			"last_attended = VALUES(last_attended), total_attended = VALUES(total_attended)")
+
+	set_many_data(query, summaries, bump_version=True)
+
+def delete_attendee_summaries(canonicals):
+	"""
+	Delete the summaries of attendees, e.g. names which are no longer canonical
+
+	canonicals: A list of canonical attendee names
+	"""
+	set_many_data("DELETE FROM attendee_summary WHERE canonical = %s", [(canonical,) for canonical in canonicals], \
+					bump_version=True)
+
+def get_roster_sync(path):
+	"""
+	Get the modification time of a members file when it was last mirrored into the database,
+	or None if it has not been
+	"""
+	rows = get_data("SELECT members_mtime FROM roster_sync WHERE path = %s;", (path,))
+	return rows[0]["members_mtime"] if rows else None
+
+def set_roster_sync(path, members_mtime):
+	"""
+	Record that a members file was mirrored into the database at a modification time
+	"""
+	set_data("INSERT INTO roster_sync (path, members_mtime, synced_at) VALUES (%s, %s, NOW()) "
+			"ON DUPLICATE KEY UPDATE members_mtime = VALUES(members_mtime), synced_at = VALUES(synced_at)", \
+			(path, members_mtime))
+
+def get_roster_entries():
+	"""
+	Get the lines of the members file mirrored into the database
+
+	returns: A set of (name, entry_type, alias_of) tuples, where entry_type is "keyholder",
+			 "member" or "alias", and alias_of is the name an alias is of ("" otherwise)
+	"""
+	rows = get_data("SELECT name, entry_type, alias_of FROM roster_entries;", ())
+	return { (row["name"], row["entry_type"], row["alias_of"]) for row in rows }
+
+def add_roster_entries(entries):
+	"""
+	Add lines of the members file to the mirror, as (name, entry_type, alias_of) tuples
+	"""
+	set_many_data("INSERT IGNORE INTO roster_entries (name, entry_type, alias_of) VALUES (%s, %s, %s)", list(entries))
+
+def delete_roster_entries(entries):
+	"""
+	Remove lines of the members file from the mirror, as (name, entry_type, alias_of) tuples
+	"""
+	set_many_data("DELETE FROM roster_entries WHERE name = %s AND entry_type = %s AND alias_of = %s", list(entries))
+
+def get_attendee_identities():
+	"""
+	Get the identities of the names in the members file, as mirrored into the database
+
+	returns: A dictionary mapping names to (canonical, attendee_type) tuples
+	"""
+	rows = get_data("SELECT name, canonical, attendee_type FROM attendee_identities;", ())
+	return { row["name"]: (row["canonical"], row["attendee_type"]) for row in rows }
+
+def set_attendee_identities(identities):
+	"""
+	Insert or replace the identities of names, as (name, canonical, attendee_type) tuples
+	"""
+	query = ("INSERT INTO attendee_identities (name, canonical, attendee_type) VALUES (%s, %s, %s) "
+			"ON DUPLICATE KEY UPDATE canonical = VALUES(canonical), attendee_type = VALUES(attendee_type)")
+	set_many_data(query, identities, bump_version=True)
+
+def delete_attendee_identities(names):
+	"""
+	Delete the identities of names which are no longer in the members file
+	"""
+	set_many_data("DELETE FROM attendee_identities WHERE name = %s", [(name,) for name in names], bump_version=True)
+
+# Recomputes whether records need manual inspection from the identities of their attendees, as
+# minutes_parse_utils.get_attendance_rows does when they are ingested.  Attendees who are not in
+# the members file have no identity, and are guests.  Corrected names are left as they are.
+REFRESH_INSPECTION_CASE = ("CASE "
+			"WHEN attendance.attendee_type IN ('STUDENT_KEYHOLDER', 'ASSOCIATE_KEYHOLDER') THEN "
+				"CASE identities.attendee_type WHEN 'keyholder' THEN 'NONE' WHEN 'member' THEN 'WRONG_TYPE' ELSE 'NOT_FOUND' END "
+			"WHEN attendance.attendee_type = 'MEMBER' THEN "
+				"CASE COALESCE(identities.attendee_type, 'guest') WHEN 'guest' THEN 'NOT_FOUND' ELSE 'NONE' END "
+			"ELSE 'NONE' END")
+
+# The records to refresh are joined with their attendees' identities, followed by a selector of
+# the attendees
+REFRESH_INSPECTION_QUERY = ("UPDATE attendance "
+			"LEFT JOIN attendee_identities AS identities ON identities.name = attendance.attendee "
+			"SET attendance.inspection_required = " + REFRESH_INSPECTION_CASE + " "
+			"WHERE attendance.inspection_required <> 'CORRECTED' AND attendance.")
+
+# SQLite's UPDATE ... FROM is an inner join, so the attendees are joined with their identities
+# (if any) first.  {selector} is the selector of the attendees.
+SQLITE_REFRESH_INSPECTION_QUERY = ("UPDATE attendance SET inspection_required = " + REFRESH_INSPECTION_CASE + " "
+			"FROM (SELECT names.attendee AS name, attendee_identities.attendee_type AS attendee_type "
+				"FROM (SELECT DISTINCT attendee FROM attendance WHERE {selector}) AS names "
+				"LEFT JOIN attendee_identities ON attendee_identities.name = names.attendee) AS identities "
+			"WHERE identities.name = attendance.attendee AND attendance.inspection_required <> 'CORRECTED'")
+
+def refresh_inspections(names):
+	"""
+	Recompute whether the records of attendees need manual inspection, after their identities
+	changed in the members file
+
+	names: The list of attendees whose identities changed
+	"""
+	if NO_WRITE_DB or not names:
+		return
+
+	with get_lock():
+		values = {}
+		selector = attendee_in_clause(names, "attendee", values)
+		if get_backend() == "sqlite":
+			query = SQLITE_REFRESH_INSPECTION_QUERY.format(selector=selector)
+		else:
+			query = REFRESH_INSPECTION_QUERY + selector
+		set_data(query, values, bump_version=True)
+
+# Every name listed in the roster of a semester: the names in the members file, and anyone else
+# who attended during the semester or recently enough to be active, who is a guest
+ROSTER_NAMES_QUERY = ("SELECT name, canonical, attendee_type FROM attendee_identities "
+			"UNION "
+			"SELECT DISTINCT attendance.attendee, attendance.attendee, 'guest' FROM attendance "
+				"LEFT JOIN attendee_identities ON attendee_identities.name = attendance.attendee "
+				"WHERE attendee_identities.name IS NULL AND attendance.meeting_date BETWEEN %(start_date)s AND %(end_date)s "
+			"UNION "
+			"SELECT attendee_summary.canonical, attendee_summary.canonical, 'guest' FROM attendee_summary "
+				"LEFT JOIN attendee_identities ON attendee_identities.name = attendee_summary.canonical "
+				"WHERE attendee_identities.name IS NULL AND attendee_summary.last_attended >= %(active_cutoff)s")
+
+# Every name to list in the semester roster with its canonical name, attendee type, meetings
+# attended in the semester (counted for all of the canonical attendee's names) and last attended
+# date
+ROSTER_LIST_QUERY = ("SELECT names.name AS attendee, names.canonical AS canonical, names.attendee_type AS attendee_type, "
+			"COALESCE(counts.num_attended, 0) AS num_attended, attendee_summary.last_attended AS last_attended "
+			"FROM (" + ROSTER_NAMES_QUERY + ") AS names "
+			"LEFT JOIN ("
+				"SELECT COALESCE(attendee_identities.canonical, attendance.attendee) AS canonical, "
+					"COUNT(DISTINCT attendance.meeting_date) AS num_attended "
+				"FROM attendance LEFT JOIN attendee_identities ON attendee_identities.name = attendance.attendee "
+				"WHERE attendance.meeting_date BETWEEN %(start_date)s AND %(end_date)s "
+				"GROUP BY COALESCE(attendee_identities.canonical, attendance.attendee)"
+			") AS counts ON counts.canonical = names.canonical "
+			"LEFT JOIN attendee_summary ON attendee_summary.canonical = names.canonical")
+
+ROSTER_COUNT_QUERY = "SELECT COUNT(*) AS total FROM (" + ROSTER_NAMES_QUERY + ") AS names"
+
+# ORDER BY clauses of the orders supported by get_roster_list.  Ties are broken by attendee type
+# and then by name, which is unique, so that pages do not overlap.
+ROSTER_ORDERS = {
+	"num_attended": "ORDER BY num_attended DESC, attendee_type, attendee",
+	"last_attended": "ORDER BY last_attended DESC, attendee_type, attendee",
+	"attendee_type": "ORDER BY attendee_type, attendee",
+	"attendee": "ORDER BY attendee"
+}
+
+def get_roster_list(start_date, end_date, active_cutoff, order=None, limit=None, offset=0):
+	"""
+	Get the attendees to list in the roster of a semester, classified and with aliases folded
+	by joining the mirror of the members file (see roster_sync)
+
+	start_date: The first date of the semester
+	end_date: The last date of the semester
+	active_cutoff: Attendees who attended on or after this date are listed even if they did not
+				   attend during the semester
+	order: One of ROSTER_ORDERS to sort the attendees in the query, or None for no order
+	limit: Number of attendees to return, or None for all
+	offset: Number of attendees to skip, in order
+
+	returns: A list of rows containing attendee, canonical, attendee_type, num_attended and
+			 last_attended
+	"""
+	if order is not None and order not in ROSTER_ORDERS:
+		raise ValueError("Unknown roster order " + str(order))
+	if (limit is not None or offset) and order is None:
+		raise ValueError("Roster pages require an order")
+
+	query = ROSTER_LIST_QUERY
+	data = { "start_date": start_date, "end_date": end_date, "active_cutoff": active_cutoff }
+	if order is not None:
+		query += " " + ROSTER_ORDERS[order]
+	if limit is None:
+		return get_data(query, data)[offset:]
+
+	query += " LIMIT %(limit)s OFFSET %(offset)s"
+	data["limit"] = int(limit)
+	data["offset"] = int(offset)
+	return get_data(query, data)
+
+def get_roster_size(start_date, end_date, active_cutoff):
+	"""
+	Count the attendees listed in the roster of a semester, as for get_roster_list, without
+	counting their attendance
+	"""
+	rows = get_data(ROSTER_COUNT_QUERY, { "start_date": start_date, "end_date": end_date, "active_cutoff": active_cutoff })
+	return rows[0]["total"]
+
 def get_attendees(options=None):
 	"""
-	Get list of attendees based on a dictionary of options
+	Get list of attendees based on a dictionary of options, as for get_attendance_records
 	"""
 
 	# Selects attendees from databse
-	query = "SELECT attendee FROM attendance GROUP BY attendee;"
-	where_clause, values = construct_where_clause(options)
-	query += where_clause
+	with get_lock():
+		where_clause, values = construct_where_clause(options)
+		query = "SELECT attendee FROM attendance " + where_clause + " GROUP BY attendee;"
 
-	rows = get_data(query, values)
+		rows = get_data(query, values)
 	return [row["attendee"] for row in rows]
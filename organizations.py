@@ -0,0 +1,157 @@
+# This file configures the organizations whose attendance is tracked.  Each organization has
+# its own minutes, members file, minutes formats, preprocessing exceptions, database and local
+# state (snapshot, checkpoint, spool and profile cache).  Code run within use_organization reads these
+# instead of the module defaults, which remain the configuration of SIPB and are only used when no
+# organization is being worked on.
+#
+# Organizations are listed in organizations.json, e.g.
+#	[{"name": "sipb", "minutes_path": "/afs/sipb.mit.edu/admin/minutes",
+#	  "members_path": "/afs/sipb.mit.edu/admin/text/members/members_and_prospectives",
+#	  "database": {"host": "sql.mit.edu", "database": "gshay+sipb_attendance"},
+#	  "state_path": "/var/lib/attendance/sipb"}]
+
+import os
+import json
+import datetime
+import contextlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+# Path of the organizations configuration file
+organizations_path = os.path.join(os.path.dirname(__file__), "organizations.json")
+
+# Directory containing the local state directory of each organization without a state_path
+state_directory = os.path.join(os.path.dirname(__file__), "organization_state")
+
+# Settings every organization must configure, rather than share SIPB's
+REQUIRED_SETTINGS = ["database", "members_path", "minutes_path"]
+
+# Organization the current thread (or task) is working on, or None for the module defaults
+current_organization = contextvars.ContextVar("current_organization", default=None)
+
+class Organization:
+	"""
+	Configuration of an organization.  Only the minutes formats fall back to the module defaults;
+	an organization's other settings are never SIPB's.
+	"""
+	def __init__(self, name, minutes_path=None, recent_minutes_path=None, members_path=None, formats=None, \
+					exceptions=None, database=None, state_path=None):
+		"""
+		name: Short name of the organization, e.g. "sipb"
+		minutes_path: The minutes directory, which contains a HISTORY directory
+		recent_minutes_path: The directory of recent minutes, if it is not minutes_path
+		members_path: The members file listing keyholders, members and aliases
+		formats: List of minutes_parse_utils.Format the organization's minutes follow, or None for
+				 the standard formats
+		exceptions: Preprocessing exceptions, as in preprocessing_exceptions.EXCEPTIONS, or None for none
+		database: The operations.Database to store attendance in
+		state_path: Directory of the organization's snapshot, rebuild checkpoint, spool and cached
+					profiles, or None for a directory named after it in state_directory
+		"""
+		self.name = name
+		self.minutes_path = minutes_path
+		self.recent_minutes_path = recent_minutes_path if recent_minutes_path is not None else minutes_path
+		self.members_path = members_path
+		self.formats = formats
+		self.exceptions = exceptions if exceptions is not None else {}
+		self.database = database
+		self.state_path = state_path if state_path is not None else os.path.join(state_directory, name)
+
+	def __getstate__(self):
+		# Parse processes only need the parsing settings; the database connection cannot be sent
+		state = self.__dict__.copy()
+		state["database"] = None
+		return state
+
+	def get_state_file(self, filename):
+		"""
+		Get the path of a local state file of the organization
+		"""
+		return os.path.join(self.state_path, filename)
+
+def get_organization():
+	"""
+	Get the organization being worked on, or None if the module defaults are in use
+	"""
+	return current_organization.get()
+
+@contextlib.contextmanager
+def use_organization(organization):
+	"""
+	Work on an organization for the duration of a with block
+	"""
+	token = current_organization.set(organization)
+	try:
+		yield organization
+	finally:
+		current_organization.reset(token)
+
+def run_in_organization(organization, function, *args):
+	"""
+	Call a function while working on an organization, e.g. in a parse process
+	"""
+	with use_organization(organization):
+		return function(*args)
+
+def for_each_organization(organizations, function, *args):
+	"""
+	Call a function for several organizations at once, each in its own thread working on that
+	organization.  The threads share this process's pool of parse processes, and each uses its
+	organization's pool of database connections.
+
+	organizations: List of Organizations
+	function: The function to call, e.g. minutes_parse_utils.ingest
+	args: Arguments to call the function with
+
+	returns: A dictionary mapping organization names to the values the function returned
+	"""
+	with ThreadPoolExecutor(max_workers=max(1, len(organizations))) as executor:
+		futures = { organization.name: executor.submit(run_in_organization, organization, function, *args) \
+					for organization in organizations }
+		# Raises the error of the first organization which failed, after all have finished
+		return { name: future.result() for name, future in futures.items() }
+
+def load_format(config):
+	"""
+	Build a minutes format from its configuration: start and end dates (YYYY-MM-DD, end may be
+	null), a filename regex with year, month and day groups, and the phrases starting the lists
+	of keyholders, associate keyholders, members and guests
+	"""
+	from .minutes_parse_utils import Format, AttendeeExtractor
+	return Format(datetime.date.fromisoformat(config["start"]), \
+					datetime.date.fromisoformat(config["end"]) if config.get("end") else None, \
+					config["filename"], \
+					AttendeeExtractor(config["keyholders"], config["associate_keyholders"], config["members"], config["guests"]))
+
+def load_organizations(path=None):
+	"""
+	Load the organizations configuration file.  Every organization must set its database,
+	members_path and minutes_path, so that it never reads or writes SIPB's.
+
+	path: The configuration file, or None for the default
+
+	returns: A dictionary mapping organization names to Organizations
+	"""
+	from .operations import mysql_database, sqlite_database
+
+	with open(path if path is not None else organizations_path, "r") as f:
+		configs = json.load(f)
+
+	organizations = {}
+	for config in configs:
+		missing = [setting for setting in REQUIRED_SETTINGS if not config.get(setting)]
+		if missing:
+			raise ValueError("Organization " + str(config.get("name")) + " does not set " + ", ".join(missing))
+
+		if "sqlite" in config["database"]:
+			database = sqlite_database(config["database"]["sqlite"])
+		else:
+			database = mysql_database(**config["database"])
+		formats = [load_format(format) for format in config["formats"]] if "formats" in config else None
+		exceptions = { file: [tuple(exception) for exception in exceptions] \
+						for file, exceptions in config["exceptions"].items() } if "exceptions" in config else None
+
+		organizations[config["name"]] = Organization(config["name"], config["minutes_path"], \
+								config.get("recent_minutes_path"), config["members_path"], formats, exceptions, \
+								database, config.get("state_path"))
+	return organizations
@@ -0,0 +1,76 @@
+# This file collects the measurements of parsing each minutes file (time, bytes, regex searches
+# and matches) and reports the slowest files, and any which were skipped for taking longer
+# than their time budget
+
+from .logging import log
+
+class ParseProfiler:
+	"""
+	Collects the ParseStats of each minutes file parsed.  Pass its record method as the
+	on_parsed function of minutes_parse_utils.parse_minutes_files.
+	"""
+	def __init__(self):
+		self.stats = []
+
+	def record(self, stats):
+		"""
+		Record the measurements of parsing a file
+		"""
+		self.stats.append(stats)
+
+	def get_timed_out(self):
+		"""
+		Get the paths of the files which were skipped for taking longer than their time budget
+		"""
+		return [stats.path for stats in self.stats if stats.timed_out]
+
+	def get_slowest(self, limit=None):
+		"""
+		Get the measurements of the slowest files, slowest first
+
+		limit: Number of files to return, or None for all
+		"""
+		ranked = sorted(self.stats, key=lambda stats: stats.seconds, reverse=True)
+		return ranked[:limit] if limit is not None else ranked
+
+	def to_json(self, limit=None):
+		"""
+		Get a JSON-ready list of the measurements of the slowest files, slowest first
+		"""
+		return [{
+			"path": stats.path,
+			"seconds": stats.seconds,
+			"bytes": stats.bytes,
+			"calls": stats.calls,
+			"searches": stats.searches,
+			"matches": stats.matches,
+			"timed_out": stats.timed_out
+		} for stats in self.get_slowest(limit)]
+
+	def report(self, limit=10):
+		"""
+		Log the slowest files, and the files which were skipped
+
+		limit: Number of slowest files to list
+		"""
+		if not self.stats:
+			return
+
+		total_seconds = sum(stats.seconds for stats in self.stats)
+		total_bytes = sum(stats.bytes for stats in self.stats)
+		log("Parsed " + str(len(self.stats)) + " files (" + str(total_bytes) + " bytes) in " + \
+			str(round(total_seconds, 2)) + "s of parse time")
+
+		log("Slowest files:")
+		for rank, stats in enumerate(self.get_slowest(limit), 1):
+			kb_per_second = stats.bytes / 1024 / stats.seconds if stats.seconds else 0
+			log("    " + str(rank) + ". " + stats.path + ": " + str(round(stats.seconds * 1000, 1)) + "ms, " + \
+				str(stats.bytes) + " bytes (" + str(round(kb_per_second)) + " KB/s), " + \
+				str(stats.searches) + " searches, " + str(stats.matches) + " matches" + \
+				(" [TIMED OUT]" if stats.timed_out else ""))
+
+		timed_out = self.get_timed_out()
+		if timed_out:
+			log("Skipped " + str(len(timed_out)) + " files which took longer than their time budget, to inspect:")
+			for path in timed_out:
+				log("    " + path)
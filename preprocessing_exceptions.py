@@ -1,6 +1,9 @@
 # This file replaces text in order to preprocess minutes that don't follow the standard format,
 # or have typos
 
+import hashlib
+from .organizations import get_organization
+
 # Replace all instances of text with a replacement
 REPLACE = 0
 # Start meeting prior to a specific text
@@ -133,13 +136,23 @@ EXCEPTIONS = {
     # There are further mispellings; only cataloged through 2018
 }
 
+def get_exceptions():
+    """
+    Gets the exceptions of the organization being worked on
+    """
+    organization = get_organization()
+    if organization is not None:
+        return organization.exceptions
+    return EXCEPTIONS
+
 def process_exception(file, minutes):
     """
     Modifies lines for preprocessing if the file
     requires it
     """
-    if file in EXCEPTIONS:
-        for exception in EXCEPTIONS[file]:
+    exceptions = get_exceptions()
+    if file in exceptions:
+        for exception in exceptions[file]:
             if exception[0] == REPLACE:
                 minutes = minutes.replace(exception[1], exception[2])
             elif exception[0] == START_MEETING:
@@ -147,3 +160,22 @@ def process_exception(file, minutes):
         return minutes
     else:
         return minutes
+
+def get_replaced_names():
+    """
+    Gets the words that exceptions replace text with, e.g. the
+    corrected spellings of names, which are not corrected again
+    """
+    names = set()
+    for exceptions in get_exceptions().values():
+        for exception in exceptions:
+            if exception[0] == REPLACE:
+                names.update(exception[2].split())
+    return names
+
+def get_exceptions_fingerprint(file):
+    """
+    Gets a fingerprint of the exceptions applied to a file, which
+    changes whenever the file's exceptions are edited
+    """
+    return hashlib.sha1(repr(get_exceptions().get(file, [])).encode("utf-8")).hexdigest()
@@ -0,0 +1,127 @@
+# This file caches serialized attendance profiles, so that profile pages do not recompute
+# an attendee's whole record on every request.  Each profile is stored with the data version
+# (see api.get_data_version) it was computed from, which changes with every write to the
+# attendance data, so profiles of rebuilt or re-ingested meetings are recomputed.
+
+import os
+import json
+import datetime
+from urllib.parse import quote
+from .api import get_attendance_information, get_data_version
+from .identity import get_identity_index
+from .organizations import get_organization
+from .logging import log
+
+# Directory containing one cached profile file per canonical attendee
+cache_path = os.path.join(os.path.dirname(__file__), "profile_cache")
+
+# Number of days since an attendee last attended for which they are considered active
+ACTIVE_DAYS = 30
+
+def get_cache_path():
+	"""
+	Get the profile cache directory of the organization being worked on
+	"""
+	organization = get_organization()
+	if organization is not None:
+		return organization.get_state_file("profile_cache")
+	return cache_path
+
+def get_cache_file(canonical):
+	"""
+	Get the path of the cache file for a canonical attendee
+	"""
+	return os.path.join(get_cache_path(), quote(canonical, safe="") + ".json")
+
+def read_cache_entry(canonical):
+	"""
+	Read the cache entry for a canonical attendee, or None if there is none
+	"""
+	try:
+		with open(get_cache_file(canonical), "r") as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return None
+
+def write_cache_entry(canonical, entry):
+	"""
+	Write the cache entry for a canonical attendee, replacing any existing entry atomically
+	"""
+	os.makedirs(get_cache_path(), exist_ok=True)
+	cache_file = get_cache_file(canonical)
+	tmp_file = cache_file + ".tmp"
+	with open(tmp_file, "w") as f:
+		json.dump(entry, f)
+	os.replace(tmp_file, cache_file)
+
+def build_cache_entry(canonical, version):
+	"""
+	Compute an attendee's profile and wrap it in a cache entry
+
+	canonical: The canonical name/kerberos of the attendee
+	version: The data version the profile is computed from
+	"""
+	profile = get_attendance_information(canonical)
+	return {
+		"version": version,
+		"computed_on": str(datetime.date.today()),
+		# Round trip through JSON so dates are stored the same way they are served
+		"profile": json.loads(json.dumps(profile, default=str))
+	}
+
+def refresh_active(entry):
+	"""
+	Recompute the active flag of a cached profile if the active window has rolled forward
+	since it was computed
+
+	returns: True if the entry was modified
+	"""
+	today = datetime.date.today()
+	if entry["computed_on"] == str(today):
+		return False
+
+	last_attended = entry["profile"]["last_attended"]
+	active_cutoff = today - datetime.timedelta(days=ACTIVE_DAYS)
+	entry["profile"]["active"] = last_attended is not None and last_attended >= str(active_cutoff)
+	entry["computed_on"] = str(today)
+	return True
+
+def get_profile_json(attendee):
+	"""
+	Get the serialized attendance profile of an attendee, as returned by
+	get_attendance_information, recomputing it only if the data has changed since it
+	was cached
+
+	attendee: The name/kerberos of the attendee
+
+	returns: A JSON string containing the attendee's profile
+	"""
+	canonical = get_identity_index().get_canonical(attendee)
+	version = get_data_version()
+
+	entry = read_cache_entry(canonical)
+	if entry is None or entry["version"] != version:
+		# Profile missing or out of date
+		entry = build_cache_entry(canonical, version)
+		write_cache_entry(canonical, entry)
+	elif refresh_active(entry):
+		# Only the active window has changed
+		write_cache_entry(canonical, entry)
+
+	return json.dumps(entry["profile"])
+
+def refresh_profiles(attendees):
+	"""
+	Regenerate the cached profiles of attendees after their attendance was ingested.
+	Profiles of other attendees are regenerated the next time they are requested.
+
+	attendees: An iterable of names/kerberoses, such as the set returned by add_to_db
+	"""
+	index = get_identity_index()
+	version = get_data_version()
+
+	canonicals = { index.get_canonical(attendee) for attendee in attendees }
+	for canonical in canonicals:
+		write_cache_entry(canonical, build_cache_entry(canonical, version))
+
+	log("Refreshed " + str(len(canonicals)) + " cached profiles")
@@ -1,15 +1,29 @@
-import os
-from .minutes_parse_utils import FORMATS, get_attendance, add_to_db
+from .minutes_parse_utils import get_formats
 from .operations import get_meeting_dates
+from .organizations import get_organization
+from .minutes_archive import list_minutes_directory
 from .logging import log
 
 minutes_path = '/afs/sipb/admin/minutes'
 
-def get_minutes_files():
+def get_minutes_path():
+	"""
+	Get the directory of recent minutes of the organization being worked on
+	"""
+	organization = get_organization()
+	if organization is not None:
+		return organization.recent_minutes_path
+	return minutes_path
+
+def get_minutes_files(minutes_path=None):
 	"""
 	Get all minutes files that have not yet been processed, which are under the 
 	main minutes directory (recent minutes only)
+
+	minutes_path: The minutes directory, or None for the organization's
 	"""
+	if minutes_path is None:
+		minutes_path = get_minutes_path()
 	
 	# Get meeting dates which have records in the database
 	existing_dates = get_meeting_dates()
@@ -18,16 +32,15 @@ def get_minutes_files():
 	files[minutes_path] = []
 	
 	# Got through each minutes file in the minutes directory
-	for file in os.listdir(minutes_path):
-		if os.path.isfile(os.path.join(minutes_path, file)):
-			for format in FORMATS:
-				# Find format of minutes file
-				if format.is_in_range(file):
-					date = format.get_date(file)
-					if date not in existing_dates:
-						# Add to list if it has not been recorded yet
-						files[minutes_path].append(file)
-					break
+	for file in list_minutes_directory(minutes_path):
+		for format in get_formats():
+			# Find format of minutes file
+			if format.is_in_range(file):
+				date = format.get_date(file)
+				if date not in existing_dates:
+					# Add to list if it has not been recorded yet
+					files[minutes_path].append(file)
+				break
 
 	for file in files[minutes_path]:
 		log("Found unread minutes file " + file)
@@ -35,8 +48,6 @@ def get_minutes_files():
 	return files
 
 if __name__ == "__main__":
-	files = get_minutes_files()
-	log("Updating attendance for " + str(len(files[minutes_path])) + " files...")
-	attendance = get_attendance(files)
-	add_to_db(attendance)
-	log("Finished updating attendance")
+	# Equivalent to python3 -m <package> update
+	from .cli import main
+	main(["update"])
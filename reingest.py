@@ -0,0 +1,123 @@
+# This file re-ingests only the minutes whose preprocessing exceptions have changed since
+# they were ingested, e.g. after a typo fix is added to preprocessing_exceptions.EXCEPTIONS
+
+import os
+import argparse
+from .minutes_parse_utils import get_format, get_attendance_rows, get_ingested_file, update_attendee_summaries
+from .preprocessing_exceptions import get_exceptions, get_exceptions_fingerprint
+from .operations import get_ingested_files, get_attendance_records, replace_meeting_records
+from .identity import get_identity_index
+from .name_correction import get_name_corrector
+from .roster_sync import sync_roster
+from .snapshot import invalidate_snapshot, write_snapshot
+from .profile_cache import refresh_profiles
+from .logging import log
+
+def get_changed_files(minutes_files=None):
+	"""
+	Find the minutes files whose preprocessing exceptions differ from the exceptions that
+	were applied when they were ingested
+
+	minutes_files: Optional mapping of minutes directories to filenames, used to locate files
+				   with exceptions which were ingested before files were recorded
+
+	returns: A list of paths of minutes files to re-ingest
+	"""
+	ingested_files = get_ingested_files()
+
+	changed = []
+	for filename, ingested_file in ingested_files.items():
+		if ingested_file["exceptions_fingerprint"] != get_exceptions_fingerprint(filename):
+			changed.append(ingested_file["path"])
+
+	if minutes_files is not None:
+		exceptions = get_exceptions()
+		# Files with exceptions but no record of which exceptions were applied
+		for direc in minutes_files:
+			for filename in minutes_files[direc]:
+				if filename in exceptions and filename not in ingested_files:
+					changed.append(os.path.join(direc, filename))
+
+	return changed
+
+def reingest_file(path, index, corrector=None):
+	"""
+	Re-parse a minutes file and replace its meeting's attendance records in a single transaction
+
+	path: The path of the minutes file
+	index: The identity index to look attendees up in
+	corrector: Optional name_correction.NameCorrector to correct misspelled names with
+
+	returns: The set of attendees whose records were added or removed
+	"""
+	filename = os.path.basename(path)
+	format = get_format(filename)
+	if format is None:
+		log("Not a minutes file: " + path)
+		return set()
+
+	date = format.get_date(filename)
+	attendees = format.get_attendees(path)
+	rows, corrections = get_attendance_rows(date, attendees, index, corrector)
+
+	previous_attendees = { record["attendee"] for record in get_attendance_records(fields=["attendee"], options={"start_date": date, "end_date": date}) }
+	current_attendees = { row[1] for row in rows }
+
+	replace_meeting_records(date, rows, get_ingested_file(path, date), corrections)
+	log("Re-ingested " + path + ": removed " + str(sorted(previous_attendees - current_attendees)) + \
+		", added " + str(sorted(current_attendees - previous_attendees)))
+
+	return previous_attendees ^ current_attendees
+
+def reingest_changed_files(minutes_files=None):
+	"""
+	Re-ingest the minutes files whose preprocessing exceptions have changed, then refresh the
+	summaries and cached profiles of the attendees affected
+
+	minutes_files: Optional mapping of minutes directories to filenames, as in get_changed_files
+
+	returns: The set of attendees whose records were added or removed
+	"""
+	changed = get_changed_files(minutes_files)
+	log("Found " + str(len(changed)) + " minutes files with changed exceptions")
+
+	if not changed:
+		return set()
+
+	index = get_identity_index()
+	sync_roster()
+	corrector = get_name_corrector(index)
+	# The snapshot would be stale as soon as records are replaced
+	invalidate_snapshot()
+	affected_attendees = set()
+	for path in changed:
+		affected_attendees |= reingest_file(path, index, corrector)
+
+	update_attendee_summaries(affected_attendees, index)
+	write_snapshot()
+	refresh_profiles(affected_attendees)
+	return affected_attendees
+
+def reingest_organization():
+	"""
+	Re-ingest the changed minutes files of the organization being worked on (or of SIPB)
+	"""
+	from .collect_all_attendance import get_minutes_files
+	return reingest_changed_files(get_minutes_files())
+
+if __name__ == "__main__":
+	from .organizations import load_organizations, for_each_organization
+	parser = argparse.ArgumentParser(description="Re-ingest the minutes whose preprocessing exceptions changed")
+	parser.add_argument("--org", action="append", default=None, \
+						help="organization to re-ingest for, from the organizations file; may be given several times")
+	parser.add_argument("--organizations", default=None, help="organizations file to read, instead of the default")
+	args = parser.parse_args()
+
+	if args.org is None:
+		reingest_organization()
+	else:
+		organizations = load_organizations(args.organizations)
+		unknown = [name for name in args.org if name not in organizations]
+		if unknown:
+			parser.error("unknown organization " + ", ".join(unknown))
+		for_each_organization([organizations[name] for name in args.org], reingest_organization)
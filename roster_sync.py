@@ -0,0 +1,120 @@
+# This file mirrors the members file into the database, so that queries can classify attendees
+# and fold aliases with joins instead of checking each row in Python.  The lines of the members
+# file are mirrored in roster_entries, and the canonical name and attendee type of each name it
+# lists in attendee_identities.
+#
+# The mirror is synced incrementally: nothing is done while the members file's mtime matches the
+# one recorded at the last sync, and otherwise only the lines and identities which changed are
+# written.  Records of attendees whose identities changed have their inspection flags rechecked,
+# and their summaries are recomputed under their canonical names.  Meetings in which a name was
+# corrected are re-ingested once that name is added to the members file, so its attendance is
+# credited to it instead of the name it was corrected to.
+
+from . import operations
+from .minutes_parse_utils import get_members_and_keyholders, get_members_mtime, get_members_path, update_attendee_summaries
+from .identity import IdentityIndex
+from .name_correction import get_name_corrector
+from .organizations import get_organization
+from .logging import log
+
+# Maps (organization name, members file, database) to the mtime of the members file when this
+# process last found the mirror up to date
+_synced = {}
+
+def get_entries(members, keyholders, aliases):
+	"""
+	Get the lines of the members file as (name, entry_type, alias_of) tuples, as mirrored in
+	roster_entries
+	"""
+	entries = { (name, "keyholder", "") for name in keyholders }
+	entries |= { (name, "member", "") for name in members }
+	entries |= { (alias, "alias", name) for alias, name in aliases.items() }
+	return entries
+
+def get_identities(index):
+	"""
+	Get the identity of each name in the members file
+
+	index: The identity.IdentityIndex of the members file
+
+	returns: A dictionary mapping names to (canonical, attendee_type) tuples
+	"""
+	names = index.members | index.keyholders | set(index.aliases) | set(index.aliases.values())
+	return { name: (index.get_canonical(name), index.get_attendee_type(name)) for name in names }
+
+def reingest_stale_corrections(index):
+	"""
+	Re-ingest the meetings in which a name now in the members file was corrected to another name
+
+	index: The identity.IdentityIndex of the members file
+
+	returns: The set of attendees whose records were added or removed
+	"""
+	# The reingest module imports this one, so it cannot be imported at the top
+	from .reingest import reingest_file
+
+	stale = operations.get_stale_corrections()
+	if not stale:
+		return set()
+
+	corrector = get_name_corrector(index)
+	affected = set()
+	for meeting in stale:
+		if meeting["path"] is None:
+			log("Cannot re-ingest the meeting of " + str(meeting["meeting_date"]) + ": its minutes file was not recorded")
+			continue
+		try:
+			affected |= reingest_file(meeting["path"], index, corrector)
+		except OSError as e:
+			log("Cannot re-ingest the meeting of " + str(meeting["meeting_date"]) + ": " + str(e))
+	return affected
+
+def sync_roster(force=False):
+	"""
+	Bring the mirror of the members file in the database up to date
+
+	force: If True, compare the mirror with the members file even if its mtime is unchanged
+
+	returns: True if the mirror was compared with the members file
+	"""
+	path = get_members_path()
+	mtime = get_members_mtime()
+	organization = get_organization()
+	key = (organization.name if organization is not None else None, path, id(operations.get_database()))
+	if not force and _synced.get(key) == mtime:
+		return False
+	if not force and operations.get_roster_sync(path) == mtime:
+		_synced[key] = mtime
+		return False
+
+	members, keyholders, aliases = get_members_and_keyholders()
+
+	# Lines added to or removed from the members file
+	entries = get_entries(members, keyholders, aliases)
+	mirrored_entries = operations.get_roster_entries()
+	operations.add_roster_entries(entries - mirrored_entries)
+	operations.delete_roster_entries(mirrored_entries - entries)
+
+	# Names whose canonical name or attendee type changed, or which were removed
+	index = IdentityIndex(members, keyholders, aliases)
+	identities = get_identities(index)
+	mirrored_identities = operations.get_attendee_identities()
+	changed = [(name,) + identities[name] for name in sorted(identities) if mirrored_identities.get(name) != identities[name]]
+	removed = [name for name in sorted(mirrored_identities) if name not in identities]
+	operations.set_attendee_identities(changed)
+	operations.delete_attendee_identities(removed)
+	operations.refresh_inspections([identity[0] for identity in changed] + removed)
+
+	# Summaries of the attendees' canonical names before and after the change
+	affected = [identity[0] for identity in changed] + removed
+	affected += [mirrored_identities[name][0] for name in affected if name in mirrored_identities]
+	affected += reingest_stale_corrections(index)
+	if affected:
+		update_attendee_summaries(affected, index)
+
+	operations.set_roster_sync(path, mtime)
+	_synced[key] = mtime
+	log("Synced members file to the database: " + str(len(entries - mirrored_entries)) + " lines added, " + \
+		str(len(mirrored_entries - entries)) + " removed, " + str(len(changed)) + " identities changed, " + \
+		str(len(removed)) + " removed")
+	return True
@@ -0,0 +1,301 @@
+# This file serves the api as JSON over HTTP.  The most recently used responses are cached in
+# memory for the current data version, and carry an ETag so clients can revalidate them without
+# any recomputation.
+#
+# Usage: python3 -m <package>.server [--host HOST] [--port PORT] [--sqlite PATH]
+#                                    [--org NAME] [--organizations FILE]
+
+import json
+import hashlib
+import datetime
+import argparse
+import threading
+import collections
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+from . import api
+from . import operations
+from .profile_cache import get_profile_json
+from .organizations import load_organizations, use_organization
+from .minutes_parse_utils import get_members_mtime
+from .roster_sync import sync_roster
+from .logging import log
+
+def to_json(value):
+	"""
+	Serialize an api result, which may contain dates (including as dictionary keys)
+	"""
+	def convert(value):
+		if isinstance(value, dict):
+			return { str(key): convert(value[key]) for key in value }
+		elif isinstance(value, (list, tuple)):
+			return [convert(item) for item in value]
+		elif isinstance(value, datetime.date):
+			return str(value)
+		return value
+	return json.dumps(convert(value))
+
+class NotFound(Exception):
+	"""
+	Raised by an endpoint when what was requested does not exist
+	"""
+	pass
+
+def profile(query, attendee):
+	# Profiles are cached on disk, so only names with a profile are looked up
+	if not api.is_attendee(attendee):
+		raise NotFound("Unknown attendee " + attendee)
+	return get_profile_json(attendee)
+
+def roster(query):
+	order = query.get("order", ["num_attended"])[0]
+	limit = query.get("limit", [None])[0]
+	offset = int(query.get("offset", ["0"])[0])
+	fields = query.get("fields", [None])[0]
+	records, total, label = api.get_attendance_records_page(order, int(limit) if limit is not None else None, offset, \
+								fields.split(",") if fields is not None else None)
+	return to_json({"label": label, "total": total, "offset": offset, "records": records})
+
+def stats(query):
+	stats_per_date, stats_per_attendee_type = api.get_attendance_stats()
+	return to_json({"per_date": stats_per_date, "per_attendee_type": stats_per_attendee_type})
+
+def trends(query):
+	meeting_window = int(query.get("meeting_window", ["4"])[0])
+	week_window = int(query.get("week_window", ["4"])[0])
+	return to_json(api.get_attendance_trends(meeting_window, week_window))
+
+def cohorts(query):
+	return to_json(api.get_cohort_retention())
+
+def coattendance(query, attendee):
+	k = int(query.get("k", ["10"])[0])
+	since = query.get("since", [None])[0]
+	until = query.get("until", [None])[0]
+	return to_json(api.get_coattendance(attendee, k, \
+						datetime.date.fromisoformat(since) if since is not None else None, \
+						datetime.date.fromisoformat(until) if until is not None else None))
+
+def streaks(query):
+	order = query.get("order", ["longest_streak"])[0]
+	limit = query.get("limit", [None])[0]
+	return to_json(api.get_attendance_streaks(order, int(limit) if limit is not None else None))
+
+def directory(query):
+	search = query.get("q", [""])[0]
+	limit = int(query.get("limit", ["10"])[0])
+	substring = query.get("substring", ["0"])[0] == "1"
+	return to_json(api.search_attendees(search, limit, substring))
+
+# Endpoints, mapping the first path component to a function taking the parsed query string
+# (and any further path component) and returning a JSON string
+ENDPOINTS = {
+	"profile": profile,
+	"roster": roster,
+	"stats": stats,
+	"trends": trends,
+	"cohorts": cohorts,
+	"coattendance": coattendance,
+	"streaks": streaks,
+	"directory": directory
+}
+
+# Endpoints which take an argument (the attendee) in the path
+ATTENDEE_ENDPOINTS = ["profile", "coattendance"]
+
+# Query string parameters each endpoint reads; requests differing only in other parameters (or
+# in their order) share a cached response
+ENDPOINT_PARAMETERS = {
+	"profile": [],
+	"roster": ["fields", "limit", "offset", "order"],
+	"stats": [],
+	"trends": ["meeting_window", "week_window"],
+	"cohorts": [],
+	"coattendance": ["k", "since", "until"],
+	"streaks": ["limit", "order"],
+	"directory": ["limit", "q", "substring"]
+}
+
+# Number of response bodies kept in memory
+RESPONSE_CACHE_SIZE = 256
+
+def get_cache_key(endpoint, arguments, query):
+	"""
+	Get the key of a request in the response cache: the endpoint, its path arguments and the
+	(first) values of the query string parameters it reads, in sorted order
+
+	endpoint: The endpoint requested
+	arguments: The further path components, e.g. the attendee
+	query: The parsed query string
+	"""
+	parameters = tuple((name, query[name][0]) for name in ENDPOINT_PARAMETERS[endpoint] if name in query)
+	return (endpoint,) + tuple(arguments) + parameters
+
+class ResponseCache:
+	"""
+	Caches the most recently used response bodies for the current data version
+	"""
+	def __init__(self, size=RESPONSE_CACHE_SIZE):
+		self.lock = threading.Lock()
+		self.size = size
+		self.version = None
+		# Response bodies, least recently used first
+		self.bodies = collections.OrderedDict()
+
+	def get(self, version, key, compute):
+		"""
+		Get the response body for a request, computing it if it is not cached
+
+		version: The current data version (and date)
+		key: The key of the request, as returned by get_cache_key
+		compute: Function computing the response body
+		"""
+		with self.lock:
+			if version != self.version:
+				# The data has changed, so every cached response is stale
+				self.version = version
+				self.bodies = collections.OrderedDict()
+			elif key in self.bodies:
+				self.bodies.move_to_end(key)
+				return self.bodies[key]
+
+		body = compute().encode("utf-8")
+		with self.lock:
+			if version == self.version:
+				self.bodies[key] = body
+				while len(self.bodies) > self.size:
+					self.bodies.popitem(last=False)
+		return body
+
+class RosterWatcher:
+	"""
+	Syncs the mirror of the members file in the database when the members file changes, so that
+	requests only read the mirror
+	"""
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.members_mtime = None
+
+	def check(self):
+		"""
+		Sync the mirror if the members file has changed since it was last synced
+		"""
+		members_mtime = get_members_mtime()
+		if members_mtime == self.members_mtime:
+			return
+		with self.lock:
+			if members_mtime != self.members_mtime:
+				sync_roster()
+				self.members_mtime = members_mtime
+
+class AttendanceRequestHandler(BaseHTTPRequestHandler):
+	"""
+	Handles requests for api endpoints
+	"""
+	# Keep connections open between requests
+	protocol_version = "HTTP/1.1"
+
+	def do_GET(self):
+		# Handler threads are started per connection, so each works on the server's organization
+		with use_organization(self.server.organization):
+			self.respond()
+
+	def respond(self):
+		"""
+		Respond to a request for an api endpoint
+		"""
+		url = urlparse(self.path)
+		parts = [unquote(part) for part in url.path.split("/") if part]
+		endpoint = parts[0] if parts else None
+		if endpoint not in ENDPOINTS or len(parts) != (2 if endpoint in ATTENDEE_ENDPOINTS else 1):
+			self.send_json(404, json.dumps({"error": "Not found"}).encode("utf-8"))
+			return
+
+		# Syncing writes to the attendance data, so it is done before the data version is read
+		self.server.roster_watcher.check()
+
+		# Responses change when the attendance data is written (including rewrites of past
+		# meetings), the members file changes, or (for the active flags and the current
+		# semester) the day changes
+		version = api.get_data_version() + "/" + str(datetime.date.today())
+		query = parse_qs(url.query)
+		key = get_cache_key(endpoint, parts[1:], query)
+		etag = '"' + hashlib.sha1((version + " " + repr(key)).encode("utf-8")).hexdigest() + '"'
+
+		if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+			self.send_response(304)
+			self.send_header("ETag", etag)
+			self.send_header("Content-Length", "0")
+			self.end_headers()
+			return
+
+		try:
+			body = self.server.response_cache.get(version, key, \
+							lambda: ENDPOINTS[endpoint](query, *parts[1:]))
+		except ValueError as e:
+			self.send_json(400, json.dumps({"error": str(e)}).encode("utf-8"))
+			return
+		except NotFound as e:
+			self.send_json(404, json.dumps({"error": str(e)}).encode("utf-8"))
+			return
+		except Exception as e:
+			log("Error serving " + self.path + ": " + repr(e))
+			self.send_json(500, json.dumps({"error": "Internal server error"}).encode("utf-8"))
+			return
+
+		self.send_json(200, body, etag)
+
+	def send_json(self, status, body, etag=None):
+		"""
+		Send a JSON response
+		"""
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		if etag is not None:
+			self.send_header("ETag", etag)
+			self.send_header("Cache-Control", "no-cache")
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		log(self.address_string() + " " + format % args)
+
+def make_server(host="localhost", port=8000, organization=None):
+	"""
+	Create a server for the api, which keeps its database connections and caches warm between
+	requests.  Call serve_forever on the result to start serving.
+
+	organization: The organizations.Organization to serve the attendance of, or None for SIPB
+	"""
+	server = ThreadingHTTPServer((host, port), AttendanceRequestHandler)
+	server.organization = organization
+	server.response_cache = ResponseCache()
+	server.roster_watcher = RosterWatcher()
+	return server
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Serve the attendance api as JSON")
+	parser.add_argument("--host", default="localhost", help="address to listen on")
+	parser.add_argument("--port", type=int, default=8000, help="port to listen on")
+	parser.add_argument("--sqlite", default=None, help="use this SQLite stand-in database instead of MySQL")
+	parser.add_argument("--org", default=None, help="organization to serve, from the organizations file")
+	parser.add_argument("--organizations", default=None, help="organizations file to read, instead of the default")
+	args = parser.parse_args()
+
+	organization = None
+	if args.org is not None:
+		organizations = load_organizations(args.organizations)
+		if args.org not in organizations:
+			parser.error("unknown organization " + args.org)
+		organization = organizations[args.org]
+
+	if args.sqlite is not None:
+		from .migrations import migrate
+		operations.use_sqlite(args.sqlite)
+		with use_organization(organization):
+			migrate()
+
+	server = make_server(args.host, args.port, organization)
+	log("Serving on http://" + args.host + ":" + str(args.port))
+	server.serve_forever()
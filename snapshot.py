@@ -0,0 +1,165 @@
+# This file saves a snapshot of the data every request needs (the roster and alias groups,
+# the meeting dates and the per-attendee summaries) to a local file.  Short-lived processes
+# load the snapshot instead of reading the members file and querying the database.
+#
+# Ingestion invalidates the snapshot before writing to the database and rewrites it after,
+# so a snapshot on disk is current as long as the members file has not changed since.
+
+import os
+import time
+import bisect
+import pickle
+from . import operations
+from .organizations import get_organization
+from .logging import log
+
+# Path of the snapshot file
+snapshot_path = os.path.join(os.path.dirname(__file__), "snapshot.pickle")
+
+# Version of the snapshot format; snapshots written with other versions are ignored
+SNAPSHOT_FORMAT = 1
+
+# Snapshots older than this many seconds are ignored, in case the database was modified
+# without going through ingestion
+SNAPSHOT_MAX_AGE = 24 * 60 * 60
+
+# Flag to disable using snapshots
+USE_SNAPSHOT = True
+
+# Maps the path of each snapshot file loaded by this process to the modification time of the
+# file and the snapshot loaded from it
+_snapshots = {}
+
+def get_snapshot_path():
+	"""
+	Get the snapshot file of the organization being worked on
+	"""
+	organization = get_organization()
+	if organization is not None:
+		return organization.get_state_file("snapshot.pickle")
+	return snapshot_path
+
+def get_members_mtime():
+	# Imported here since minutes_parse_utils imports this module
+	from .minutes_parse_utils import get_members_mtime
+	return get_members_mtime()
+
+def load_snapshot():
+	"""
+	Load the snapshot, if there is a current one
+
+	returns: A dictionary containing:
+		- members_mtime: the members file mtime the snapshot was built from
+		- latest_meeting_date: the date of the most recent meeting
+		- meeting_dates: the sorted list of all meeting dates
+		- index: the identity.IdentityIndex built from the members file
+		- summaries: per-attendee summaries, as returned by operations.get_attendee_summaries
+	  or None if there is no current snapshot
+	"""
+	if not USE_SNAPSHOT:
+		return None
+
+	path = get_snapshot_path()
+	try:
+		mtime = os.stat(path).st_mtime
+	except OSError:
+		return None
+
+	if time.time() - mtime > SNAPSHOT_MAX_AGE:
+		return None
+
+	loaded_mtime, snapshot = _snapshots.get(path, (None, None))
+	if mtime != loaded_mtime:
+		# The file was rewritten (or has not been loaded yet)
+		try:
+			with open(path, "rb") as f:
+				snapshot = pickle.load(f)
+		except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+			return None
+		if snapshot.get("format") != SNAPSHOT_FORMAT:
+			return None
+		_snapshots[path] = (mtime, snapshot)
+
+	if snapshot["members_mtime"] != get_members_mtime():
+		return None
+	return snapshot
+
+def invalidate_snapshot():
+	"""
+	Remove the snapshot, before the database is modified
+	"""
+	try:
+		os.remove(get_snapshot_path())
+	except FileNotFoundError:
+		pass
+
+def write_snapshot():
+	"""
+	Build a snapshot from the members file and the database, and save it
+	"""
+	# Imported here since the identity module imports this one
+	from .identity import IdentityIndex
+	from .minutes_parse_utils import get_members_and_keyholders
+
+	if operations.NO_WRITE_DB:
+		return
+
+	members_mtime = get_members_mtime()
+	meeting_dates = sorted(operations.get_meeting_dates())
+	snapshot = {
+		"format": SNAPSHOT_FORMAT,
+		"members_mtime": members_mtime,
+		"latest_meeting_date": meeting_dates[-1] if meeting_dates else None,
+		"meeting_dates": meeting_dates,
+		"index": IdentityIndex(*get_members_and_keyholders()),
+		"summaries": operations.get_attendee_summaries()
+	}
+
+	# Write to a temporary file first, so a partial snapshot is never loaded
+	path = get_snapshot_path()
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	tmp_path = path + ".tmp"
+	with open(tmp_path, "wb") as f:
+		pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+	os.replace(tmp_path, path)
+	log("Wrote snapshot with " + str(len(meeting_dates)) + " meetings and " + \
+		str(len(snapshot["summaries"])) + " attendee summaries")
+
+def get_latest_meeting_date():
+	"""
+	Get the date of the most recent meeting, from the snapshot if it is current
+	"""
+	snapshot = load_snapshot()
+	if snapshot is None:
+		return operations.get_latest_meeting_date()
+	return snapshot["latest_meeting_date"]
+
+def get_meeting_dates(start_date=None, end_date=None):
+	"""
+	Get the sorted dates of all meetings, from the snapshot if it is current
+
+	start_date: The first date to include, or None for no limit
+	end_date: The last date to include, or None for no limit
+	"""
+	snapshot = load_snapshot()
+	if snapshot is None:
+		options = {}
+		if start_date is not None:
+			options["start_date"] = start_date
+		if end_date is not None:
+			options["end_date"] = end_date
+		return sorted(operations.get_meeting_dates(options))
+
+	meeting_dates = snapshot["meeting_dates"]
+	start = bisect.bisect_left(meeting_dates, start_date) if start_date is not None else 0
+	end = bisect.bisect_right(meeting_dates, end_date) if end_date is not None else len(meeting_dates)
+	return meeting_dates[start:end]
+
+def get_attendee_summaries():
+	"""
+	Get the summaries of every canonical attendee, from the snapshot if it is current
+	"""
+	snapshot = load_snapshot()
+	if snapshot is None:
+		return operations.get_attendee_summaries()
+	return snapshot["summaries"]
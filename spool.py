@@ -0,0 +1,318 @@
+# This file spools parsed attendance to a local append-only file before it is written to the
+# database, so that parsing neither waits on a slow database nor is lost when the database is
+# unavailable.  Each line of the spool is a JSON entry holding the records of one meeting, and is
+# synced to disk before it counts as spooled.  A flusher drains the spool to the database in
+# batches, retrying with backoff, and records how far it has got in an offset file, so a spool
+# left by an interrupted run is drained by the next one.
+
+import os
+import json
+import time
+import datetime
+import threading
+import contextvars
+from . import operations
+from .organizations import get_organization
+from .logging import log
+
+# Path of the spool file
+spool_path = os.path.join(os.path.dirname(__file__), "attendance.spool")
+
+# Number of times a batch is tried before the flusher gives up and leaves it in the spool
+FLUSH_ATTEMPTS = 6
+# Seconds to wait before retrying a batch, doubled after each failure up to the maximum
+FLUSH_BACKOFF = 1
+FLUSH_MAX_BACKOFF = 60
+
+def get_spool_path():
+	"""
+	Get the spool file of the organization being worked on
+	"""
+	organization = get_organization()
+	if organization is not None:
+		return organization.get_state_file("attendance.spool")
+	return spool_path
+
+def encode_entry(date, rows, corrections, ingested_files, replace):
+	"""
+	Encode the records of a meeting as a line of the spool
+
+	date: The date of the meeting
+	rows: The meeting's (meeting_date, attendee, attendee_type, inspection_required) tuples
+	corrections: The meeting's (meeting_date, original, corrected, distance, confidence) tuples
+	ingested_files: The (filename, path, meeting_date, exceptions_fingerprint) tuples of the
+					files the meeting was parsed from
+	replace: True if the records replace any existing records of the meeting
+	"""
+	return (json.dumps({
+		"date": str(date),
+		"rows": [[str(row[0])] + list(row[1:]) for row in rows],
+		"corrections": [[str(correction[0])] + list(correction[1:]) for correction in corrections],
+		"ingested_files": [list(ingested_file[:2]) + [str(ingested_file[2])] + list(ingested_file[3:]) \
+							for ingested_file in ingested_files],
+		"replace": replace
+	}) + "\n").encode("utf-8")
+
+def decode_entry(line):
+	"""
+	Decode a line of the spool, as encoded by encode_entry
+
+	returns: A dictionary containing date, rows, corrections, ingested_files and replace, as
+			 passed to encode_entry
+	"""
+	entry = json.loads(line)
+	entry["date"] = datetime.date.fromisoformat(entry["date"])
+	entry["rows"] = [(entry["date"],) + tuple(row[1:]) for row in entry["rows"]]
+	entry["corrections"] = [(entry["date"],) + tuple(correction[1:]) for correction in entry["corrections"]]
+	entry["ingested_files"] = [tuple(ingested_file[:2]) + (entry["date"],) + tuple(ingested_file[3:]) \
+								for ingested_file in entry["ingested_files"]]
+	return entry
+
+class Spool:
+	"""
+	Append-only spool of parsed attendance waiting to be written to the database
+	"""
+	def __init__(self, path=None):
+		"""
+		Open the spool, keeping any entries left by an earlier run
+
+		path: The spool file, or None for the default
+		"""
+		self.path = path if path is not None else get_spool_path()
+		self.offset_path = self.path + ".offset"
+		# Notified whenever an entry is appended
+		self.condition = threading.Condition()
+
+		os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+		self.file = open(self.path, "ab")
+		self.recover()
+		self.size = os.fstat(self.file.fileno()).st_size
+		# Position up to which entries have been written to the database
+		self.flushed_offset = min(self.read_offset(), self.size)
+		if self.size:
+			log("Found " + str(self.size - self.flushed_offset) + " bytes of spooled attendance left by an earlier run")
+
+	def recover(self):
+		"""
+		Remove an entry which was only partly written when an earlier run stopped
+		"""
+		with open(self.path, "rb") as f:
+			data = f.read()
+		end = data.rfind(b"\n") + 1
+		if end != len(data):
+			self.file.truncate(end)
+			self.sync()
+
+	def sync(self):
+		self.file.flush()
+		os.fsync(self.file.fileno())
+
+	def read_offset(self):
+		try:
+			with open(self.offset_path, "r") as f:
+				return int(f.read().strip() or 0)
+		except (OSError, ValueError):
+			return 0
+
+	def write_offset(self, offset):
+		"""
+		Record that the entries before an offset have been written to the database
+		"""
+		tmp_path = self.offset_path + ".tmp"
+		with open(tmp_path, "w") as f:
+			f.write(str(offset))
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(tmp_path, self.offset_path)
+		self.flushed_offset = offset
+
+	def append(self, date, rows, corrections, ingested_files, replace):
+		"""
+		Durably add the records of a meeting to the spool, as in encode_entry
+		"""
+		line = encode_entry(date, rows, corrections, ingested_files, replace)
+		with self.condition:
+			self.file.write(line)
+			self.sync()
+			self.size += len(line)
+			self.condition.notify_all()
+
+	def read_entries(self, start, end):
+		"""
+		Read the entries between two offsets
+
+		returns: A generator of (entry, offset) tuples, where offset is the end of the entry
+		"""
+		with open(self.path, "rb") as f:
+			f.seek(start)
+			offset = start
+			for line in f.read(end - start).splitlines(keepends=True):
+				offset += len(line)
+				yield decode_entry(line), offset
+
+	def get_spooled_files(self):
+		"""
+		Get the filenames of the minutes files whose meetings are waiting in the spool
+		"""
+		return { ingested_file[0] for entry, offset in self.read_entries(self.flushed_offset, self.size) \
+				for ingested_file in entry["ingested_files"] }
+
+	def skip_spooled(self, files):
+		"""
+		Remove the minutes files whose meetings are waiting in the spool, which need not be parsed again
+
+		files: mapping of directories to filenames in those directories
+		"""
+		spooled = self.get_spooled_files()
+		return { direc: [file for file in files[direc] if file not in spooled] for direc in files }
+
+	def pending(self):
+		"""
+		Check if there are entries which have not been written to the database
+		"""
+		return self.flushed_offset < self.size
+
+	def clear(self):
+		"""
+		Empty the spool, once every entry has been written and summarized
+		"""
+		with self.condition:
+			self.file.truncate(0)
+			self.sync()
+			self.size = 0
+			self.write_offset(0)
+
+	def close(self):
+		self.file.close()
+
+def retry(function, attempts=None, backoff=None):
+	"""
+	Call a function which writes to the database, retrying with exponential backoff (and a new
+	connection) if the database fails
+
+	attempts: The number of times to call the function, or None for FLUSH_ATTEMPTS
+	backoff: Seconds to wait before the first retry, doubling after each, or None for FLUSH_BACKOFF
+
+	returns: The value the function returned
+	"""
+	if attempts is None:
+		attempts = FLUSH_ATTEMPTS
+	if backoff is None:
+		backoff = FLUSH_BACKOFF
+
+	delay = backoff
+	for attempt in range(1, attempts + 1):
+		try:
+			return function()
+		except operations.get_database_errors() as e:
+			if attempt == attempts:
+				raise
+			log("Writing to the database failed (" + str(e) + "), retrying in " + str(delay) + "s")
+			operations.reset_connection()
+			time.sleep(delay)
+			delay = min(delay * 2, FLUSH_MAX_BACKOFF)
+
+class SpoolFlusher:
+	"""
+	Drains a spool to the database in a background thread, as entries are appended
+	"""
+	def __init__(self, spool, chunk_size, on_commit=None):
+		"""
+		spool: The Spool to drain
+		chunk_size: Number of attendance records to write to the database at once; meetings
+					which replace existing records are written one at a time
+		on_commit: Optional function called with the list of entries which have just been
+				   written to the database
+		"""
+		self.spool = spool
+		self.chunk_size = chunk_size
+		self.on_commit = on_commit
+		# Attendees whose records were added or removed, including by entries an earlier run
+		# wrote without getting as far as updating summaries
+		self.affected = { row[1] for entry, offset in spool.read_entries(0, spool.flushed_offset) for row in entry["rows"] }
+		# The error the flusher gave up on, if any
+		self.error = None
+		self.closed = False
+		# The thread works on the same organization as the caller
+		self.thread = threading.Thread(target=contextvars.copy_context().run, args=(self.run,), daemon=True)
+
+	def start(self):
+		self.thread.start()
+
+	def run(self):
+		while True:
+			with self.spool.condition:
+				while not self.spool.pending() and not self.closed:
+					self.spool.condition.wait()
+				if not self.spool.pending():
+					return
+				end = self.spool.size
+			try:
+				self.flush(end)
+			except Exception as e:
+				self.error = e
+				return
+
+	def flush(self, end):
+		"""
+		Write the entries up to an offset to the database, in batches
+		"""
+		batch = []
+		batch_end = None
+		num_records = 0
+		for entry, offset in self.spool.read_entries(self.spool.flushed_offset, end):
+			if entry["replace"]:
+				if batch:
+					self.commit(batch, batch_end)
+					batch = []
+					num_records = 0
+				self.commit([entry], offset)
+				continue
+
+			batch.append(entry)
+			batch_end = offset
+			num_records += len(entry["rows"])
+			if num_records >= self.chunk_size:
+				self.commit(batch, batch_end)
+				batch = []
+				num_records = 0
+		if batch:
+			self.commit(batch, batch_end)
+
+	def commit(self, entries, offset):
+		"""
+		Write entries to the database in a single transaction, and mark them as flushed
+		"""
+		if entries[0]["replace"]:
+			retry(lambda: self.replace_meeting(entries[0]))
+		else:
+			retry(lambda: operations.add_attendance_batch([row for entry in entries for row in entry["rows"]], \
+						[correction for entry in entries for correction in entry["corrections"]], \
+						[ingested_file for entry in entries for ingested_file in entry["ingested_files"]]))
+
+		self.spool.write_offset(offset)
+		num_records = sum(len(entry["rows"]) for entry in entries)
+		log(addto="attendance records added", addval=num_records)
+		self.affected |= { row[1] for entry in entries for row in entry["rows"] }
+		if self.on_commit is not None:
+			self.on_commit(entries)
+
+	def replace_meeting(self, entry):
+		# Attendees of the existing records may be removed
+		date = entry["date"]
+		self.affected |= { record["attendee"] for record in operations.get_attendance_records(fields=["attendee"], \
+							options={"start_date": date, "end_date": date}) }
+		operations.replace_meeting_records(date, entry["rows"], \
+							entry["ingested_files"][0] if entry["ingested_files"] else None, entry["corrections"])
+
+	def finish(self):
+		"""
+		Wait for the spool to be drained
+
+		returns: True if every entry was written, or False if the flusher gave up (see error)
+		"""
+		with self.spool.condition:
+			self.closed = True
+			self.spool.condition.notify_all()
+		self.thread.join()
+		return self.error is None
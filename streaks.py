@@ -0,0 +1,121 @@
+# This file computes attendance streaks: the most consecutive meetings each attendee attended,
+# the meetings they have attended in a row up to the latest meeting, and the most consecutive
+# meetings they missed after first attending.  Streaks are counted in meetings, and are computed
+# for every attendee in one ordered pass over the attendance records.
+
+class StreakCounter:
+	"""
+	Streaks of a single attendee, updated with the positions of the meetings they attended,
+	in order
+	"""
+	__slots__ = ("first", "last", "run_start", "longest", "longest_start", "absence", "absence_start")
+
+	def __init__(self):
+		# Positions of the first and last meetings attended, and the start of the current run
+		self.first = None
+		self.last = None
+		self.run_start = None
+		# Length and start of the longest run of meetings attended
+		self.longest = 0
+		self.longest_start = None
+		# Length and start of the longest run of meetings missed since first attending
+		self.absence = 0
+		self.absence_start = None
+
+	def attend(self, position):
+		"""
+		Record attending the meeting at a position, which is at or after the last one recorded
+		"""
+		if self.last is None:
+			self.first = position
+			self.run_start = position
+		elif position == self.last:
+			# Recorded under several names at the same meeting
+			return
+		elif position > self.last + 1:
+			self.miss(self.last + 1, position - self.last - 1)
+			self.run_start = position
+
+		self.last = position
+		if position - self.run_start + 1 > self.longest:
+			self.longest = position - self.run_start + 1
+			self.longest_start = self.run_start
+
+	def miss(self, start, length):
+		if length > self.absence:
+			self.absence = length
+			self.absence_start = start
+
+	def finish(self, num_meetings):
+		"""
+		Count the meetings missed since the last one attended as an absence
+
+		num_meetings: Number of meetings in total
+		"""
+		if self.last is not None and self.last < num_meetings - 1:
+			self.miss(self.last + 1, num_meetings - 1 - self.last)
+
+	def to_json(self, meeting_dates):
+		"""
+		Get the streaks as a JSON-ready dictionary, with the first and last meeting (as
+		YYYY-MM-DD strings) of the longest streak and longest absence
+		"""
+		def span(start, length):
+			if not length:
+				return None, None
+			return str(meeting_dates[start]), str(meeting_dates[start + length - 1])
+
+		longest_start, longest_end = span(self.longest_start, self.longest)
+		absence_start, absence_end = span(self.absence_start, self.absence)
+		current = self.last - self.run_start + 1 if self.last is not None and self.last == len(meeting_dates) - 1 else 0
+		return {
+			"longest_streak": self.longest,
+			"longest_streak_start": longest_start,
+			"longest_streak_end": longest_end,
+			"current_streak": current,
+			"longest_absence": self.absence,
+			"longest_absence_start": absence_start,
+			"longest_absence_end": absence_end
+		}
+
+def compute_streaks(meeting_dates, records, get_canonical):
+	"""
+	Compute the streaks of every canonical attendee
+
+	meeting_dates: Sorted list of the dates of all meetings
+	records: Iterable of (attendee, meeting_date) tuples, ordered by meeting_date
+	get_canonical: Function mapping an attendee's name to their canonical name
+
+	returns: A dictionary mapping canonical attendees to JSON-ready dictionaries, as returned by
+			 StreakCounter.to_json
+	"""
+	positions = { meeting_date: position for position, meeting_date in enumerate(meeting_dates) }
+	counters = {}
+	for attendee, meeting_date in records:
+		canonical = get_canonical(attendee)
+		counter = counters.get(canonical)
+		if counter is None:
+			counter = counters[canonical] = StreakCounter()
+		counter.attend(positions[meeting_date])
+
+	streaks = {}
+	for canonical, counter in counters.items():
+		counter.finish(len(meeting_dates))
+		streaks[canonical] = counter.to_json(meeting_dates)
+	return streaks
+
+def compute_attendee_streaks(meeting_dates, attended_dates):
+	"""
+	Compute the streaks of a single attendee
+
+	meeting_dates: Sorted list of the dates of all meetings
+	attended_dates: Set of the dates of the meetings the attendee attended
+
+	returns: A JSON-ready dictionary, as returned by StreakCounter.to_json
+	"""
+	counter = StreakCounter()
+	for position, meeting_date in enumerate(meeting_dates):
+		if meeting_date in attended_dates:
+			counter.attend(position)
+	counter.finish(len(meeting_dates))
+	return counter.to_json(meeting_dates)
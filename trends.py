@@ -0,0 +1,127 @@
+# This file computes attendance trends (rolling averages, term-over-term and year-over-year
+# changes) from per-meeting attendance counts.  Every window sum is taken from prefix sums,
+# so each trend is computed in a single pass over the meetings.
+
+import datetime
+
+def prefix_sums(counts):
+	"""
+	Get the prefix sums of a list of counts
+
+	returns: A list sums of length len(counts) + 1, where sums[i] is the total of counts[:i]
+	"""
+	sums = [0]
+	for count in counts:
+		sums.append(sums[-1] + count)
+	return sums
+
+def range_average(sums, start, end):
+	"""
+	Get the average of counts[start:end] from the prefix sums of counts, or None if the range
+	is empty
+	"""
+	if end <= start:
+		return None
+	return (sums[end] - sums[start]) / (end - start)
+
+def rolling_meeting_averages(sums, window):
+	"""
+	Get the average count over the last window meetings (or fewer, at the start) at each meeting
+
+	sums: Prefix sums of the per-meeting counts
+	window: Number of meetings to average over
+	"""
+	return [range_average(sums, max(0, i + 1 - window), i + 1) for i in range(len(sums) - 1)]
+
+def rolling_week_averages(dates, sums, weeks):
+	"""
+	Get the average count per meeting over the last number of weeks at each meeting
+
+	dates: Sorted list of meeting dates
+	sums: Prefix sums of the per-meeting counts
+	weeks: Number of weeks to average over, ending at (and including) each meeting
+	"""
+	averages = []
+	# Index of the first meeting within the window
+	start = 0
+	for i, date in enumerate(dates):
+		window_start = date - datetime.timedelta(weeks=weeks)
+		while dates[start] <= window_start:
+			start += 1
+		averages.append(range_average(sums, start, i + 1))
+	return averages
+
+def get_term_ranges(dates, get_term):
+	"""
+	Group consecutive meetings by term
+
+	dates: Sorted list of meeting dates
+	get_term: Function mapping a date to a term label, or None if the date is outside any term
+
+	returns: A list of (term, start, end) tuples, where dates[start:end] are the term's meetings
+	"""
+	ranges = []
+	for i, date in enumerate(dates):
+		term = get_term(date)
+		if term is None:
+			continue
+		if ranges and ranges[-1][0] == term and ranges[-1][2] == i:
+			ranges[-1] = (term, ranges[-1][1], i + 1)
+		else:
+			ranges.append((term, i, i + 1))
+	return ranges
+
+def compute_trends(dates, counts_by_type, get_term, meeting_window, week_window):
+	"""
+	Compute attendance trends for each attendee type
+
+	dates: Sorted list of meeting dates
+	counts_by_type: Dictionary mapping attendee types to lists of per-meeting counts, in the
+					same order as dates
+	get_term: Function mapping a date to (academic year, term name), or None if the date is
+			  outside any term
+	meeting_window: Number of meetings in the rolling meeting average
+	week_window: Number of weeks in the rolling week average
+
+	returns: A JSON-ready dictionary containing:
+		- dates: the meeting dates
+		- rolling_meetings, rolling_weeks: dictionaries mapping attendee types to rolling
+		  averages at each meeting
+		- terms: a list with the average attendance per meeting of each term, and the change
+		  from the previous term and from the same term in the previous year
+	"""
+	sums_by_type = { attendee_type: prefix_sums(counts_by_type[attendee_type]) for attendee_type in counts_by_type }
+	term_ranges = get_term_ranges(dates, get_term)
+
+	terms = []
+	# Averages of each term seen so far, to look up the same term a year earlier
+	term_averages = {}
+	previous = None
+	for (year, name), start, end in term_ranges:
+		average = { attendee_type: range_average(sums_by_type[attendee_type], start, end) for attendee_type in sums_by_type }
+		last_year = term_averages.get((year - 1, name))
+
+		terms.append({
+			"year": str(year) + "-" + str(year + 1),
+			"term": name,
+			"start_date": str(dates[start]),
+			"end_date": str(dates[end - 1]),
+			"meetings": end - start,
+			"average": average,
+			"delta": { attendee_type: average[attendee_type] - previous[attendee_type] for attendee_type in average } \
+						if previous is not None else None,
+			"year_over_year": { attendee_type: average[attendee_type] - last_year[attendee_type] for attendee_type in average } \
+						if last_year is not None else None
+		})
+
+		term_averages[(year, name)] = average
+		previous = average
+
+	return {
+		"dates": [str(date) for date in dates],
+		"rolling_meetings": { attendee_type: rolling_meeting_averages(sums_by_type[attendee_type], meeting_window) \
+								for attendee_type in sums_by_type },
+		"rolling_weeks": { attendee_type: rolling_week_averages(dates, sums_by_type[attendee_type], week_window) \
+								for attendee_type in sums_by_type },
+		"terms": terms
+	}